@@ -1,10 +1,12 @@
 from beatbox._beatbox import (                       # NOQA
         Client,  IterClient, SoapFaultError, islst,  # really public
+        ElementRecord, RetryPolicy, CompressionPolicy, DmlResults, DmlResult, DmlError, succeeded,
         _tPartnerNS, _tSObjectNS, _envNs, _noAttrs,  # low level for a Python client
         XmlWriter, SoapWriter, SoapEnvelope,         # low level for tests
         )
 
-__all__ = ('Client',  'IterClient', 'SoapFaultError', 'islst')
+__all__ = ('Client',  'IterClient', 'SoapFaultError', 'islst', 'ElementRecord', 'RetryPolicy',
+           'CompressionPolicy', 'DmlResults', 'DmlResult', 'DmlError', 'succeeded')
 
 # global config - probably no reason to change them except in tests
 gzipRequest = True    # are we going to gzip the request ?
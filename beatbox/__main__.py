@@ -0,0 +1,76 @@
+"""Command line tools: python -m beatbox {export,load} ...
+
+The password is read from the environment variable SF_PASSWORD if it is not
+in the arguments. Set SF_SANDBOX to use the sandbox login server.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+import beatbox
+from beatbox.export import Exporter
+from beatbox.load import Loader
+
+
+def login(args):
+    svc = beatbox.Client()
+    if 'SF_SANDBOX' in os.environ:
+        svc.serverUrl = svc.serverUrl.replace('login.', 'test.')
+    svc.login(args.username, args.password or os.environ.get('SF_PASSWORD', ''))
+    return svc
+
+
+def export(args):
+    path = args.output
+    name = path[:-3] if path.endswith('.gz') else path
+    format = 'jsonl' if name.endswith('.jsonl') else 'csv'
+    rows = Exporter(login(args), args.query, path, format=format, compress=path.endswith('.gz')).run()
+    print("exported {} rows to {}".format(rows, path))
+
+
+def load(args):
+    mapping = None
+    if args.map:
+        mapping = dict(x.split('=', 1) for x in args.map)
+    loader = Loader(login(args), args.object, args.operation, args.external_id, mapping,
+                    chunkLength=args.chunk, maxWorkers=args.workers)
+    successes, failures = loader.run(args.input, args.results)
+    print("loaded {} rows, {} failed, results in {}".format(successes, failures, args.results))
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m beatbox', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-u', '--username', required=True)
+    parser.add_argument('-p', '--password')
+    commands = parser.add_subparsers(dest='command')
+
+    p = commands.add_parser('export', help='export a query or all fields of an sObject to a file')
+    p.add_argument('query', help='sObject name or SOQL query')
+    p.add_argument('output', help='file.csv or file.jsonl, optionally with .gz')
+    p.set_defaults(func=export)
+
+    p = commands.add_parser('load', help='create/update/upsert records from a CSV or JSON Lines file')
+    p.add_argument('object', help='sObject type')
+    p.add_argument('input', help='file.csv or file.jsonl')
+    p.add_argument('results', help='CSV file for results of rows')
+    p.add_argument('-o', '--operation', choices=('create', 'update', 'upsert'), default='upsert')
+    p.add_argument('-e', '--external-id', help='external id field for upsert')
+    p.add_argument('-m', '--map', action='append', metavar='COLUMN=FIELD',
+                   help='map a column to a field, only mapped columns are loaded (repeatable)')
+    p.add_argument('-c', '--chunk', type=int, default=200, help='records per call')
+    p.add_argument('-w', '--workers', type=int, default=4, help='concurrent calls')
+    p.set_defaults(func=load)
+
+    args = parser.parse_args(argv)
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        return 2
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,8 +3,17 @@
 # "beatbox" would be problematic.
 from __future__ import print_function
 
+import base64
 import gzip
 import datetime
+import mmap
+import random
+import socket
+import tempfile
+import time
+import zlib
+from array import array
+from collections import namedtuple
 from xml.sax.saxutils import XMLGenerator
 from xml.sax.saxutils import quoteattr
 from xml.sax.xmlreader import AttributesNSImpl
@@ -29,6 +38,8 @@ _noAttrs = AttributesNSImpl({}, {})
 _tPartnerNS = xmltramp.Namespace(_partnerNs)
 _tSObjectNS = xmltramp.Namespace(_sobjectNs)
 _tSoapNS = xmltramp.Namespace(_envNs)
+_xsiType = ('http://www.w3.org/2001/XMLSchema-instance', 'type')
+_xsiNil = ('http://www.w3.org/2001/XMLSchema-instance', 'nil')
 
 
 def makeConnection(scheme, host, timeout=1200):
@@ -38,6 +49,106 @@ def makeConnection(scheme, host, timeout=1200):
     return http_client.HTTPSConnection(host, **kwargs)
 
 
+# operations that can be sent again without side effects
+idempotentOperations = frozenset([
+    'login', 'retrieve', 'query', 'queryAll', 'queryMore', 'search', 'getUpdated', 'getDeleted',
+    'describeSObjects', 'describeGlobal', 'describeLayout', 'describeTabs', 'describeSearchScopeOrder',
+    'describeQuickActions', 'describeAvailableQuickActions', 'getServerTimestamp', 'getUserInfo'])
+
+# operations that return SaveResult, UpsertResult, DeleteResult or UndeleteResult
+dmlOperations = frozenset(['create', 'update', 'upsert', 'delete', 'undelete'])
+
+
+def gzipBytes(data, level=9):
+    """Compress data to the gzip format"""
+    buf = BytesIO()
+    f = gzip.GzipFile(mode='wb', fileobj=buf, compresslevel=level)
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+class RetryPolicy(object):
+    """Retry of requests that failed by a transient network error, with exponential backoff.
+
+    Idempotent operations are retried after any connection error, timeout or HTTP
+    502/503/504. Other operations (DML) are retried only if the request could not be
+    sent, because the server could process it otherwise. The connection is closed after
+    an error and it is reconnected by the next attempt.
+
+    >>> svc.retry = RetryPolicy(maxAttempts=5)  # svc.retry = None disables retries
+    """
+    def __init__(self, maxAttempts=4, initialDelay=0.5, maxDelay=30.0, operations=idempotentOperations):
+        self.maxAttempts = maxAttempts
+        self.initialDelay = initialDelay
+        self.maxDelay = maxDelay
+        self.operations = operations
+
+    def shouldRetry(self, operationName, sent, attempt):
+        """Whether to retry after the failed attempt (1, 2, ...), sent: the request was sent"""
+        return attempt < self.maxAttempts and (not sent or operationName in self.operations)
+
+    def delay(self, attempt):
+        """Seconds to wait after the failed attempt, with jitter"""
+        return min(self.maxDelay, self.initialDelay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+class CompressionPolicy(object):
+    """Compression of requests by gzip for one client, instead of the global beatbox.gzipRequest.
+
+    Requests smaller than `threshold` bytes are sent uncompressed, others are compressed
+    by `level`. In the auto mode the compression time and the compressed size of the
+    levels are measured and the level (or no compression) with the least estimated time
+    of compression and transfer by `bandwidth` bytes/s is used, other levels are tried
+    every `explore` requests. gzipResponse: accept a gzipped response.
+
+    >>> svc.compression = CompressionPolicy(threshold=4096, auto=True)
+    """
+    levels = (0, 1, 6, 9)
+
+    def __init__(self, threshold=2048, level=6, auto=False, bandwidth=5e6, explore=20, gzipResponse=True):
+        self.threshold = threshold
+        self.level = level
+        self.auto = auto
+        self.bandwidth = bandwidth
+        self.explore = explore
+        self.gzipResponse = gzipResponse
+        self.requests = 0
+        # {level: [seconds per byte, compressed size ratio]}, moving averages
+        self.stats = {0: [0.0, 1.0]}
+
+    def compress(self, data):
+        """Returns the tuple (body, True if it is gzipped)"""
+        if len(data) < self.threshold:
+            return data, False
+        level = self.chooseLevel() if self.auto else self.level
+        if not level:
+            return data, False
+        start = time.time()
+        body = gzipBytes(data, level)
+        self.observe(level, len(data), len(body), time.time() - start)
+        return body, True
+
+    def chooseLevel(self):
+        self.requests += 1
+        unknown = [level for level in self.levels if level not in self.stats]
+        if unknown:
+            return unknown[0]
+        if self.requests % self.explore == 0:
+            return self.levels[self.requests // self.explore % len(self.levels)]
+        return min(self.levels, key=self.cost)
+
+    def cost(self, level):
+        """Estimated seconds per byte of data to compress and send it by the level"""
+        (secondsPerByte, ratio) = self.stats[level]
+        return secondsPerByte + ratio / self.bandwidth
+
+    def observe(self, level, size, compressedSize, seconds):
+        sample = [seconds / size, float(compressedSize) / size]
+        old = self.stats.get(level)
+        self.stats[level] = sample if old is None else [0.8 * a + 0.2 * b for a, b in zip(old, sample)]
+
+
 class Client(object):
     """The main sforce client proxy class."""
     def __init__(self):
@@ -46,6 +157,34 @@ class Client(object):
         self.__conn = None
         self.timeout = 15
         self.headers = {}
+        # {limit type: (current, limit)} from LimitInfoHeader of the last response, shared by clones
+        self.limitInfo = {}
+        # optional beatbox.scheduler.RequestScheduler and the priority of requests for it
+        self.scheduler = None
+        self.priority = None
+        # RetryPolicy of requests after transient network errors, None disables retries
+        self.retry = RetryPolicy()
+        # CompressionPolicy of requests, None uses beatbox.gzipRequest and beatbox.gzipResponse
+        self.compression = None
+        # optional beatbox.hedge.HedgingPolicy of idempotent calls
+        self.hedging = None
+        # parse responses to xmltramp.CompactDocument (arrays) instead of a tree of Element objects
+        self.compactXml = False
+        # parse each record of a response by the first access to its fields
+        self.lazyRecords = False
+        # responses bigger than this number of bytes are spooled to a temporary file and parsed
+        # from a memory map of it, None keeps all responses in memory
+        self.spoolThreshold = None
+        # base64 fields streamed to files by parsing {'Type.Field': factory(record element, field name)},
+        # the factory returns a writable file (closed at the end of the field), e.g.
+        # {'Attachment.Body': lambda record, field: open(str(record[_tSObjectNS.Id]), 'wb')}
+        # Calls are not hedged with base64Streams, the factory is called only for one response.
+        self.base64Streams = None
+        # DML calls (dmlOperations) return DmlResults instead of result elements, also for a single
+        # record; IterClient and BufferedWriter futures give its DmlResult items. See succeeded().
+        self.compactResults = False
+        # (request bytes, response bytes) of the last call, uncompressed
+        self.lastCallBytes = (0, 0)
 
     def __del__(self):
         if self.__conn:
@@ -53,7 +192,7 @@ class Client(object):
 
     def login(self, username, password):
         """"Login.  returns the loginResult structure"""
-        lr = LoginRequest(self.serverUrl, username, password).post()
+        lr = LoginRequest(self.serverUrl, username, password).post(retry=self.retry)
         self.useSession(str(lr[_tPartnerNS.sessionId]), str(lr[_tPartnerNS.serverUrl]))
         return lr
 
@@ -66,7 +205,7 @@ class Client(object):
         get API access, for new portals, the users should have API acesss, and can call the rest
         of the API.
         """
-        lr = PortalLoginRequest(self.serverUrl, username, password, orgId, portalId).post()
+        lr = PortalLoginRequest(self.serverUrl, username, password, orgId, portalId).post(retry=self.retry)
         self.useSession(str(lr[_tPartnerNS.sessionId]), str(lr[_tPartnerNS.serverUrl]))
         return lr
 
@@ -85,51 +224,53 @@ class Client(object):
 
         In general its better to not call this and just let the sessions expire on their own.
         """
-        return LogoutRequest(self.__serverUrl, self.sessionId, self.headers).post(self.__conn, True)
+        return self._post(LogoutRequest(self.__serverUrl, self.sessionId, self.headers), True)
 
     def query(self, soql):
         """Set the batchSize property on the Client instance to change the batchsize for query/queryMore."""
-        return QueryRequest(self.__serverUrl, self.sessionId, self.headers, self.batchSize, soql).post(self.__conn)
+        return self._post(QueryRequest(self.__serverUrl, self.sessionId, self.headers, self.batchSize, soql))
 
     def queryAll(self, soql):
         """Query include deleted and archived rows."""
-        return QueryRequest(self.__serverUrl, self.sessionId, self.headers, self.batchSize, soql, "queryAll").post(self.__conn)
+        return self._post(QueryRequest(self.__serverUrl, self.sessionId, self.headers, self.batchSize, soql,
+                                       "queryAll"))
 
     def queryMore(self, queryLocator):
-        return QueryMoreRequest(self.__serverUrl, self.sessionId, self.headers, self.batchSize, queryLocator).post(self.__conn)
+        return self._post(QueryMoreRequest(self.__serverUrl, self.sessionId, self.headers, self.batchSize,
+                                           queryLocator))
 
     def search(self, sosl):
-        return SearchRequest(self.__serverUrl, self.sessionId, self.headers, sosl).post(self.__conn)
+        return self._post(SearchRequest(self.__serverUrl, self.sessionId, self.headers, sosl))
 
     def getUpdated(self, sObjectType, start, end):
-        return GetUpdatedRequest(self.__serverUrl, self.sessionId, self.headers, sObjectType, start, end).post(self.__conn)
+        return self._post(GetUpdatedRequest(self.__serverUrl, self.sessionId, self.headers, sObjectType, start, end))
 
     def getDeleted(self, sObjectType, start, end):
-        return GetDeletedRequest(self.__serverUrl, self.sessionId, self.headers, sObjectType, start, end).post(self.__conn)
+        return self._post(GetDeletedRequest(self.__serverUrl, self.sessionId, self.headers, sObjectType, start, end))
 
     def retrieve(self, fields, sObjectType, ids):
         """ids can be 1 or a list, returns a single save result or a list"""
-        return RetrieveRequest(self.__serverUrl, self.sessionId, self.headers, fields, sObjectType, ids).post(self.__conn)
+        return self._post(RetrieveRequest(self.__serverUrl, self.sessionId, self.headers, fields, sObjectType, ids))
 
     def create(self, sObjects):
         """sObjects can be 1 or a list, returns a single save result or a list"""
-        return CreateRequest(self.__serverUrl, self.sessionId, self.headers, sObjects).post(self.__conn)
+        return self._post(CreateRequest(self.__serverUrl, self.sessionId, self.headers, sObjects))
 
     def update(self, sObjects):
         """sObjects can be 1 or a list, returns a single save result or a list"""
-        return UpdateRequest(self.__serverUrl, self.sessionId, self.headers, sObjects).post(self.__conn)
+        return self._post(UpdateRequest(self.__serverUrl, self.sessionId, self.headers, sObjects))
 
     def upsert(self, externalIdName, sObjects):
         """sObjects can be 1 or a list, returns a single upsert result or a list"""
-        return UpsertRequest(self.__serverUrl, self.sessionId, self.headers, externalIdName, sObjects).post(self.__conn)
+        return self._post(UpsertRequest(self.__serverUrl, self.sessionId, self.headers, externalIdName, sObjects))
 
     def delete(self, ids):
         """ids can be 1 or a list, returns a single delete result or a list"""
-        return DeleteRequest(self.__serverUrl, self.sessionId, self.headers, ids).post(self.__conn)
+        return self._post(DeleteRequest(self.__serverUrl, self.sessionId, self.headers, ids))
 
     def undelete(self, ids):
         """ids can be 1 or a list, returns a single delete result or a list"""
-        return UndeleteRequest(self.__serverUrl, self.sessionId, self.headers, ids).post(self.__conn)
+        return self._post(UndeleteRequest(self.__serverUrl, self.sessionId, self.headers, ids))
 
     def convertLead(self, leadConverts):
         """
@@ -145,47 +286,120 @@ class Client(object):
           <element name="ownerId"                type="tns:ID"     nillable="true"/>
           <element name="sendNotificationEmail"  type="xsd:boolean"/>
         """
-        return ConvertLeadRequest(self.__serverUrl, self.sessionId, self.headers, leadConverts).post(self.__conn)
+        return self._post(ConvertLeadRequest(self.__serverUrl, self.sessionId, self.headers, leadConverts))
 
     def describeSObjects(self, sObjectTypes):
         """sObjectTypes can be 1 or a list, returns a single describe result or a list of them"""
-        return DescribeSObjectsRequest(self.__serverUrl, self.sessionId, self.headers, sObjectTypes).post(self.__conn)
+        return self._post(DescribeSObjectsRequest(self.__serverUrl, self.sessionId, self.headers, sObjectTypes))
 
     def describeGlobal(self):
-        return AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers, "describeGlobal").post(self.__conn)
+        return self._post(AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers, "describeGlobal"))
 
     def describeLayout(self, sObjectType):
-        return DescribeLayoutRequest(self.__serverUrl, self.sessionId, self.headers, sObjectType).post(self.__conn)
+        return self._post(DescribeLayoutRequest(self.__serverUrl, self.sessionId, self.headers, sObjectType))
 
     def describeTabs(self):
-        return AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers, "describeTabs").post(self.__conn, True)
+        return self._post(AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers, "describeTabs"), True)
 
     def describeSearchScopeOrder(self):
-        return AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers, "describeSearchScopeOrder"
-                                    ).post(self.__conn, True)
+        return self._post(AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers,
+                                               "describeSearchScopeOrder"), True)
 
     def describeQuickActions(self, actions):
-        return DescribeQuickActionsRequest(self.__serverUrl, self.sessionId, self.headers, actions).post(self.__conn, True)
+        return self._post(DescribeQuickActionsRequest(self.__serverUrl, self.sessionId, self.headers, actions), True)
 
     def describeAvailableQuickActions(self, parentType=None):
-        return DescribeAvailableQuickActionsRequest(self.__serverUrl, self.sessionId, self.headers, parentType
-                                                    ).post(self.__conn, True)
+        return self._post(DescribeAvailableQuickActionsRequest(self.__serverUrl, self.sessionId, self.headers,
+                                                               parentType), True)
 
     def performQuickActions(self, actions):
-        return PerformQuickActionsRequest(self.__serverUrl, self.sessionId, self.headers, actions).post(self.__conn, True)
+        return self._post(PerformQuickActionsRequest(self.__serverUrl, self.sessionId, self.headers, actions), True)
 
     def getServerTimestamp(self):
-        return str(AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers, "getServerTimestamp"
-                                        ).post(self.__conn)[_tPartnerNS.timestamp])
+        return str(self._post(AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers,
+                                                   "getServerTimestamp"))[_tPartnerNS.timestamp])
 
     def resetPassword(self, userId):
-        return ResetPasswordRequest(self.__serverUrl, self.sessionId, self.headers, userId).post(self.__conn)
+        return self._post(ResetPasswordRequest(self.__serverUrl, self.sessionId, self.headers, userId))
 
     def setPassword(self, userId, password):
-        SetPasswordRequest(self.__serverUrl, self.sessionId, self.headers, userId, password).post(self.__conn)
+        self._post(SetPasswordRequest(self.__serverUrl, self.sessionId, self.headers, userId, password))
 
     def getUserInfo(self):
-        return AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers, "getUserInfo").post(self.__conn)
+        return self._post(AuthenticatedRequest(self.__serverUrl, self.sessionId, self.headers, "getUserInfo"))
+
+    def apiUsage(self):
+        """The tuple (current, limit) of API REQUESTS by the last response or None if not known"""
+        return self.limitInfo.get('API REQUESTS')
+
+    def _post(self, request, alwaysReturnList=False):
+        """Send the request by the connection of the client and process the response headers"""
+        request.compression = self.compression
+        request.compactXml = self.compactXml
+        request.lazyRecords = self.lazyRecords
+        request.spoolThreshold = self.spoolThreshold
+        request.base64Streams = self.base64Streams
+        request.compactResults = self.compactResults
+        if self.scheduler is None:
+            (result, request) = self._send(request, alwaysReturnList)
+        else:
+            try:
+                with self.scheduler.slot(self.priority):
+                    (result, request) = self._send(request, alwaysReturnList)
+            except SoapFaultError as exc:
+                self.faultReceived(exc)
+                raise
+        self._processHeaders(request.responseHeaders)
+        self.lastCallBytes = (request.requestBytes, request.responseBytes)
+        return result
+
+    def _send(self, request, alwaysReturnList):
+        """Post the request, hedged if the policy applies, returns (result, the request that answered)"""
+        # both responses of a hedged call would be parsed, also to the files of base64Streams
+        if (self.hedging is not None and not self.base64Streams and
+                request.operationName in self.hedging.operations):
+            (result, request, self.__conn) = self.hedging.post(request, self.__conn, alwaysReturnList, self.retry,
+                                                               self.scheduler, self.priority)
+            return result, request
+        return request.post(self.__conn, alwaysReturnList, self.retry), request
+
+    def _processHeaders(self, responseHeaders):
+        self.updateLimitInfo(limitInfoFromHeaders(responseHeaders))
+
+    def updateLimitInfo(self, limits):
+        """Update limitInfo by {type: (current, limit)}, also for the scheduler"""
+        if limits:
+            # updated in place, because the dict is shared by clones
+            self.limitInfo.update(limits)
+            if self.scheduler is not None and 'API REQUESTS' in self.limitInfo:
+                self.scheduler.observe(*self.limitInfo['API REQUESTS'])
+
+    def faultReceived(self, exc):
+        """Hook for a SoapFaultError of a response, also of a raw response parsed elsewhere"""
+        if exc.faultCode == 'REQUEST_LIMIT_EXCEEDED' and self.scheduler is not None:
+            self.scheduler.limitExceeded()
+
+    def _postRaw(self, request):
+        """Send the request without parsing, returns the raw response (bytes, True if gzipped)
+
+        The parser of the response should call updateLimitInfo and faultReceived.
+        The response is not decoded, compactXml, lazyRecords and compactResults do not apply.
+        """
+        request.raw = True
+        return self._post(request)
+
+    def queryRaw(self, soql, queryAll=False):
+        """query (or queryAll) that returns the raw response (bytes, True if gzipped) to be parsed elsewhere
+
+        see beatbox.procparse
+        """
+        return self._postRaw(QueryRequest(self.__serverUrl, self.sessionId, self.headers, self.batchSize, soql,
+                                          "queryAll" if queryAll else "query"))
+
+    def queryMoreRaw(self, queryLocator):
+        """queryMore that returns the raw response (bytes, True if gzipped)"""
+        return self._postRaw(QueryMoreRequest(self.__serverUrl, self.sessionId, self.headers, self.batchSize,
+                                              queryLocator))
 
     @property
     def iterclient(self):
@@ -194,93 +408,416 @@ class Client(object):
         vars(client).update(vars(self))
         return client
 
+    def clone(self):
+        """Copy of the client with the same session, but with its own connection.
+
+        One http connection can not be used by more threads, use one clone per thread.
+        """
+        client = self.__class__()
+        vars(client).update(vars(self))
+        if self.__conn:
+            (scheme, host, path, params, query, frag) = urlparse(self.__serverUrl)
+            client.__conn = makeConnection(scheme, host)
+        return client
+
 
 class IterClient(Client):
 
     def __init__(self):
         super(IterClient, self).__init__()
+        # Limit of the estimated serialized size of one chunk (uncompressed), None is unlimited.
+        self.maxChunkBytes = None
+        # Optional beatbox.autotune.BatchTuner of query batch size and chunk size
+        self.tuner = None
 
-    def gatherRecords(self, queryHandle):
-        while 1:
-            for elem in queryHandle[_tPartnerNS.records:]:
-                yield elem
-            if str(queryHandle[_tPartnerNS.done]) == 'true':
-                break
-            else:
-                queryHandle = self.queryMore(queryHandle.queryLocator)
+    def gatherRecords(self, queryHandle, nested=True, maxWorkers=1, sObjectType=None):
+        """Yield records of the query result and of the next results by queryMore
 
-    def chunkRequests(self, collection, chunkLength=None):
-        if not islst(collection):
-            yield [collection]
+        If nested, the incomplete child relationship results (subqueries) are completed
+        by queryMore before the parent record is yielded, in parallel if maxWorkers > 1.
+        The batch size of queryMore is tuned for sObjectType if the tuner is used.
+        """
+        pool = None
+        if nested and maxWorkers > 1:
+            from beatbox.pool import ClientPool
+            pool = ClientPool(self, maxWorkers)
+        try:
+            while 1:
+                records = queryHandle[_tPartnerNS.records:]
+                if nested:
+                    self.completeChildRecords(records, pool)
+                for elem in records:
+                    yield elem
+                if str(queryHandle[_tPartnerNS.done]) == 'true':
+                    break
+                else:
+                    queryHandle = self._tunedQuery(self.queryMore, str(queryHandle.queryLocator), sObjectType)
+        finally:
+            if pool:
+                pool.shutdown()
+
+    def completeChildRecords(self, records, pool=None):
+        """Load all records of incomplete child query results in records, optionally on a ClientPool"""
+        children = []
+        for record in records:
+            # neither a lazy record without a child query result is parsed nor _dir of a compact one is built
+            if isinstance(record, xmltramp.LazyElement) and not record._mayContain(b'QueryResult'):
+                continue
+            for child in record:
+                if (isinstance(child, xmltramp.Element) and
+                        child._attrs.get(_xsiType) == 'QueryResult' and
+                        str(child[_tPartnerNS.done]) == 'false'):
+                    children.append(child)
+        if pool is None:
+            for child in children:
+                _completeQueryResult(self, child)
         else:
-            if chunkLength is None:
-                chunkLength = self.batchSize
-            for i in xrange(0, len(collection), chunkLength):
-                yield collection[i:i + chunkLength]
+            list(pool.map(_completeQueryResult, children))
 
-    def query(self, soql):
-        return self.gatherRecords(super(IterClient, self).query(soql))
+    def chunkRequests(self, collection, chunkLength=None, maxBytes=None, tuneKey=None):
+        """Split the collection to chunks of max chunkLength items and max maxBytes serialized size
 
-    def queryAll(self, soql):
-        return self.gatherRecords(super(IterClient, self).queryAll(soql))
+        A chunk has at least one item, even if the item is bigger than maxBytes.
+        Without chunkLength the length of every chunk is given by the tuner for tuneKey, if used.
+        """
+        if not islst(collection):
+            yield [collection]
+            return
+        tuned = chunkLength is None and self.tuner is not None and tuneKey is not None
+        if chunkLength is None:
+            chunkLength = self.batchSize
+        if maxBytes is None:
+            maxBytes = self.maxChunkBytes
+        length = self.tuner.size(tuneKey) if tuned else chunkLength
+        if maxBytes is None:
+            i = 0
+            while i < len(collection):
+                yield collection[i:i + length]
+                i += length
+                if tuned:
+                    length = self.tuner.size(tuneKey)
+            return
+        chunk = []
+        size = 0
+        for item in collection:
+            itemSize = serializedSize(item)
+            if chunk and (len(chunk) >= length or size + itemSize > maxBytes):
+                yield chunk
+                chunk = []
+                size = 0
+                if tuned:
+                    length = self.tuner.size(tuneKey)
+            chunk.append(item)
+            size += itemSize
+        if chunk:
+            yield chunk
+
+    def query(self, soql, nested=True, maxWorkers=1):
+        """Yield records of the query, nested and maxWorkers see gatherRecords"""
+        sObjectType = _soqlObject(soql) if self.tuner else None
+        return self.gatherRecords(self._tunedQuery(super(IterClient, self).query, soql, sObjectType),
+                                  nested, maxWorkers, sObjectType)
+
+    def queryAll(self, soql, nested=True, maxWorkers=1):
+        sObjectType = _soqlObject(soql) if self.tuner else None
+        return self.gatherRecords(self._tunedQuery(super(IterClient, self).queryAll, soql, sObjectType),
+                                  nested, maxWorkers, sObjectType)
+
+    def _tunedQuery(self, method, arg, sObjectType):
+        """Call query, queryAll or queryMore with the batchSize tuned for the sObject type"""
+        if self.tuner is None or sObjectType is None:
+            return method(arg)
+        key = ('query', sObjectType)
+        (batchSize, self.batchSize) = (self.batchSize, self.tuner.size(key))
+        start = time.time()
+        try:
+            result = method(arg)
+        finally:
+            (size, self.batchSize) = (self.batchSize, batchSize)
+        records = len(result[_tPartnerNS.records:])
+        # the last page is usually incomplete, it does not measure the batch size
+        if records >= size or str(result[_tPartnerNS.done]) != 'true':
+            self.tuner.observe(key, size, records, time.time() - start, self.lastCallBytes[1])
+        return result
+
+    def _tuneKey(self, operation, sObjects):
+        return (operation, _sObjectType(sObjects)) if self.tuner is not None else None
+
+    def _sendChunk(self, key, method, chunk, *args):
+        """Call the Client method with args and the chunk, returns a list of results"""
+        start = time.time()
+        responses = method(*(args + (chunk,)))
+        if len(chunk) == 1 and not isinstance(responses, DmlResults):
+            responses = [responses]
+        if key is not None and self.tuner is not None:
+            self.tuner.observe(key, len(chunk), len(chunk), time.time() - start, self.lastCallBytes[0])
+        return responses
+
+    def queryPartitioned(self, soql, partitions=8, maxWorkers=4, field='Id', queryAll=False):
+        """Query in parallel by ranges of Id or of a datetime field, records are unordered
+
+        see beatbox.partition.queryPartitioned
+        """
+        from beatbox.partition import queryPartitioned
+        return queryPartitioned(self, soql, partitions, maxWorkers, field, queryAll=queryAll)
 
     def retrieve(self, fields, sObjectType, ids, chunkLength=None):
         """ids can be 1 or a list, returns a single save result or a list"""
-        for chunk in self.chunkRequests(ids, chunkLength=chunkLength):
-            if len(chunk) == 1:
-                responses = [super(IterClient, self).retrieve(fields, sObjectType, chunk)]
-            else:
-                responses = super(IterClient, self).retrieve(fields, sObjectType, chunk)
+        key = ('retrieve', sObjectType)
+        for chunk in self.chunkRequests(ids, chunkLength=chunkLength, tuneKey=key):
+            responses = self._sendChunk(key, super(IterClient, self).retrieve, chunk, fields, sObjectType)
             for response in responses:
                 yield response
 
     def create(self, sObjects, chunkLength=None):
-        for chunk in self.chunkRequests(sObjects, chunkLength=chunkLength):
-            if len(chunk) == 1:
-                responses = [super(IterClient, self).create(chunk)]
-            else:
-                responses = super(IterClient, self).create(chunk)
+        key = self._tuneKey('create', sObjects)
+        for chunk in self.chunkRequests(sObjects, chunkLength=chunkLength, tuneKey=key):
+            responses = self._sendChunk(key, super(IterClient, self).create, chunk)
             for response in responses:
                 yield response
 
-    def update(self, sObjects, chunkLength=None):
-        for chunk in self.chunkRequests(sObjects, chunkLength=chunkLength):
-            if len(chunk) == 1:
-                responses = [super(IterClient, self).update(chunk)]
-            else:
-                responses = super(IterClient, self).update(chunk)
+    def update(self, sObjects, chunkLength=None, snapshots=None, coalesce=False):
+        """If snapshots (beatbox.snapshot.Snapshots) are used, only changed fields are sent
+
+        and None is yielded instead of the save result for records without changes.
+        With coalesce the versions of a record with the same Id are merged into one record
+        (see beatbox.writer.mergeRecords), the result of the merged record is yielded for each.
+        """
+        if coalesce and islst(sObjects):
+            from beatbox.writer import coalescedResults, coalesceRecords
+            (merged, indexes) = coalesceRecords(sObjects)
+            for response in coalescedResults(self.update(merged, chunkLength, snapshots), indexes):
+                yield response
+            return
+        if snapshots is not None:
+            if not islst(sObjects):
+                sObjects = [sObjects]
+            changes = [snapshots.changes(o) for o in sObjects]
+            responses = self.update([x for x in changes if x is not None], chunkLength=chunkLength)
+            for change in changes:
+                if change is None:
+                    yield None
+                else:
+                    response = next(responses)
+                    if succeeded(response):
+                        snapshots.remember(change)
+                    yield response
+            return
+        key = self._tuneKey('update', sObjects)
+        for chunk in self.chunkRequests(sObjects, chunkLength=chunkLength, tuneKey=key):
+            responses = self._sendChunk(key, super(IterClient, self).update, chunk)
             for response in responses:
                 yield response
 
-    def upsert(self, externalIdName, sObjects, chunkLength=None):
-        for chunk in self.chunkRequests(sObjects, chunkLength=chunkLength):
-            if len(chunk) == 1:
-                responses = [super(IterClient, self).upsert(externalIdName, chunk)]
-            else:
-                responses = super(IterClient, self).upsert(externalIdName, chunk)
-
+    def upsert(self, externalIdName, sObjects, chunkLength=None, coalesce=False):
+        """With coalesce the versions of a record with the same external id are merged like by update"""
+        if coalesce and islst(sObjects):
+            from beatbox.writer import coalescedResults, coalesceRecords
+            (merged, indexes) = coalesceRecords(sObjects, externalIdName)
+            for response in coalescedResults(self.upsert(externalIdName, merged, chunkLength), indexes):
+                yield response
+            return
+        key = self._tuneKey('upsert', sObjects)
+        for chunk in self.chunkRequests(sObjects, chunkLength=chunkLength, tuneKey=key):
+            responses = self._sendChunk(key, super(IterClient, self).upsert, chunk, externalIdName)
             for response in responses:
                 yield response
 
     def delete(self, ids, chunkLength=None):
-        for chunk in self.chunkRequests(ids, chunkLength=chunkLength):
-            if len(chunk) == 1:
-                responses = [super(IterClient, self).delete(chunk)]
-            else:
-                responses = super(IterClient, self).delete(chunk)
+        key = self._tuneKey('delete', ids)
+        for chunk in self.chunkRequests(ids, chunkLength=chunkLength, tuneKey=key):
+            responses = self._sendChunk(key, super(IterClient, self).delete, chunk)
             for response in responses:
                 yield response
 
     def undelete(self, ids, chunkLength=None):
-        for chunk in self.chunkRequests(ids, chunkLength=chunkLength):
-            if len(chunk) == 1:
-                responses = [super(IterClient, self).undelete(chunk)]
-            else:
-                responses = super(IterClient, self).undelete(chunk)
+        key = self._tuneKey('undelete', ids)
+        for chunk in self.chunkRequests(ids, chunkLength=chunkLength, tuneKey=key):
+            responses = self._sendChunk(key, super(IterClient, self).undelete, chunk)
             for response in responses:
                 yield response
 
 
+class ElementRecord(object):
+    """A queried record (xmltramp Element) with optional changed fields for create/update/upsert
+
+    The fields are serialized directly from the parsed tree without conversion to a dict.
+    Only type and Id of the element are sent by default, because a query returns also
+    read-only fields (CreatedDate, formulas...). `fields` is a list of other writable
+    fields to send from the element, or True for all fields. Nil fields, relationship
+    records and subqueries of the element are omitted. A field of overrides replaces
+    the field of the element (case insensitive) or it is added, the value None adds it
+    to fieldsToNull. A plain Element is sent like ElementRecord(element), only its type and Id.
+
+    >>> svc.update([ElementRecord(rec, {'Status': 'Completed'}) for rec in svc.query(soql)])
+    >>> svc.create([ElementRecord(rec, fields=['Subject', 'WhoId']) for rec in svc.query(soql)])
+    """
+    def __init__(self, element, overrides=None, fields=None):
+        self.element = element
+        self.overrides = overrides or {}
+        self.fields = fields
+
+    def items(self):
+        """Yield (field name, value) in the order of the element (type first), fieldsToNull last"""
+        overrides = dict((fn.lower(), (fn, value)) for fn, value in self.overrides.items())
+        nulls = [fn for fn, value in self.overrides.items() if value is None]
+        if 'fieldstonull' in overrides:
+            nullFields = overrides.pop('fieldstonull')[1]
+            nulls.extend(nullFields if islst(nullFields) else [nullFields])
+        if self.fields is True:
+            included = None
+        else:
+            included = set(fn.lower() for fn in (self.fields or ())) | set(['type', 'id'])
+        seen = set()
+        for child in self.element._dir:
+            if not isinstance(child, xmltramp.Element):
+                continue
+            name = child._name[1] if islst(child._name) else child._name
+            key = name.lower()
+            # Id is repeated in query results if it is selected
+            if key in seen or any(isinstance(x, xmltramp.Element) for x in child._dir):
+                continue
+            seen.add(key)
+            if key in overrides:
+                (fn, value) = overrides.pop(key)
+                if value is not None:
+                    yield fn, value
+            elif child._attrs.get(_xsiNil) != 'true' and (included is None or key in included):
+                yield name, u''.join(child._dir)
+        for fn, value in overrides.values():
+            if value is not None:
+                yield fn, value
+        if nulls:
+            yield 'fieldsToNull', nulls
+
+
+DmlResult = namedtuple('DmlResult', 'id success created errors')
+DmlError = namedtuple('DmlError', 'statusCode message fields')
+
+
+class DmlResults(object):
+    """Results of create/update/upsert/delete/undelete decoded to parallel arrays
+
+    Returned by DML calls of a client with compactResults = True, also for a single
+    record, IterClient yields its items. Items are DmlResult(id, success, created, errors) tuples: success is
+    bool, created is bool (upsert) or None, errors is a tuple of DmlError(statusCode,
+    message, fields). The errors are kept only for failed items.
+
+    >>> results = DmlResults()
+    >>> for chunk in chunks:
+    ...     results.extend(svc.create(chunk))
+    >>> results.errorCounts()
+    {'REQUIRED_FIELD_MISSING': 12}
+    """
+    def __init__(self):
+        self.ids = []
+        self.success = array('b')
+        self.created = array('b')  # 1, 0 or -1 if not known
+        self.errors = {}           # {index: tuple of DmlError}
+
+    def append(self, id, success, created=None, errors=()):
+        if errors:
+            self.errors[len(self.ids)] = tuple(errors)
+        self.ids.append(id)
+        self.success.append(1 if success else 0)
+        self.created.append(-1 if created is None else 1 if created else 0)
+
+    def extend(self, other):
+        """Append results of another DmlResults (or of an iterable of DmlResult)"""
+        if not isinstance(other, DmlResults):
+            for result in other:
+                self.append(*result)
+            return
+        offset = len(self.ids)
+        self.ids.extend(other.ids)
+        self.success.extend(other.success)
+        self.created.extend(other.created)
+        for index, errors in other.errors.items():
+            self.errors[offset + index] = errors
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.ids)
+        created = self.created[index]
+        return DmlResult(self.ids[index], bool(self.success[index]), None if created < 0 else bool(created),
+                         self.errors.get(index, ()))
+
+    def __iter__(self):
+        for index in xrange(len(self.ids)):
+            yield self[index]
+
+    def failed(self):
+        """Indexes of failed items"""
+        return [index for index, success in enumerate(self.success) if not success]
+
+    def succeeded(self):
+        """Indexes of successful items"""
+        return [index for index, success in enumerate(self.success) if success]
+
+    def errorCounts(self):
+        """{statusCode: number of failed items with the error}"""
+        counts = {}
+        for errors in self.errors.values():
+            for statusCode in set(error.statusCode for error in errors):
+                counts[statusCode] = counts.get(statusCode, 0) + 1
+        return counts
+
+    def errorsByCode(self):
+        """{statusCode: [indexes of failed items with the error]}"""
+        indexes = {}
+        for index in sorted(self.errors):
+            for statusCode in set(error.statusCode for error in self.errors[index]):
+                indexes.setdefault(statusCode, []).append(index)
+        return indexes
+
+
+def succeeded(result):
+    """True if the save or delete result (element or DmlResult) is a success"""
+    if isinstance(result, DmlResult):
+        return result.success
+    return str(result[_tPartnerNS.success]) == 'true'
+
+
+def limitInfoFromHeaders(responseHeaders):
+    """Dict {type: (current, limit)} from LimitInfoHeader in response headers {name: element}"""
+    limits = {}
+    limitInfoHeader = responseHeaders.get('LimitInfoHeader')
+    if limitInfoHeader is not None:
+        for limit in limitInfoHeader[_tPartnerNS.limitInfo:]:
+            limits[str(limit[_tPartnerNS.type])] = (int(str(limit[_tPartnerNS.current])),
+                                                    int(str(limit[_tPartnerNS.limit])))
+    return limits
+
+
+def _sObjectType(sObjects):
+    """The sObject type of the first record (dict, Element, ElementRecord) or the key prefix of an Id"""
+    o = sObjects[0] if islst(sObjects) and sObjects else sObjects
+    if isinstance(o, ElementRecord):
+        o = o.element
+    if isinstance(o, dict):
+        return o.get('type')
+    if isinstance(o, xmltramp.Element):
+        return str(o[_tSObjectNS.type])
+    return str(o)[:3]
+
+
+def _soqlObject(soql):
+    from beatbox.partition import splitSoql
+    return splitSoql(soql)[1].split()[1]
+
+
+def _completeQueryResult(client, queryResult):
+    """Append records from queryMore to a query result element until it is done"""
+    qr = queryResult
+    while str(qr[_tPartnerNS.done]) != 'true':
+        qr = client.queryMore(str(qr[_tPartnerNS.queryLocator]))
+        queryResult._dir.extend(qr[_tPartnerNS.records:])
+    queryResult[_tPartnerNS.done] = 'true'
+
+
 # === End of public interface ===
 
 # (everything below is private, even without leading underscore)
@@ -313,6 +850,69 @@ class BeatBoxXmlGenerator(XMLGenerator):
         self._write(text_type('>'))
 
 
+def valueToString(s):
+    """Convert a Python value to the text written to xml, a file object is written by XmlWriter in base64"""
+    if isinstance(s, datetime.datetime):
+        # todo, timezones
+        s = s.isoformat()
+    elif isinstance(s, datetime.date):
+        # todo, try isoformat
+        s = "%04d-%02d-%02d" % (s.year, s.month, s.day)
+    elif isinstance(s, int):
+        s = str(s)
+    elif isinstance(s, float):
+        s = str(s)
+    return s
+
+
+def serializedSize(item):
+    """Estimated size of an sObject (dict, Element, ElementRecord) or an id in the request in bytes"""
+    if not isinstance(item, (dict, xmltramp.Element, ElementRecord)):
+        # the value and a tag like <p:ids></p:ids>
+        return len(valueToString(item).encode('utf-8')) + 16
+    if isinstance(item, dict):
+        files = [name for name, value in item.items() if hasattr(value, 'read')]
+        if files:
+            # files are not read, their base64 size is computed and a tag like <o:Body></o:Body> is added
+            rest = dict((name, value) for name, value in item.items() if name not in files)
+            return serializedSize(rest) + sum(_base64Size(item[name]) + 2 * len(name) + 9 for name in files)
+    return len(_sObjectsDocument(item)) - _emptySize
+
+
+def _base64Size(fileobj):
+    start = fileobj.tell()
+    fileobj.seek(0, 2)
+    size = fileobj.tell() - start
+    fileobj.seek(start)
+    return (size + 2) // 3 * 4
+
+
+def _sObjectsDocument(sObject):
+    w = XmlWriter(False)
+    w.startPrefixMapping("p", _partnerNs)
+    w.startPrefixMapping("o", _sobjectNs)
+    w.startElement(_partnerNs, "request")
+    if sObject is not None:
+        _sizeRequest.writeSObjects(w, sObject)
+    w.endElement()
+    return w.endDocument()
+
+
+# bytes of a file encoded at once, a multiple of 3 to not pad the base64 of a chunk
+_base64Chunk = 3 * 65536
+
+
+class _CountingStream(object):
+    """Writable stream that counts the bytes written through it to the stream"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return self.stream.write(data)
+
+
 class XmlWriter(object):
     """General purpose xml writer, does a bunch of useful stuff above & beyond XmlGenerator."""
     def __init__(self, doGzip):
@@ -323,7 +923,9 @@ class XmlWriter(object):
         else:
             stm = self.__buf
             self.__gzip = None
-        self.xg = BeatBoxXmlGenerator(stm, "utf-8")
+        # the size of the document is counted before compression
+        self.__counter = _CountingStream(stm)
+        self.xg = BeatBoxXmlGenerator(self.__counter, "utf-8")
         self.xg.startDocument()
         self.__elems = []
 
@@ -353,18 +955,22 @@ class XmlWriter(object):
         del self.__elems[-1]
 
     def characters(self, s):
-        # todo base64 ?
-        if isinstance(s, datetime.datetime):
-            # todo, timezones
-            s = s.isoformat()
-        elif isinstance(s, datetime.date):
-            # todo, try isoformat
-            s = "%04d-%02d-%02d" % (s.year, s.month, s.day)
-        elif isinstance(s, int):
-            s = str(s)
-        elif isinstance(s, float):
-            s = str(s)
-        self.xg.characters(s)
+        if hasattr(s, 'read'):
+            self.writeBase64(s)
+        else:
+            self.xg.characters(valueToString(s))
+
+    def writeBase64(self, fileobj):
+        """Write the content of a binary file from its current position in base64 by chunks
+
+        The position is restored, because the request can be serialized again.
+        """
+        start = fileobj.tell()
+        chunk = fileobj.read(_base64Chunk)
+        while chunk:
+            self.xg.characters(base64.b64encode(chunk).decode('ascii'))
+            chunk = fileobj.read(_base64Chunk)
+        fileobj.seek(start)
 
     def endDocument(self):
         self.xg.endDocument()
@@ -372,6 +978,11 @@ class XmlWriter(object):
             self.__gzip.close()
         return self.__buf.getvalue()
 
+    @property
+    def size(self):
+        """Number of bytes of the document written so far, uncompressed"""
+        return self.__counter.size
+
 
 class SoapFaultError(Exception):
     """Exception class for soap faults."""
@@ -387,8 +998,8 @@ class SoapWriter(XmlWriter):
     """SOAP specific stuff ontop of XmlWriter."""
     __xsiNs = "http://www.w3.org/2001/XMLSchema-instance"
 
-    def __init__(self):
-        XmlWriter.__init__(self, beatbox.gzipRequest)
+    def __init__(self, doGzip=None):
+        XmlWriter.__init__(self, beatbox.gzipRequest if doGzip is None else doGzip)
         self.startPrefixMapping("s", _envNs)
         self.startPrefixMapping("p", _partnerNs)
         self.startPrefixMapping("o", _sobjectNs)
@@ -415,6 +1026,21 @@ class SoapWriter(XmlWriter):
 
 class SoapEnvelope(object):
     """Processing for a single soap request / response."""
+    # CompressionPolicy, None uses beatbox.gzipRequest and beatbox.gzipResponse
+    compression = None
+    # parse the response by xmltramp.parse(compact=True)
+    compactXml = False
+    # parse the records of the response by xmltramp.parse(lazy='records')
+    lazyRecords = False
+    # the response is spooled to a temporary file if bigger, None for no spooling
+    spoolThreshold = None
+    # {'Type.Field': factory} of base64 fields written to files by parsing
+    base64Streams = None
+    # results of dmlOperations are decoded to DmlResults
+    compactResults = False
+    # post returns the raw response (bytes, True if gzipped) unparsed and not spooled
+    raw = False
+
     def __init__(self, serverUrl, operationName, clientId="BeatBox/" + __version__):
         self.serverUrl = serverUrl
         self.operationName = operationName
@@ -426,8 +1052,9 @@ class SoapEnvelope(object):
     def writeBody(self, writer):
         pass
 
-    def makeEnvelope(self):
-        s = SoapWriter()
+    def makeEnvelope(self, doGzip=None):
+        """Serialize the request, requestBytes is set to its size before compression"""
+        s = SoapWriter(doGzip)
         s.startElement(_envNs, "Header")
         s.characters("\n")
         s.startElement(_partnerNs, "CallOptions")
@@ -442,49 +1069,95 @@ class SoapEnvelope(object):
         self.writeBody(s)
         s.endElement()  # operation
         s.endElement()  # body
-        return s.endDocument()
+        rawRequest = s.endDocument()
+        self.requestBytes = s.size
+        return rawRequest
 
-    def post(self, conn=None, alwaysReturnList=False):
-        """Complete the envelope and send the request
+    def send(self, conn=None, retry=None):
+        """Serialize and send the request, returns the raw response (bytes, True if gzipped)
 
-        does all the grunt work,
-          serializes the request,
-          makes a http request,
-          passes the response to tramp
-          checks for soap fault
-          todo: check for mU='1' headers
-          returns the relevant result from the body child
+        The raw response is a temporary file if it is bigger than spoolThreshold.
         """
         headers = {"User-Agent": "BeatBox/" + __version__,
                    "SOAPAction": '""',
                    "Content-Type": "text/xml; charset=utf-8"}
-        if beatbox.gzipResponse:
+        compression = self.compression
+        if beatbox.gzipResponse if compression is None else compression.gzipResponse:
             headers['accept-encoding'] = 'gzip'
-        if beatbox. gzipRequest:
+        # makeEnvelope measures requestBytes before compression
+        if compression is None:
+            compressed = beatbox.gzipRequest
+            rawRequest = self.makeEnvelope(compressed)
+        else:
+            (rawRequest, compressed) = compression.compress(self.makeEnvelope(False))
+        if compressed:
             headers['content-encoding'] = 'gzip'
         close = False
         (scheme, host, path, params, query, frag) = urlparse(self.serverUrl)
         if conn is None:
             conn = makeConnection(scheme, host)
             close = True
-        rawRequest = self.makeEnvelope()
         # print(rawRequest)
-        conn.request("POST", self.serverUrl, rawRequest, headers)
-        response = conn.getresponse()
-        rawResponse = response.read()
-        if response.getheader('content-encoding', '') == 'gzip':
-            rawResponse = gzip.GzipFile(fileobj=BytesIO(rawResponse)).read()
+        attempt = 0
+        while True:
+            sent = False
+            try:
+                conn.request("POST", self.serverUrl, rawRequest, headers)
+                sent = True
+                response = conn.getresponse()
+                rawResponse = readResponse(response, None if self.raw else self.spoolThreshold)
+                if response.status in (502, 503, 504):
+                    if not isinstance(rawResponse, bytes):
+                        rawResponse.close()
+                    raise http_client.HTTPException("HTTP {} {}".format(response.status, response.reason))
+                break
+            except (http_client.HTTPException, socket.error):
+                # http_client reconnects a closed connection by the next request
+                conn.close()
+                attempt += 1
+                if retry is None or not retry.shouldRetry(self.operationName, sent, attempt):
+                    raise
+                time.sleep(retry.delay(attempt))
         if close:
             conn.close()
-        tramp = xmltramp.parse(rawResponse)
+        return rawResponse, response.getheader('content-encoding', '') == 'gzip'
+
+    def post(self, conn=None, alwaysReturnList=False, retry=None):
+        """Complete the envelope and send the request
+
+        does all the grunt work,
+          serializes the request,
+          makes a http request, retried after transient errors by the RetryPolicy retry
+          decompresses a response bigger than spoolThreshold to a temporary file
+          passes the response to tramp
+          checks for soap fault
+          todo: check for mU='1' headers
+          saves the response headers to self.responseHeaders {name: element}
+          returns the relevant result from the body child, or DmlResults of all results
+        """
+        (rawResponse, gzipped) = self.send(conn, retry)
+        if self.raw:
+            # the size is still compressed and the headers are parsed elsewhere
+            self.responseBytes = len(rawResponse)
+            self.responseHeaders = {}
+            return rawResponse, gzipped
+        if self.spoolThreshold is not None:
+            rawResponse = spoolDecompress(rawResponse, gzipped, self.spoolThreshold)
+        elif gzipped:
+            rawResponse = gzip.GzipFile(fileobj=BytesIO(rawResponse)).read()
+        self.responseBytes = len(rawResponse)
+        parsed = False
         try:
-            faultString = str(tramp[_tSoapNS.Body][_tSoapNS.Fault].faultstring)
-            faultCode = str(tramp[_tSoapNS.Body][_tSoapNS.Fault].faultcode).split(':')[-1]
-            raise SoapFaultError(faultCode, faultString)
-        except KeyError:
-            pass
-        # first child of body is XXXXResponse
-        result = tramp[_tSoapNS.Body][0]
+            (result, self.responseHeaders) = parseEnvelope(rawResponse, self.compactXml, self.lazyRecords,
+                                                           self.base64Streams,
+                                                           self.compactResults and self.operationName in dmlOperations)
+            parsed = True
+        finally:
+            # lazy records of a parsed response still read the map
+            if isinstance(rawResponse, mmap.mmap) and not (parsed and self.lazyRecords):
+                rawResponse.close()
+        if isinstance(result, DmlResults):
+            return result
         # it contains either a single child, or for a batch call multiple children
         if alwaysReturnList or len(result) > 1:
             return result[:]
@@ -492,6 +1165,197 @@ class SoapEnvelope(object):
             return result[0]
 
 
+def parseEnvelope(rawResponse, compact=False, lazyRecords=False, base64Streams=None, dmlResults=False):
+    """Parse a SOAP response, returns (the XXXXResponse element, response headers {name: element})
+
+    raises SoapFaultError if the response is a fault
+    compact: the elements are views of xmltramp.CompactDocument
+    lazyRecords: every records element is parsed by the first access to its content
+    base64Streams: {'Type.Field': factory}, see Client.base64Streams
+    dmlResults: the result elements are decoded to DmlResults, it is returned instead of the element
+    """
+    seeder = None
+    if dmlResults:
+        seeder = DmlResultsSeeder()
+        tramp = xmltramp.seed(xmltramp.source(rawResponse), seeder=seeder)
+    else:
+        tramp = xmltramp.parse(rawResponse, compact, 'records' if lazyRecords else None,
+                               base64Streams and _base64Opener(base64Streams))
+    try:
+        header = tramp[_tSoapNS.Header]
+    except KeyError:
+        header = None
+    responseHeaders = {}
+    if header is not None:
+        for h in header._dir:
+            if isinstance(h, xmltramp.Element):
+                responseHeaders[h._name[1] if islst(h._name) else h._name] = h
+    try:
+        faultString = str(tramp[_tSoapNS.Body][_tSoapNS.Fault].faultstring)
+        faultCode = str(tramp[_tSoapNS.Body][_tSoapNS.Fault].faultcode).split(':')[-1]
+        raise SoapFaultError(faultCode, faultString)
+    except KeyError:
+        pass
+    if seeder is not None:
+        return seeder.results, responseHeaders
+    # first child of body is XXXXResponse
+    return tramp[_tSoapNS.Body][0], responseHeaders
+
+
+class DmlResultsSeeder(xmltramp.Seeder):
+    """Seeder that decodes the result elements of a DML response to DmlResults without elements"""
+    def __init__(self):
+        xmltramp.Seeder.__init__(self)
+        self.results = DmlResults()
+        self.item = None  # [id, success, created, errors] of the current result
+        self.level = 0    # depth inside the result element
+        self.error = None
+        self.text = []
+
+    def startElementNS(self, name, qname, attrs):
+        if self.item is not None:
+            self.level += 1
+            self.text = []
+            if self.level == 1 and name[1] == 'errors':
+                self.error = [None, None, []]
+        elif len(self.stack) == 3 and name == (_partnerNs, 'result'):
+            self.item = [None, False, None, []]
+            self.level = 0
+        else:
+            xmltramp.Seeder.startElementNS(self, name, qname, attrs)
+
+    def characters(self, ch):
+        if self.item is not None:
+            self.text.append(ch)
+        else:
+            xmltramp.Seeder.characters(self, ch)
+
+    def endElementNS(self, name, qname):
+        item = self.item
+        if item is None:
+            return xmltramp.Seeder.endElementNS(self, name, qname)
+        if self.level == 0:
+            self.results.append(*item)
+            self.item = None
+            return
+        text = u''.join(self.text)
+        self.text = []
+        local = name[1]
+        if self.level == 1:
+            if local == 'id':
+                item[0] = text or None
+            elif local == 'success':
+                item[1] = text == 'true'
+            elif local == 'created':
+                item[2] = text == 'true'
+            elif local == 'errors':
+                item[3].append(DmlError(self.error[0], self.error[1], tuple(self.error[2])))
+                self.error = None
+        elif self.level == 2 and self.error is not None:
+            if local == 'statusCode':
+                self.error[0] = text
+            elif local == 'message':
+                self.error[1] = text
+            elif local == 'fields':
+                self.error[2].append(text)
+        self.level -= 1
+
+
+def _base64Opener(base64Streams):
+    """xmltramp streams function that opens the writer of a field by Client.base64Streams"""
+    fields = set(key.split('.')[-1] for key in base64Streams)
+
+    def opener(parent, name):
+        if not islst(name) or name[1] not in fields or name[0] != _sobjectNs:
+            return None
+        try:
+            factory = base64Streams.get(str(parent[_tSObjectNS.type]) + '.' + name[1])
+        except KeyError:
+            return None
+        return factory(parent, name[1]) if factory else None
+    return opener
+
+
+def readResponse(response, threshold=None):
+    """Read the body of the http response, to a temporary file if it is bigger than threshold, else bytes"""
+    if threshold is None:
+        return response.read()
+    chunks = []
+    size = 0
+    while size <= threshold:
+        chunk = response.read(_spoolChunk)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+        size += len(chunk)
+    spool = tempfile.TemporaryFile()
+    try:
+        for chunk in chunks:
+            spool.write(chunk)
+        while chunk:
+            chunk = response.read(_spoolChunk)
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def spoolDecompress(rawResponse, gzipped, threshold):
+    """Decompressed response: bytes if it is not bigger than threshold, else a read only mmap of a temporary file
+
+    rawResponse: bytes or a file by readResponse
+    """
+    if isinstance(rawResponse, bytes):
+        if not gzipped:
+            return rawResponse
+        rawResponse = BytesIO(rawResponse)
+    elif not gzipped:
+        return _mmap(rawResponse)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = []
+    size = 0
+    spool = None
+    try:
+        chunk = rawResponse.read(_spoolChunk)
+        while chunk:
+            data = decompressor.decompress(chunk)
+            chunk = rawResponse.read(_spoolChunk)
+            if not chunk:
+                data += decompressor.flush()
+            if spool is None:
+                chunks.append(data)
+                size += len(data)
+                if size > threshold:
+                    spool = tempfile.TemporaryFile()
+                    spool.write(b''.join(chunks))
+                    chunks = None
+            else:
+                spool.write(data)
+    except Exception:
+        if spool is not None:
+            spool.close()
+        raise
+    finally:
+        rawResponse.close()
+    if spool is None:
+        return b''.join(chunks)
+    return _mmap(spool)
+
+
+def _mmap(spool):
+    """Read only memory map of the temporary file, the file is closed (deleted by closing the map)"""
+    spool.flush()
+    try:
+        return mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        spool.close()
+
+
+_spoolChunk = 65536
+
+
 class LoginRequest(SoapEnvelope):
     def __init__(self, serverUrl, username, password):
         SoapEnvelope.__init__(self, serverUrl, "login")
@@ -551,6 +1415,13 @@ class AuthenticatedRequest(SoapEnvelope):
         if islst(sObjects):
             for o in sObjects:
                 self.writeSObjects(s, o, elemName)
+        elif isinstance(sObjects, (xmltramp.Element, ElementRecord)):
+            if isinstance(sObjects, xmltramp.Element):
+                sObjects = ElementRecord(sObjects)
+            s.startElement(_partnerNs, elemName)
+            for fn, value in sObjects.items():
+                s.writeStringElement(_sobjectNs, fn, value)
+            s.endElement()
         else:
             s.startElement(_partnerNs, elemName)
             # type has to go first
@@ -564,6 +1435,11 @@ class AuthenticatedRequest(SoapEnvelope):
             s.endElement()
 
 
+# a request used only to serialize sObjects in serializedSize()
+_sizeRequest = AuthenticatedRequest(None, None, {}, None)
+_emptySize = len(_sObjectsDocument(None))
+
+
 class LogoutRequest(AuthenticatedRequest):
     def __init__(self, serverUrl, sessionId, headers):
         AuthenticatedRequest.__init__(self, serverUrl, sessionId, headers, "logout")
@@ -0,0 +1,93 @@
+"""Adaptive tuning of the query batch size and of the DML chunk size by measured throughput."""
+import threading
+
+
+class BatchTuner(object):
+    """Hill climbing of batch sizes per (operation, sObject type) to maximize records per second.
+
+    Assign it to `iterclient.tuner` (clones share it). Query pages use the tuned
+    batchSize of QueryOptions, create/update/upsert/delete/undelete/retrieve send
+    chunks of the tuned size if chunkLength is not given.
+
+    After `samples` calls with the same size the mean throughput is compared with
+    the previous size. The size is changed by `factor` in the same direction while
+    the throughput improves, otherwise the direction is reversed. Sizes stay within
+    the bounds and, if maxBytes is set, the estimated payload of a call stays below it.
+
+    >>> tuner = BatchTuner()
+    >>> client.tuner = tuner
+    >>> tuner.sizes()
+    {('query', 'Account'): 750, ('update', 'Contact'): 67}
+    """
+    queryBounds = (200, 2000)
+    dmlBounds = (10, 200)
+
+    def __init__(self, queryBounds=None, dmlBounds=None, factor=1.5, samples=2, maxBytes=None):
+        if queryBounds:
+            self.queryBounds = queryBounds
+        if dmlBounds:
+            self.dmlBounds = dmlBounds
+        self.factor = factor
+        self.samples = samples
+        self.maxBytes = maxBytes
+        self._lock = threading.Lock()
+        # key: [size, direction, records, seconds, calls, previous throughput, bytes per record]
+        self._state = {}
+
+    def bounds(self, key):
+        return self.queryBounds if key[0] == 'query' else self.dmlBounds
+
+    def size(self, key):
+        """The current batch size for the key (operation, sObject type)"""
+        with self._lock:
+            return self._get(key)[0]
+
+    def sizes(self):
+        """Dict of the current sizes {(operation, sObject type): size}"""
+        with self._lock:
+            return dict((key, state[0]) for key, state in self._state.items())
+
+    def throughput(self, key):
+        """Records per second measured by the previous size, None if not known yet"""
+        with self._lock:
+            return self._get(key)[5]
+
+    def observe(self, key, size, records, seconds, payloadBytes=0):
+        """Add a measurement of a call with the batch size that returned or sent `records`"""
+        with self._lock:
+            state = self._get(key)
+            if records and payloadBytes:
+                perRecord = float(payloadBytes) / records
+                state[6] = perRecord if state[6] is None else 0.8 * state[6] + 0.2 * perRecord
+            if size != state[0]:
+                return  # measured by an outdated size
+            state[2] += records
+            state[3] += seconds
+            state[4] += 1
+            if state[4] < self.samples:
+                return
+            throughput = state[2] / state[3] if state[3] > 0 else float('inf')
+            if state[5] is not None and throughput < state[5]:
+                state[1] = -state[1]
+            state[5] = throughput
+            state[2] = state[3] = state[4] = 0
+            self._resize(key, state)
+
+    def _get(self, key):
+        state = self._state.get(key)
+        if state is None:
+            low, high = self.bounds(key)
+            state = self._state[key] = [(low + high) // 2, 1, 0, 0.0, 0, None, None]
+        return state
+
+    def _resize(self, key, state):
+        low, high = self.bounds(key)
+        if state[6] and self.maxBytes:
+            high = max(low, min(high, int(self.maxBytes / state[6])))
+        for direction in (state[1], -state[1]):
+            size = int(state[0] * self.factor) if direction > 0 else int(state[0] / self.factor)
+            size = min(high, max(low, size))
+            if size != state[0]:
+                break
+        # at a bound the climbing goes back
+        state[0], state[1] = size, direction
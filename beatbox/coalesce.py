@@ -0,0 +1,131 @@
+"""Coalescing of many single record `retrieve` calls into batched requests."""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from beatbox._beatbox import IterClient
+from beatbox.xmltramp import islst
+
+
+class RetrieveCoalescer(object):
+    """Merge `retrieve` calls of many callers (threads) into batched `retrieve` requests.
+
+    Lookups with the same fields and sObjectType that arrive within `window` seconds
+    are sent together as one request, immediately if `maxBatch` ids are collected.
+    Every caller gets a Future of its own record. The requests are sent by a background
+    thread that uses its own clone of the client.
+
+    >>> coalescer = RetrieveCoalescer(svc)
+    >>> future = coalescer.retrieve("Id, Name", "Account", accountId)
+    >>> print(str(future.result()[sf.Name]))
+    """
+    def __init__(self, client, window=0.01, maxBatch=2000):
+        self.client = client.clone()
+        self.window = window
+        self.maxBatch = maxBatch
+        # (fields, sObjectType) -> [time of the first request, OrderedDict(id -> [futures])]
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._flushing = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='RetrieveCoalescer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def retrieve(self, fields, sObjectType, id, callback=None):
+        """Request one record, returns a Future of the retrieved record.
+
+        The result is the same as of `Client.retrieve` with one id. The optional
+        callback is called with the finished future.
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        key = (tuple(fields) if islst(fields) else fields, sObjectType)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The coalescer is closed.")
+            if key not in self._pending:
+                self._pending[key] = [time.time(), OrderedDict()]
+            ids = self._pending[key][1]
+            ids.setdefault(id, []).append(future)
+            if len(ids) == 1 or len(ids) >= self.maxBatch:
+                self._cond.notify_all()
+        return future
+
+    def get(self, fields, sObjectType, id):
+        """Synchronous `retrieve` of one record, batched together with other callers."""
+        return self.retrieve(fields, sObjectType, id).result()
+
+    def flush(self):
+        """Send all pending requests now and wait until they are finished."""
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            while self._pending or self._flushing:
+                self._cond.wait()
+
+    def close(self):
+        """Send the pending requests and stop the background thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _takeBatch(self):
+        """Remove one ready batch from pending requests, return (key, ids, timeout)."""
+        now = time.time()
+        timeout = None
+        for key, (started, ids) in self._pending.items():
+            if self._flushing or self._closed or len(ids) >= self.maxBatch or now - started >= self.window:
+                batch = OrderedDict()
+                for id in list(ids)[:self.maxBatch]:
+                    batch[id] = ids.pop(id)
+                if not ids:
+                    del self._pending[key]
+                return key, batch, None
+            remains = started + self.window - now
+            timeout = remains if timeout is None else min(timeout, remains)
+        return None, None, timeout
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    key, batch, timeout = self._takeBatch()
+                    if batch:
+                        break
+                    if self._flushing:
+                        self._flushing = False
+                        self._cond.notify_all()
+                    if self._closed:
+                        return
+                    self._cond.wait(timeout)
+            self._send(key, batch)
+
+    def _send(self, key, batch):
+        (fields, sObjectType) = key
+        ids = list(batch)
+        try:
+            if isinstance(self.client, IterClient):
+                # IterClient.retrieve is a generator of records, also for one id
+                records = list(self.client.retrieve(fields, sObjectType, ids))
+            elif len(ids) == 1:
+                records = [self.client.retrieve(fields, sObjectType, ids)]
+            else:
+                records = self.client.retrieve(fields, sObjectType, ids)
+        except Exception as exc:
+            for futures in batch.values():
+                for future in futures:
+                    future.set_exception(exc)
+        else:
+            for id, record in zip(ids, records):
+                for future in batch[id]:
+                    future.set_result(record)
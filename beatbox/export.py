@@ -0,0 +1,165 @@
+"""Resumable export of query results to CSV or JSON Lines files, optionally gzipped."""
+import gzip
+import json
+import os
+from collections import OrderedDict
+
+from beatbox._beatbox import _tPartnerNS
+from beatbox.partition import maskSoql, splitSoql
+from beatbox.six import text_type
+from beatbox.sync import replaceFile
+from beatbox.xmltramp import Element
+
+_xsiNil = ('http://www.w3.org/2001/XMLSchema-instance', 'nil')
+
+
+def soqlColumns(soql):
+    """Column names of the top level select list of soql, subqueries are omitted"""
+    select = splitSoql(soql)[0]
+    masked = maskSoql(select)
+    start = masked.upper().index('SELECT') + 6
+    columns = []
+    for item in masked[start:].split(','):
+        item = item.strip()
+        if item:
+            columns.append(item)
+    return columns
+
+
+def describeSoql(client, sObjectType):
+    """SOQL that selects all fields of the object in the order of describeSObjects"""
+    describe = client.describeSObjects(sObjectType)
+    fields = [str(f[_tPartnerNS.name]) for f in describe[_tPartnerNS.fields:]]
+    return "SELECT {} FROM {}".format(', '.join(fields), sObjectType)
+
+
+def fieldText(record, column):
+    """Text of a (dotted) column in a record Element, None if it is nil or missing"""
+    el = record
+    for name in column.lower().split('.'):
+        for child in el._dir:
+            if isinstance(child, Element) and child._name[1].lower() == name:
+                el = child
+                break
+        else:
+            return None
+    if el._attrs.get(_xsiNil) == 'true':
+        return None
+    return u''.join(x for x in el._dir if not isinstance(x, Element))
+
+
+def csvLine(values):
+    """One line of CSV by RFC 4180, None is written as an empty field"""
+    out = []
+    for value in values:
+        if value is None:
+            value = u''
+        if any(ch in value for ch in u'",\r\n'):
+            value = u'"' + value.replace(u'"', u'""') + u'"'
+        out.append(value)
+    return u','.join(out) + u'\r\n'
+
+
+def jsonLine(columns, values):
+    return text_type(json.dumps(OrderedDict(zip(columns, values)), ensure_ascii=False)) + u'\n'
+
+
+class Exporter(object):
+    """Stream the results of a query to a CSV or JSON Lines file with checkpoints.
+
+    client: Client (not IterClient)
+    objectOrSoql: an sObject name (all fields in the order of describe are exported)
+        or a SOQL query (columns in the order of the select list, relationship fields dotted)
+    format: 'csv' or 'jsonl', compress: write a gzip file
+
+    After every `checkpointPages` pages the output is flushed and the query locator,
+    the row count and the size of the output are saved to `path + '.checkpoint'`.
+    An interrupted export is resumed from the last checkpoint by running it again
+    (the query locator must not be expired). The checkpoint is removed when done.
+
+    >>> Exporter(svc, 'Account', 'account.csv.gz', compress=True).run()
+    """
+    def __init__(self, client, objectOrSoql, path, format='csv', compress=False, checkpointPages=10):
+        if format not in ('csv', 'jsonl'):
+            raise ValueError("Unsupported format {}".format(format))
+        self.client = client
+        self.objectOrSoql = objectOrSoql
+        self.path = path
+        self.format = format
+        self.compress = compress
+        self.checkpointPages = checkpointPages
+        self.checkpointPath = path + '.checkpoint'
+        self.rows = 0
+
+    def run(self):
+        """Export all rows (or the rest after a checkpoint), returns the number of rows"""
+        checkpoint = self.loadCheckpoint()
+        if checkpoint:
+            self.soql = checkpoint['soql']
+            self.rows = checkpoint['rows']
+            with open(self.path, 'ab') as f:
+                f.truncate(checkpoint['size'])
+            qr = self.client.queryMore(checkpoint['queryLocator'])
+        else:
+            if ' ' in self.objectOrSoql.strip():
+                self.soql = self.objectOrSoql
+            else:
+                self.soql = describeSoql(self.client, self.objectOrSoql)
+            self.rows = 0
+            with open(self.path, 'wb'):
+                pass
+            qr = self.client.query(self.soql)
+        self.columns = soqlColumns(self.soql)
+        out = self.open()
+        try:
+            if not checkpoint and self.format == 'csv':
+                out.write(csvLine(self.columns).encode('utf-8'))
+            pages = 0
+            while True:
+                self.writePage(out, qr[_tPartnerNS.records:])
+                if str(qr[_tPartnerNS.done]) == 'true':
+                    break
+                pages += 1
+                if pages % self.checkpointPages == 0:
+                    out = self.checkpoint(out, str(qr[_tPartnerNS.queryLocator]))
+                qr = self.client.queryMore(str(qr[_tPartnerNS.queryLocator]))
+        finally:
+            out.close()
+        if os.path.exists(self.checkpointPath):
+            os.remove(self.checkpointPath)
+        return self.rows
+
+    def open(self):
+        if self.compress:
+            return gzip.GzipFile(self.path, 'ab')
+        return open(self.path, 'ab', 1 << 20)
+
+    def writePage(self, out, records):
+        lines = []
+        for record in records:
+            values = [fieldText(record, column) for column in self.columns]
+            if self.format == 'csv':
+                lines.append(csvLine(values))
+            else:
+                lines.append(jsonLine(self.columns, values))
+        out.write(u''.join(lines).encode('utf-8'))
+        self.rows += len(lines)
+
+    def checkpoint(self, out, queryLocator):
+        """Flush the output to disk, save the checkpoint and return the reopened output"""
+        out.close()
+        with open(self.path, 'ab') as f:
+            os.fsync(f.fileno())
+        size = os.path.getsize(self.path)
+        data = {'soql': self.soql, 'queryLocator': queryLocator, 'rows': self.rows, 'size': size}
+        tmp = self.checkpointPath + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        replaceFile(tmp, self.checkpointPath)
+        return self.open()
+
+    def loadCheckpoint(self):
+        if os.path.exists(self.checkpointPath):
+            with open(self.checkpointPath) as f:
+                return json.load(f)
+        return None
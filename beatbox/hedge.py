@@ -0,0 +1,154 @@
+"""Hedged requests: a slow idempotent call is duplicated on another connection."""
+import copy
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, TimeoutError, wait
+
+from beatbox._beatbox import idempotentOperations, makeConnection
+from beatbox.six import urlparse
+
+
+class HedgingPolicy(object):
+    """Duplicate idempotent requests that are slower than a percentile of their latency.
+
+    Assign it to `client.hedging` (clones share it). If a call of one of `operations`
+    does not answer within the `percentile` of the recent latencies of the operation
+    (measured from `minSamples` calls), the same request is sent on another connection
+    and the first answer is used. Max `maxFraction` of calls is hedged. The connection
+    of the slower request is reused by later hedges or by the client, max `maxIdle`
+    idle connections are kept.
+
+    >>> svc.hedging = HedgingPolicy(percentile=95, maxFraction=0.05)
+    """
+    operations = idempotentOperations
+
+    def __init__(self, percentile=95, maxFraction=0.05, minSamples=20, window=500, minDelay=0.0, maxIdle=4):
+        self.percentile = percentile
+        self.maxFraction = maxFraction
+        self.minSamples = minSamples
+        self.window = window
+        self.minDelay = minDelay
+        self.maxIdle = maxIdle
+        self.calls = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._idle = {}
+
+    def delay(self, operation):
+        """Time after that the operation is hedged, None if not enough calls are measured"""
+        with self._lock:
+            samples = self._latencies.get(operation)
+            if not samples or len(samples) < self.minSamples:
+                return None
+            ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))
+        return max(self.minDelay, ordered[index])
+
+    def post(self, request, conn, alwaysReturnList=False, retry=None, scheduler=None, priority=None):
+        """Post the request, returns (result, the request that answered, a free connection for the client)
+
+        The duplicate request takes its own slot of the scheduler (RequestScheduler),
+        the request is not hedged if no slot is free.
+        """
+        operation = request.operationName
+        delay = self.delay(operation)
+        with self._lock:
+            self.calls += 1
+            allowed = self.hedges < self.maxFraction * self.calls
+        start = time.time()
+        if delay is None or not allowed:
+            result = request.post(conn, alwaysReturnList, retry)
+            self._record(operation, time.time() - start)
+            return result, request, conn
+        # every request runs on its own thread, a shared pool would delay calls and distort the latencies
+        primary = _start(request.post, conn, alwaysReturnList, retry)
+        primary.add_done_callback(lambda f: self._record(operation, time.time() - start))
+        try:
+            return primary.result(timeout=delay), request, conn
+        except TimeoutError:
+            pass
+        slot = None
+        if scheduler is not None:
+            (allowed, slot) = scheduler.tryAcquire(priority)
+        if allowed:
+            with self._lock:
+                if self.hedges >= self.maxFraction * self.calls:
+                    allowed = False
+                else:
+                    self.hedges += 1
+            if not allowed and scheduler is not None:
+                scheduler.release(slot)
+        if not allowed:
+            return primary.result(), request, conn
+        hedge = copy.copy(request)
+        hedgeConn = self._connection(request.serverUrl)
+        secondary = _start(hedge.post, hedgeConn, alwaysReturnList, retry)
+        if scheduler is not None:
+            secondary.add_done_callback(lambda f: scheduler.release(slot))
+        (done, pending) = wait([primary, secondary], return_when=FIRST_COMPLETED)
+        if primary in done and primary.exception() is None:
+            secondary.add_done_callback(lambda f: self._release(request.serverUrl, hedgeConn, f))
+            return primary.result(), request, conn
+        if secondary in done and secondary.exception() is None:
+            primary.add_done_callback(lambda f: self._release(request.serverUrl, conn, f))
+            return secondary.result(), hedge, hedgeConn
+        # the first answer is an error, wait for the other one
+        wait([primary, secondary])
+        if secondary.exception() is None:
+            primary.add_done_callback(lambda f: self._release(request.serverUrl, conn, f))
+            return secondary.result(), hedge, hedgeConn
+        hedgeConn.close()
+        return primary.result(), request, conn
+
+    def shutdown(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+    def _record(self, operation, seconds):
+        with self._lock:
+            samples = self._latencies.get(operation)
+            if samples is None:
+                samples = self._latencies[operation] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def _connection(self, serverUrl):
+        (scheme, host) = urlparse(serverUrl)[:2]
+        with self._lock:
+            conns = self._idle.get((scheme, host))
+            if conns:
+                return conns.pop()
+        return makeConnection(scheme, host)
+
+    def _release(self, serverUrl, conn, future):
+        """Keep the connection of a finished request as idle, close it after an error"""
+        key = tuple(urlparse(serverUrl)[:2])
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if future.exception() is None and len(conns) < self.maxIdle:
+                conns.append(conn)
+                return
+        conn.close()
+
+
+def _start(fn, *args):
+    """Future of fn(*args) called by a new daemon thread"""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(*args)
+        except BaseException as exc:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+    thread = threading.Thread(target=run, name='HedgedRequest')
+    thread.daemon = True
+    thread.start()
+    return future
@@ -0,0 +1,187 @@
+"""Bulk load of CSV or JSON Lines files by parallel create/update/upsert calls."""
+import csv
+import io
+import json
+from collections import deque
+
+from beatbox._beatbox import _tPartnerNS, DmlResult
+from beatbox.export import csvLine
+from beatbox.pool import ClientPool
+from beatbox.six import PY2, text_type
+
+_numberTypes = ('double', 'currency', 'percent')
+
+
+def readRows(path, format=None):
+    """Yield rows as dicts from a CSV file with a header or from a JSON Lines file"""
+    if format is None:
+        format = 'jsonl' if path.endswith('.jsonl') else 'csv'
+    if format == 'jsonl':
+        with io.open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif PY2:
+        with open(path, 'rb') as f:
+            reader = csv.reader(f)
+            header = [x.decode('utf-8') for x in next(reader)]
+            for row in reader:
+                yield dict(zip(header, [x.decode('utf-8') for x in row]))
+    else:
+        with io.open(path, encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            for row in reader:
+                yield dict(zip(header, row))
+
+
+def convertValue(value, type):
+    """Convert a text from the input file to a value for the field type, '' and None are None"""
+    if value is None or value == u'':
+        return None
+    if not isinstance(value, text_type) and not isinstance(value, str):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return value
+    value = value.strip()
+    if type == 'boolean':
+        if value.lower() in ('true', '1', 'yes', 'y'):
+            return 'true'
+        if value.lower() in ('false', '0', 'no', 'n'):
+            return 'false'
+        raise ValueError(u"Invalid boolean value '{}'".format(value))
+    if type == 'int':
+        return int(value)
+    if type in _numberTypes:
+        float(value)  # validate, but keep the original decimal text
+    return value
+
+
+class Loader(object):
+    """Load rows from a file by create, update or upsert with concurrent chunks.
+
+    mapping: dict {column: field name}, by default every column (of the first row)
+        is a field of the same name.
+    All mapped fields are validated against describeSObjects before the load. Empty
+    values are sent as fieldsToNull by update/upsert and omitted by create. The result
+    of every row is written to a CSV file with columns line, id, success, created, errors.
+
+    >>> Loader(svc, 'Contact', 'upsert', 'Ext__c').run('contacts.csv', 'results.csv')
+    """
+    def __init__(self, client, sObjectType, operation='upsert', externalIdName=None, mapping=None,
+                 chunkLength=200, maxWorkers=4):
+        if operation not in ('create', 'update', 'upsert'):
+            raise ValueError("Unsupported operation {}".format(operation))
+        if operation == 'upsert' and not externalIdName:
+            raise ValueError("The externalIdName is required by upsert")
+        self.client = client.iterclient
+        self.sObjectType = sObjectType
+        self.operation = operation
+        self.externalIdName = externalIdName
+        self.mapping = mapping
+        self.chunkLength = chunkLength
+        self.maxWorkers = maxWorkers
+        self._fields = None
+
+    def fields(self):
+        """Describe of fields {lowercase name: (name, type, createable, updateable)}"""
+        if self._fields is None:
+            self._fields = {}
+            for f in self.client.describeSObjects(self.sObjectType)[_tPartnerNS.fields:]:
+                self._fields[str(f[_tPartnerNS.name]).lower()] = (
+                    str(f[_tPartnerNS.name]), str(f[_tPartnerNS.type]),
+                    str(f[_tPartnerNS.createable]) == 'true', str(f[_tPartnerNS.updateable]) == 'true')
+        return self._fields
+
+    def columnMap(self, columns):
+        """Validated list of (column, field name, type)"""
+        mapping = self.mapping or dict((x, x) for x in columns)
+        fields = self.fields()
+        result = []
+        for column in columns:
+            if column not in mapping:
+                continue
+            key = mapping[column].lower()
+            if key not in fields:
+                raise ValueError("No field {} in {}".format(mapping[column], self.sObjectType))
+            (name, type, createable, updateable) = fields[key]
+            if key != 'id' and (self.operation == 'create' and not createable or
+                                self.operation == 'update' and not updateable or
+                                self.operation == 'upsert' and not (createable or updateable)):
+                raise ValueError("The field {} can not be used by {}".format(name, self.operation))
+            result.append((column, name, type))
+        return result
+
+    def makeRecord(self, row, columnMap):
+        record = {'type': self.sObjectType}
+        nulls = []
+        for column, name, type in columnMap:
+            value = convertValue(row.get(column), type)
+            if value is not None:
+                record[name] = value
+            elif self.operation != 'create' and name.lower() != 'id':
+                nulls.append(name)
+        if nulls:
+            record['fieldsToNull'] = nulls
+        return record
+
+    def run(self, inputPath, resultPath, format=None):
+        """Load the file, returns the tuple (number of successes, number of failures)"""
+        counts = [0, 0]
+        pending = deque()
+        columnMap = None
+        with ClientPool(self.client, self.maxWorkers) as pool:
+            with open(resultPath, 'wb') as out:
+                out.write(csvLine([u'line', u'id', u'success', u'created', u'errors']).encode('utf-8'))
+                chunk = []
+                lines = []
+                for line, row in enumerate(readRows(inputPath, format), 1):
+                    if columnMap is None:
+                        columnMap = self.columnMap(list(row))
+                    try:
+                        chunk.append(self.makeRecord(row, columnMap))
+                        lines.append(line)
+                    except ValueError as exc:
+                        self.writeResults(out, ([line], [exc]), counts)
+                    if len(chunk) >= self.chunkLength:
+                        pending.append((lines, pool.submit(self.save, chunk)))
+                        chunk, lines = [], []
+                        # bounded memory: wait for the oldest chunk
+                        while len(pending) > 2 * self.maxWorkers:
+                            self.writeResults(out, pending.popleft(), counts)
+                if chunk:
+                    pending.append((lines, pool.submit(self.save, chunk)))
+                while pending:
+                    self.writeResults(out, pending.popleft(), counts)
+        return tuple(counts)
+
+    def save(self, client, records):
+        if self.operation == 'upsert':
+            return list(client.upsert(self.externalIdName, records, chunkLength=self.chunkLength))
+        return list(getattr(client, self.operation)(records, chunkLength=self.chunkLength))
+
+    def writeResults(self, out, chunk, counts):
+        """Write results of a chunk (lines, list of results or a future of them)"""
+        (lines, results) = chunk
+        if not isinstance(results, list):
+            try:
+                results = results.result()
+            except Exception as exc:
+                results = [exc] * len(lines)
+        text = []
+        for line, result in zip(lines, results):
+            if isinstance(result, Exception):
+                row = [text_type(line), None, u'false', None, text_type(result)]
+            elif isinstance(result, DmlResult):
+                errors = u'; '.join(u'{}: {}'.format(e.statusCode, e.message) for e in result.errors)
+                row = [text_type(line), result.id, u'true' if result.success else u'false',
+                       None if result.created is None else u'true' if result.created else u'false', errors or None]
+            else:
+                errors = u'; '.join(u'{}: {}'.format(e[_tPartnerNS.statusCode], e[_tPartnerNS.message])
+                                    for e in result[_tPartnerNS.errors:])
+                created = result[_tPartnerNS.created:]
+                row = [text_type(line), text_type(result[_tPartnerNS.id]), text_type(result[_tPartnerNS.success]),
+                       text_type(created[0]) if created else None, errors or None]
+            counts[0 if row[2] == u'true' else 1] += 1
+            text.append(csvLine(row))
+        out.write(u''.join(text).encode('utf-8'))
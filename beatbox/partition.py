@@ -0,0 +1,204 @@
+"""Parallel queries partitioned by ranges of Id or of a datetime field."""
+import re
+import threading
+
+from beatbox._beatbox import _tPartnerNS, IterClient
+from beatbox.pool import ClientPool
+from beatbox.six import queue
+from beatbox.sync import formatTimestamp, parseTimestamp
+
+_base62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+_clauses = re.compile(r'\b(GROUP\s+BY|ORDER\s+BY|LIMIT|OFFSET|HAVING|WITH|FOR)\b', re.I)
+
+
+def maskSoql(soql):
+    """Replace the content of parentheses and string literals by spaces to search only the top level"""
+    out = []
+    depth = 0
+    quoted = False
+    escaped = False
+    for ch in soql:
+        if quoted:
+            out.append(' ')
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == "'":
+                quoted = False
+        elif ch == "'":
+            quoted = True
+            out.append(' ')
+        elif ch == '(':
+            depth += 1
+            out.append(' ')
+        elif ch == ')':
+            depth -= 1
+            out.append(' ')
+        else:
+            out.append(ch if depth == 0 else ' ')
+    return ''.join(out)
+
+
+def splitSoql(soql):
+    """Split soql to (select, from, where condition or None, the rest after the condition)"""
+    masked = maskSoql(soql)
+    fromMatch = re.search(r'\bFROM\b', masked, re.I)
+    if not fromMatch:
+        raise ValueError("Not a SOQL query: {}".format(soql))
+    whereMatch = re.search(r'\bWHERE\b', masked[fromMatch.end():], re.I)
+    clause = _clauses.search(masked, fromMatch.end())
+    end = clause.start() if clause else len(soql)
+    if whereMatch and fromMatch.end() + whereMatch.start() < end:
+        whereStart = fromMatch.end() + whereMatch.start()
+        return (soql[:fromMatch.start()], soql[fromMatch.start():whereStart].strip(),
+                soql[whereStart + 5:end].strip(), soql[end:])
+    return soql[:fromMatch.start()], soql[fromMatch.start():end].strip(), None, soql[end:]
+
+
+def addCondition(soql, condition):
+    """Add a condition to the top level WHERE clause of the soql by AND"""
+    (select, from_, where, rest) = splitSoql(soql)
+    if where:
+        condition = '{} AND ({})'.format(condition, where)
+    return '{}{} WHERE {} {}'.format(select, from_, condition, rest).strip()
+
+
+def idToNumber(id):
+    """The record number part of a 15 characters Id (after the key prefix) as int"""
+    n = 0
+    for ch in id[3:15]:
+        n = n * 62 + _base62.index(ch)
+    return n
+
+
+def numberToId(prefix, n):
+    chars = []
+    for i in range(12):
+        n, digit = divmod(n, 62)
+        chars.append(_base62[digit])
+    return prefix + ''.join(reversed(chars))
+
+
+def partitionConditions(client, soql, partitions, field='Id', queryAll=False):
+    """SOQL conditions of ranges of the field that split the query to max `partitions` parts.
+
+    client: IterClient, queryAll: the range includes deleted and archived records
+    The field must be Id or a datetime field without null values. The boundaries
+    are interpolated between the minimal and maximal value of the field in the query,
+    so that the parts are even if the values are distributed evenly.
+    """
+    (select, from_, where, rest) = splitSoql(soql)
+    values = []
+    for direction in ('ASC', 'DESC'):
+        sample = 'SELECT {} {}{} ORDER BY {} {} NULLS LAST LIMIT 1'.format(
+            field, from_, ' WHERE ' + where if where else '', field, direction)
+        method = super(IterClient, client).queryAll if queryAll else super(IterClient, client).query
+        records = method(sample)[_tPartnerNS.records:]
+        if not records:
+            return []
+        # the record is <type/><Id/>[<field/>], Id is present (maybe nil) also if it is not selected
+        values.append(str(records[0][1 if field.lower() == 'id' else 2]))
+    if field.lower() == 'id':
+        low, high = idToNumber(values[0]), idToNumber(values[1])
+        bounds = ["'{}'".format(numberToId(values[0][:3], low + (high - low) * i // partitions))
+                  for i in range(1, partitions)]
+    else:
+        low, high = parseTimestamp(values[0]), parseTimestamp(values[1])
+        bounds = [formatTimestamp(low + (high - low) * i // partitions) for i in range(1, partitions)]
+    bounds = sorted(set(bounds), key=bounds.index)
+    if not bounds:
+        return [None]
+    conditions = ['{} < {}'.format(field, bounds[0])]
+    for a, b in zip(bounds, bounds[1:]):
+        conditions.append('{} >= {} AND {} < {}'.format(field, a, field, b))
+    conditions.append('{} >= {}'.format(field, bounds[-1]))
+    return conditions
+
+
+def queryPages(client, soql, queryAll=False, nested=True):
+    """Yield lists of records of the query page by page, client: IterClient
+
+    If nested, the incomplete child relationship results are completed before a page is yielded.
+    """
+    if queryAll:
+        qr = super(IterClient, client).queryAll(soql)
+    else:
+        qr = super(IterClient, client).query(soql)
+    while True:
+        records = qr[_tPartnerNS.records:]
+        if nested:
+            client.completeChildRecords(records)
+        yield records
+        if str(qr[_tPartnerNS.done]) == 'true':
+            break
+        qr = client.queryMore(str(qr[_tPartnerNS.queryLocator]))
+
+
+def bufferedPages(submit, pages, args, queueSize=16):
+    """Yield items of pages fetched by background workers through a queue of max `queueSize` pages.
+
+    For every arg of args, submit(run, arg) must call run(client, arg) on a worker
+    (like ClientPool.submit) and run consumes the iterator pages(client, arg) there.
+    Workers wait while the queue is full and stop when the consumer stops.
+    """
+    output = queue.Queue(queueSize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def run(client, arg):
+        try:
+            for page in pages(client, arg):
+                put(page)
+                if stop.is_set():
+                    break
+        except Exception as exc:
+            put(exc)
+        finally:
+            put(done)
+
+    try:
+        for arg in args:
+            submit(run, arg)
+        running = len(args)
+        while running:
+            item = output.get()
+            if item is done:
+                running -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                for record in item:
+                    yield record
+    finally:
+        stop.set()
+
+
+def queryPartitioned(client, soql, partitions=8, maxWorkers=4, field='Id', queueSize=16, pages=None,
+                     queryAll=False):
+    """Run the query in parallel by partitions of ranges of the field, yield records (unordered).
+
+    Every partition is a separate query/queryMore chain on a worker with its own
+    connection. Pages are passed through a queue of `queueSize` pages, so that workers
+    wait if the records are not consumed. pages(client, soql): an iterator of pages of
+    one partition, lists of records (or of other items, like rows), by default queryPages.
+    queryAll: queryAll is used by the partitioning and by the default pages.
+    """
+    if not isinstance(client, IterClient):
+        client = client.iterclient
+    if pages is None:
+        def pages(client, soql):
+            return queryPages(client, soql, queryAll)
+    conditions = partitionConditions(client, soql, partitions, field, queryAll)
+    soqls = [addCondition(soql, condition) if condition else soql for condition in conditions]
+    with ClientPool(client, maxWorkers) as pool:
+        for record in bufferedPages(pool.submit, pages, soqls, queueSize):
+            yield record
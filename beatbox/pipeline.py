@@ -0,0 +1,164 @@
+"""Streaming query -> transform -> DML pipelines with bounded queues."""
+import threading
+from collections import deque
+
+from beatbox._beatbox import _tSObjectNS, ElementRecord, IterClient, succeeded
+from beatbox.partition import bufferedPages, queryPages
+from beatbox.pool import ClientPool
+from beatbox.xmltramp import Element
+
+
+def prefetchQuery(client, soql, queryAll=False, queueSize=4):
+    """Yield records of the query while the next pages are fetched by a background thread.
+
+    client: IterClient, the thread uses its own clone. Max `queueSize` pages are
+    waiting for the consumer, then the thread waits. Incomplete child results
+    (subqueries) are completed before the records are yielded.
+    """
+    def pages(client, soql):
+        return queryPages(client, soql, queryAll)
+
+    def submit(run, soql):
+        thread = threading.Thread(target=run, args=(client.clone(), soql))
+        thread.daemon = True
+        thread.start()
+
+    return bufferedPages(submit, pages, [soql], queueSize)
+
+
+def recordId(record):
+    """The Id of a record for delete: an Id, a dict, a queried Element or ElementRecord"""
+    if isinstance(record, dict):
+        return record.get('Id') or record.get('id')
+    if isinstance(record, ElementRecord):
+        record = record.element
+    if isinstance(record, Element):
+        return str(record[_tSObjectNS.Id])
+    return record
+
+
+class Pipeline(object):
+    """Query source, transform stages and a DML sink connected by bounded queues.
+
+    The pages of the query are prefetched by a background thread, records pass
+    through the stages in the order they were added and the output of the last stage
+    is sent in chunks of `chunkLength` by `maxWorkers` concurrent DML calls. Max
+    `queueSize` pages and 2 * maxWorkers chunks are pending, so that a job runs
+    in constant memory and the query is paused if the writes are slower.
+
+    A `map` function returns the new record, or None to drop it. The records for
+    create/update/upsert are dicts like in Client.create, queried Elements or
+    ElementRecords, for delete they are Ids, dicts with Id or queried records.
+
+    >>> (Pipeline(svc)
+    ...     .query("SELECT Id FROM Task WHERE IsClosed = false AND ActivityDate < LAST_N_DAYS:30")
+    ...     .map(lambda rec: ElementRecord(rec, {'Status': 'Completed'}))
+    ...     .update()
+    ...     .run())
+    """
+    def __init__(self, client, chunkLength=200, maxWorkers=4, queueSize=4):
+        self.client = client if isinstance(client, IterClient) else client.iterclient
+        self.chunkLength = chunkLength
+        self.maxWorkers = maxWorkers
+        self.queueSize = queueSize
+        self.source = None
+        self.stages = []
+        self.sink = None
+
+    # sources
+
+    def query(self, soql, queryAll=False, partitions=None):
+        """Use query results as the source, by partitioned parallel queries if partitions > 1"""
+        if partitions and partitions > 1:
+            self.source = lambda: self.client.queryPartitioned(soql, partitions, self.maxWorkers, queryAll=queryAll)
+        else:
+            self.source = lambda: prefetchQuery(self.client, soql, queryAll, self.queueSize)
+        return self
+
+    def records(self, iterable):
+        """Use any iterable of records as the source"""
+        self.source = lambda: iter(iterable)
+        return self
+
+    # stages
+
+    def map(self, fn):
+        self.stages.append(fn)
+        return self
+
+    def filter(self, predicate):
+        self.stages.append(lambda record: record if predicate(record) else None)
+        return self
+
+    # sinks
+
+    def create(self):
+        self.sink = ('create', (), {})
+        return self
+
+    def update(self, coalesce=True):
+        """Update sink, the versions of a record with the same Id in one chunk are merged by coalesce"""
+        self.sink = ('update', (), {'coalesce': coalesce})
+        return self
+
+    def upsert(self, externalIdName, coalesce=True):
+        self.sink = ('upsert', (externalIdName,), {'coalesce': coalesce})
+        return self
+
+    def delete(self):
+        self.sink = ('delete', (), {})
+        return self
+
+    def undelete(self):
+        self.sink = ('undelete', (), {})
+        return self
+
+    def __iter__(self):
+        """Yield the output records of the stages (without the sink)"""
+        if self.source is None:
+            raise ValueError("The pipeline has no source")
+        for record in self.source():
+            for fn in self.stages:
+                record = fn(record)
+                if record is None:
+                    break
+            else:
+                yield record
+
+    def results(self):
+        """Run the pipeline, yield tuples (record, result of DML) in the order of records"""
+        if self.sink is None:
+            raise ValueError("The pipeline has no sink")
+        pending = deque()
+        with ClientPool(self.client, self.maxWorkers) as pool:
+            chunk = []
+            for record in self:
+                if self.sink[0] in ('delete', 'undelete'):
+                    record = recordId(record)
+                chunk.append(record)
+                if len(chunk) >= self.chunkLength:
+                    pending.append((chunk, pool.submit(self.save, chunk)))
+                    chunk = []
+                while pending and (pending[0][1].done() or len(pending) > 2 * self.maxWorkers):
+                    for item in self.chunkResults(pending.popleft()):
+                        yield item
+            if chunk:
+                pending.append((chunk, pool.submit(self.save, chunk)))
+            while pending:
+                for item in self.chunkResults(pending.popleft()):
+                    yield item
+
+    def run(self):
+        """Run the pipeline, returns the tuple (number of successes, number of failures)"""
+        counts = [0, 0]
+        for record, result in self.results():
+            counts[0 if succeeded(result) else 1] += 1
+        return tuple(counts)
+
+    def save(self, client, chunk):
+        (operation, args, kwargs) = self.sink
+        return list(getattr(client, operation)(*(args + (chunk,)), chunkLength=self.chunkLength, **kwargs))
+
+    def chunkResults(self, item):
+        (chunk, future) = item
+        return zip(chunk, future.result())
@@ -0,0 +1,45 @@
+"""Thread pool for parallel API calls, every worker thread uses its own connection."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ClientPool(object):
+    """Run functions on a pool of worker threads with a clone of the client per thread.
+
+    The submitted function gets the client of the worker thread as the first argument.
+
+    >>> with ClientPool(svc.iterclient, maxWorkers=4) as pool:
+    ...     futures = [pool.submit(lambda client, soql: list(client.query(soql)), soql) for soql in queries]
+    """
+    def __init__(self, client, maxWorkers=4):
+        self.client = client
+        self.maxWorkers = maxWorkers
+        self._executor = ThreadPoolExecutor(maxWorkers)
+        self._local = threading.local()
+
+    def threadClient(self):
+        """The client of the current worker thread."""
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.client.clone()
+        return client
+
+    def _call(self, fn, args, kwargs):
+        return fn(self.threadClient(), *args, **kwargs)
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(client, *args, **kwargs), returns a Future"""
+        return self._executor.submit(self._call, fn, args, kwargs)
+
+    def map(self, fn, *iterables):
+        """Like the builtin map(fn, *iterables) with the client as the first argument of fn, ordered"""
+        return self._executor.map(lambda *args: self._call(fn, args, {}), *iterables)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -0,0 +1,146 @@
+"""Local SQLite replica of sObjects, kept current by IncrementalSync."""
+import sqlite3
+from collections import OrderedDict
+
+from beatbox._beatbox import _tPartnerNS
+from beatbox.sync import IncrementalSync
+from beatbox.xmltramp import Element, islst
+
+_xsiNil = ('http://www.w3.org/2001/XMLSchema-instance', 'nil')
+
+# SQLite column types by the describe field type, other types are TEXT
+_columnTypes = {
+    'int': 'INTEGER',
+    'boolean': 'INTEGER',
+    'double': 'REAL',
+    'currency': 'REAL',
+    'percent': 'REAL',
+}
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _idCondition(id):
+    """SQL condition for an Id parameter, the table has 18 characters Ids from the API"""
+    if len(id) == 15:
+        # a range that can use the primary key, the suffix of Id is 3 characters [A-Z0-5]
+        return '"Id" > ?1 AND "Id" <= ?1 || \'ZZZ\''
+    return '"Id" = ?1'
+
+
+class DatabaseWatermarks(object):
+    """Watermarks for IncrementalSync in a table, the data are committed together with the watermark."""
+    def __init__(self, db):
+        self.db = db
+        self.db.execute('CREATE TABLE IF NOT EXISTS _watermarks (sObjectType TEXT PRIMARY KEY, timestamp TEXT)')
+
+    def get(self, sObjectType):
+        row = self.db.execute('SELECT timestamp FROM _watermarks WHERE sObjectType = ?', (sObjectType,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, sObjectType, timestamp):
+        self.db.execute('INSERT OR REPLACE INTO _watermarks VALUES (?, ?)', (sObjectType, timestamp))
+        self.db.commit()
+
+
+class Replica(object):
+    """Mirror of selected sObjects in a SQLite database.
+
+    objects: dict {sObjectType: list of field names or None for all fields}
+    Tables are named by the sObject type with columns by the fields in describeSObjects.
+    `refresh()` loads the changes since the last refresh, the watermarks are committed
+    in the same transaction as the data.
+
+    >>> replica = Replica(svc, 'replica.db', {'Account': ['Id', 'Name', 'Phone'], 'User': None})
+    >>> replica.refresh()
+    >>> replica.get('Account', accountId)['Name']
+    >>> replica.select('Account', 'Name LIKE ?', ('Acme%',))
+    """
+    def __init__(self, client, path, objects, maxWorkers=4):
+        self.client = client
+        self.maxWorkers = maxWorkers
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.watermarks = DatabaseWatermarks(self.db)
+        # sObjectType -> OrderedDict(lowercase name -> (name, describe type))
+        self.columns = {}
+        self._createTables(objects)
+        self.db.commit()
+
+    def _createTables(self, objects):
+        describes = self.client.describeSObjects(list(objects))
+        if not islst(describes):
+            describes = [describes]
+        for describe in describes:
+            sObjectType = str(describe[_tPartnerNS.name])
+            wanted = objects[sObjectType]
+            wanted = set(x.lower() for x in wanted) | set(['id']) if wanted is not None else None
+            columns = []
+            for field in describe[_tPartnerNS.fields:]:
+                name = str(field[_tPartnerNS.name])
+                if wanted is None or name.lower() in wanted:
+                    columns.append((name, str(field[_tPartnerNS.type])))
+            self.columns[sObjectType] = OrderedDict((name.lower(), (name, type)) for name, type in columns)
+            self.db.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(_quote(sObjectType), ', '.join(
+                '{} {}{}'.format(_quote(name), _columnTypes.get(type, 'TEXT'),
+                                 ' PRIMARY KEY' if name.lower() == 'id' else '')
+                for name, type in columns)))
+
+    def refresh(self):
+        """Load changes from the server by IncrementalSync."""
+        objects = dict((sObjectType, ', '.join(name for name, type in columns.values()))
+                       for sObjectType, columns in self.columns.items())
+        IncrementalSync(self.client, objects, self, self.watermarks, maxWorkers=self.maxWorkers).sync()
+
+    # local queries
+
+    def get(self, sObjectType, id):
+        """One record as a sqlite3.Row by Id or None"""
+        sql = 'SELECT * FROM {} WHERE {}'.format(_quote(sObjectType), _idCondition(id))
+        return self.db.execute(sql, (id,)).fetchone()
+
+    def select(self, sObjectType, where=None, params=(), fields='*'):
+        """List of rows (sqlite3.Row) by a SQL condition with `?` placeholders for params"""
+        sql = 'SELECT {} FROM {}'.format(fields, _quote(sObjectType))
+        if where:
+            sql += ' WHERE ' + where
+        return self.db.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        return self.db.execute(sql, params)
+
+    def close(self):
+        self.db.close()
+
+    # target interface for IncrementalSync
+
+    def upsert(self, sObjectType, records):
+        columns = self.columns[sObjectType]
+        rows = []
+        for record in records:
+            row = dict((name, None) for name, type in columns.values())
+            for el in record._dir:
+                if isinstance(el, Element) and el._name[1].lower() in columns:
+                    (name, type) = columns[el._name[1].lower()]
+                    row[name] = self._value(el, type)
+            rows.append(row)
+        names = [name for name, type in columns.values()]
+        sql = 'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(
+            _quote(sObjectType), ', '.join(_quote(x) for x in names), ', '.join('?' * len(names)))
+        self.db.executemany(sql, [[row[x] for x in names] for row in rows])
+
+    def delete(self, sObjectType, ids):
+        for id in ids:
+            self.db.execute('DELETE FROM {} WHERE {}'.format(_quote(sObjectType), _idCondition(id)), (id,))
+
+    def _value(self, el, type):
+        if el._attrs.get(_xsiNil) == 'true' or any(isinstance(x, Element) for x in el._dir):
+            return None
+        text = u''.join(el._dir)
+        if type == 'boolean':
+            return 1 if text == 'true' else 0
+        if type in _columnTypes and text:
+            return int(text) if type == 'int' else float(text)
+        return text
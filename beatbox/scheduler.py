@@ -0,0 +1,201 @@
+"""Scheduler of API requests by priority, max in-flight requests and the API request quota."""
+import errno
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+INTERACTIVE = 0
+BATCH = 1
+
+
+class RequestScheduler(object):
+    """Limit of concurrent requests and the rate of batch requests for one org.
+
+    Assign it to `client.scheduler` (clones of the client share it) and set
+    `client.priority` to INTERACTIVE or BATCH (default). Every request waits for
+    one of `maxInFlight` slots, interactive requests are served first.
+
+    Batch requests take tokens from a token bucket (max `burst` tokens). Its rate
+    is derived from the last LimitInfoHeader: the remaining API requests above the
+    reserve (a fraction of the limit) spread over `window` seconds, but at least
+    `minRate` per second to find out when the quota is available again. The rate
+    is unlimited until the usage is known. Interactive requests can use the reserve.
+
+    With `path` (a directory, one per org) the slots, the bucket and the usage are
+    shared by all processes that use the same path, by lock files (fcntl).
+
+    >>> svc.scheduler = RequestScheduler(maxInFlight=20, path=os.path.expanduser('~/.beatbox/' + orgId))
+    """
+    def __init__(self, maxInFlight=10, window=3600, reserve=0.1, minRate=1.0 / 60, burst=10, path=None):
+        if path is not None:
+            if fcntl is None:
+                raise RuntimeError("The path for sharing by processes requires fcntl, not available on this platform")
+            try:
+                os.makedirs(path)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+        self.maxInFlight = maxInFlight
+        self.window = window
+        self.reserve = reserve
+        self.minRate = minRate
+        self.burst = burst
+        self.path = path
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (priority, sequence number)
+        self._counter = itertools.count()
+        self._inFlight = 0
+        self._stateLock = threading.Lock()
+        self._state = {'tokens': burst, 'time': time.time(), 'current': None, 'limit': None}
+
+    @contextmanager
+    def slot(self, priority=None):
+        """Context of one request, waits for a token and for a free slot"""
+        lock = self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(lock)
+
+    def acquire(self, priority=None):
+        """Wait for a slot, returns a value for release()"""
+        if priority is None:
+            priority = BATCH
+        if priority != INTERACTIVE:
+            self.takeToken()
+        with self._cond:
+            entry = (priority, next(self._counter))
+            heapq.heappush(self._waiting, entry)
+            while self._waiting[0] != entry or self._inFlight >= self.maxInFlight:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._inFlight += 1
+            # the next waiter can get a slot too
+            self._cond.notify_all()
+        try:
+            return self._lockSlot() if self.path else None
+        except BaseException:
+            self.release(None)
+            raise
+
+    def tryAcquire(self, priority=None):
+        """Take a slot (and a token for batch) only if it is free now, returns (acquired, value for release())"""
+        if priority is None:
+            priority = BATCH
+        with self._cond:
+            if self._waiting or self._inFlight >= self.maxInFlight:
+                return False, None
+            if priority != INTERACTIVE and self._update(self._take):
+                return False, None
+            self._inFlight += 1
+        try:
+            lock = self._lockSlot(wait=False) if self.path else None
+        except BaseException:
+            self.release(None)
+            raise
+        if self.path and lock is None:
+            self.release(None)
+            return False, None
+        return True, lock
+
+    def release(self, lock):
+        if lock is not None:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            os.close(lock)
+        with self._cond:
+            self._inFlight -= 1
+            self._cond.notify_all()
+
+    def takeToken(self):
+        """Wait for a token of batch requests"""
+        while True:
+            wait = self._update(self._take)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def observe(self, current, limit):
+        """Update the usage of API requests from LimitInfoHeader"""
+        def update(state, now):
+            state['current'] = current
+            state['limit'] = limit
+        self._update(update)
+
+    def limitExceeded(self):
+        """The request limit is exceeded (REQUEST_LIMIT_EXCEEDED), only minRate is allowed"""
+        def update(state, now):
+            if state['limit'] is not None:
+                state['current'] = state['limit']
+            else:
+                state['current'] = state['limit'] = 0
+            state['tokens'] = min(state['tokens'], 0)
+        self._update(update)
+
+    def rate(self, state=None):
+        """Requests per second for batch requests, None is unlimited"""
+        if state is None:
+            state = self._state
+        if state['limit'] is None:
+            return None
+        remaining = state['limit'] * (1 - self.reserve) - state['current']
+        return max(self.minRate, float(remaining) / self.window)
+
+    def _take(self, state, now):
+        """Take a token from the state, returns 0 or the time to wait for a token"""
+        rate = self.rate(state)
+        if rate is None:
+            return 0
+        tokens = min(self.burst, state['tokens'] + max(0, now - state['time']) * rate)
+        state['time'] = now
+        if tokens >= 1:
+            state['tokens'] = tokens - 1
+            return 0
+        state['tokens'] = tokens
+        return (1 - tokens) / rate
+
+    def _update(self, fn):
+        """Call fn(state, now) with the state locked, shared by the state file if path is set"""
+        with self._stateLock:
+            if not self.path:
+                return fn(self._state, time.time())
+            fd = os.open(os.path.join(self.path, 'state.lock'), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                statePath = os.path.join(self.path, 'state.json')
+                if os.path.exists(statePath):
+                    with open(statePath) as f:
+                        self._state = json.load(f)
+                result = fn(self._state, time.time())
+                with open(statePath, 'w') as f:
+                    json.dump(self._state, f)
+                return result
+            finally:
+                os.close(fd)
+
+    def _lockSlot(self, wait=True):
+        """Lock one of maxInFlight slot files shared by processes, returns its descriptor
+
+        Without wait None is returned if all slots are locked.
+        """
+        while True:
+            for i in range(self.maxInFlight):
+                fd = os.open(os.path.join(self.path, 'slot{}.lock'.format(i)), os.O_RDWR | os.O_CREAT)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except (IOError, OSError) as exc:
+                    os.close(fd)
+                    if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+            if not wait:
+                return None
+            time.sleep(0.05)
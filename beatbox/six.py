@@ -12,6 +12,7 @@ if PY3:
     from builtins import range as xrange
     from io import StringIO
     from http import client as http_client
+    import queue
     from urllib.parse import urlparse
     from urllib.request import urlopen
     text_type = str
@@ -19,11 +20,12 @@ else:
     from __builtin__ import xrange
     from StringIO import StringIO
     import httplib as http_client
+    import Queue as queue
     from urlparse import urlparse
     from urllib2 import urlopen
     text_type = unicode  # NOQA
 
-__all__ = ('BytesIO', 'StringIO', 'xrange', 'http_client', 'urlparse', 'text_type', 'urlopen')
+__all__ = ('BytesIO', 'StringIO', 'xrange', 'http_client', 'queue', 'urlparse', 'text_type', 'urlopen')
 
 
 def python_2_unicode_compatible(klass):
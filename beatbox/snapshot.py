@@ -0,0 +1,155 @@
+"""Snapshots of last known records, used to update only the changed fields."""
+import datetime
+import numbers
+import re
+from collections import OrderedDict
+
+from beatbox._beatbox import valueToString
+from beatbox.xmltramp import Element, islst
+
+_xsiNil = ('http://www.w3.org/2001/XMLSchema-instance', 'nil')
+_datetimeRe = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?(?:Z|([+-])(\d\d):?(\d\d))?$')
+
+
+def recordKey(id):
+    """The 15 characters Id is a unique key also for 18 characters Id"""
+    return str(id)[:15]
+
+
+def _datetimeText(value):
+    """Datetime as the API returns it, in UTC with milliseconds, naive datetime is UTC"""
+    if value.utcoffset() is not None:
+        value = (value - value.utcoffset()).replace(tzinfo=None)
+    return '%04d-%02d-%02dT%02d:%02d:%02d.%03dZ' % (value.year, value.month, value.day, value.hour, value.minute,
+                                                    value.second, value.microsecond // 1000)
+
+
+def _normalDatetime(text):
+    """Datetime text in the form of _datetimeText, other text unchanged"""
+    m = _datetimeRe.match(text)
+    if not m:
+        return text
+    (year, month, day, hour, minute, second, fraction, sign, offsetHours, offsetMinutes) = m.groups()
+    value = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                              int((fraction or '0')[:6].ljust(6, '0')))
+    if sign:
+        offset = datetime.timedelta(hours=int(offsetHours), minutes=int(offsetMinutes))
+        value = value - offset if sign == '+' else value + offset
+    return _datetimeText(value)
+
+
+class Snapshots(object):
+    """Last known field values of records by Id.
+
+    Records are remembered from `query`/`retrieve` results (Element) or from sent
+    dicts. `changes()` returns a dict with only the fields that differ from the
+    snapshot, to be used by `IterClient.update(..., snapshots=snapshots)`.
+
+    >>> snapshots = Snapshots()
+    >>> accounts = list(snapshots.track(svc.query("SELECT Id, Name, Phone FROM Account")))
+    >>> results = list(svc.update(updatedAccountDicts, snapshots=snapshots))
+    """
+    def __init__(self):
+        # recordKey -> {lowercase field name: text value or None}
+        self._records = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, id):
+        return recordKey(id) in self._records
+
+    def remember(self, records):
+        """Remember the values of a record or a list of records (Element or dict)."""
+        if islst(records):
+            for record in records:
+                self.remember(record)
+            return
+        values = self._values(records)
+        id = values.pop('id', None)
+        if id:
+            self._records.setdefault(recordKey(id), {}).update(values)
+
+    def forget(self, id):
+        self._records.pop(recordKey(id), None)
+
+    def track(self, records):
+        """Remember records of an iterable (e.g. `IterClient.query`) while yielding them."""
+        for record in records:
+            self.remember(record)
+            yield record
+
+    def changes(self, sObject):
+        """A copy of sObject dict only with changed fields, or None if nothing changed.
+
+        Records that are not in snapshots are returned unchanged.
+        """
+        if not isinstance(sObject, dict):
+            raise TypeError("Snapshots.changes requires an sObject dict, not {}".format(type(sObject).__name__))
+        id = sObject.get('Id') or sObject.get('id')
+        snapshot = self._records.get(recordKey(id)) if id else None
+        if snapshot is None:
+            return sObject
+        changed = OrderedDict()
+        for fn, value in sObject.items():
+            key = fn.lower()
+            if key == 'fieldstonull':
+                # a field that is not in the snapshot is unknown, not null
+                nulls = [x for x in ([value] if not islst(value) else value)
+                         if x.lower() not in snapshot or snapshot[x.lower()] is not None]
+                if nulls:
+                    changed[fn] = nulls
+            elif key in ('type', 'id') or isinstance(value, dict):
+                continue
+            elif key not in snapshot or not self._same(value, snapshot[key]):
+                changed[fn] = value
+        if not changed:
+            return None
+        result = OrderedDict((fn, sObject[fn]) for fn in sObject if fn.lower() in ('type', 'id'))
+        result.update(changed)
+        return result
+
+    def _value(self, value):
+        """The text of a sent value as the API returns it"""
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, datetime.datetime):
+            return _datetimeText(value)
+        return valueToString(value)
+
+    def _same(self, value, text):
+        """Is the Python value equal to the text of the snapshot?"""
+        if value is None or text is None:
+            return value is None and text is None
+        if isinstance(value, bool):
+            return text.lower() == ('true' if value else 'false')
+        if isinstance(value, numbers.Number):
+            try:
+                return float(text) == float(value)
+            except ValueError:
+                return False
+        if isinstance(value, datetime.datetime):
+            return _normalDatetime(text) == _datetimeText(value)
+        return valueToString(value) == text
+
+    def _values(self, record):
+        values = {}
+        if isinstance(record, Element):
+            for el in record._dir:
+                if not isinstance(el, Element) or any(isinstance(x, Element) for x in el._dir):
+                    continue  # text or a related record
+                if el._attrs.get(_xsiNil) == 'true':
+                    values[el._name[1].lower()] = None
+                else:
+                    values[el._name[1].lower()] = u''.join(el._dir)
+        else:
+            for fn, value in record.items():
+                if fn.lower() == 'fieldstonull':
+                    for x in ([value] if not islst(value) else value):
+                        values[x.lower()] = None
+                elif not isinstance(value, dict):
+                    values[fn.lower()] = self._value(value)
+        values.pop('type', None)
+        return values
@@ -0,0 +1,145 @@
+"""Incremental replication of sObjects by getUpdated/getDeleted with persistent watermarks."""
+import datetime
+import json
+import os
+
+from beatbox._beatbox import _tPartnerNS, SoapFaultError
+from beatbox.pool import ClientPool
+from beatbox.xmltramp import islst
+
+_timestampFormat = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def parseTimestamp(s):
+    """Parse a dateTime from the API (e.g. '2016-06-30T21:22:23.000Z') to a naive UTC datetime"""
+    return datetime.datetime.strptime(str(s)[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+def formatTimestamp(d):
+    return d.strftime(_timestampFormat)
+
+
+def replaceFile(src, dst):
+    """Rename src to dst, atomically if the platform can do it"""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+class WatermarkFile(object):
+    """Watermarks by sObject type stored in a JSON file, the file is replaced atomically."""
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as f:
+                self._data = json.load(f)
+        else:
+            self._data = {}
+
+    def get(self, sObjectType):
+        return self._data.get(sObjectType)
+
+    def set(self, sObjectType, timestamp):
+        self._data[sObjectType] = timestamp
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._data, f, indent=1, sort_keys=True)
+        replaceFile(tmp, self.path)
+
+
+class IncrementalSync(object):
+    """Replicate sObjects to a target by changes since the last committed watermark.
+
+    objects: dict {sObjectType: fields}, fields are like in `Client.retrieve`
+    target: an object with methods `upsert(sObjectType, records)` (records are
+        Elements like from `retrieve`) and `delete(sObjectType, ids)`
+    watermarks: e.g. WatermarkFile, with methods `get(sObjectType)` and `set(sObjectType, timestamp)`
+
+    An sObject without a watermark is loaded completely by a query. Then only the ids
+    from `getUpdated` and `getDeleted` are processed, in windows of max `maxSpan`,
+    and the changed records are retrieved by parallel batched `retrieve` calls.
+    The watermark is set after every window has been applied to the target, so that
+    an interrupted sync continues from the last finished window.
+
+    >>> sync = IncrementalSync(svc, {'Account': 'Id, Name, Phone'}, target, WatermarkFile('sync.json'))
+    >>> sync.sync()
+    """
+    # The span of getUpdated/getDeleted is never shortened below this, even by EXCEEDED_ID_LIMIT
+    minSpan = datetime.timedelta(minutes=1)
+
+    def __init__(self, client, objects, target, watermarks, maxSpan=datetime.timedelta(days=1),
+                 maxWorkers=4, chunkLength=2000):
+        self.client = client.iterclient
+        self.objects = objects
+        self.target = target
+        self.watermarks = watermarks
+        self.maxSpan = maxSpan
+        self.maxWorkers = maxWorkers
+        self.chunkLength = chunkLength
+
+    def sync(self):
+        """Synchronize all objects up to the current server time."""
+        with ClientPool(self.client, self.maxWorkers) as pool:
+            for sObjectType in self.objects:
+                self.syncObject(sObjectType, pool)
+
+    def syncObject(self, sObjectType, pool):
+        end = parseTimestamp(self.client.getServerTimestamp())
+        watermark = self.watermarks.get(sObjectType)
+        if watermark is None:
+            self.fullLoad(sObjectType, end)
+            return
+        start = parseTimestamp(watermark)
+        span = self.maxSpan
+        while end - start >= self.minSpan:
+            windowEnd = min(start + span, end)
+            try:
+                covered = self.syncWindow(sObjectType, start, windowEnd, pool)
+            except SoapFaultError as exc:
+                if exc.faultCode == 'EXCEEDED_ID_LIMIT' and span / 2 >= self.minSpan:
+                    span = span / 2
+                    continue
+                raise
+            if covered <= start:
+                break
+            self.watermarks.set(sObjectType, formatTimestamp(covered))
+            start = covered
+
+    def syncWindow(self, sObjectType, start, end, pool):
+        """Apply changes between start and end to the target, returns the latest date covered."""
+        updated = self.client.getUpdated(sObjectType, formatTimestamp(start), formatTimestamp(end))
+        deleted = self.client.getDeleted(sObjectType, formatTimestamp(start), formatTimestamp(end))
+        ids = [str(x) for x in updated[_tPartnerNS.ids:]]
+        fields = self.objects[sObjectType]
+        chunks = [ids[i:i + self.chunkLength] for i in range(0, len(ids), self.chunkLength)]
+        for records in pool.map(lambda client, chunk: self.retrieve(client, fields, sObjectType, chunk), chunks):
+            # deleted records are retrieved as empty elements
+            records = [x for x in records if len(x)]
+            if records:
+                self.target.upsert(sObjectType, records)
+        deletedIds = [str(x[_tPartnerNS.id]) for x in deleted[_tPartnerNS.deletedRecords:]]
+        if deletedIds:
+            self.target.delete(sObjectType, deletedIds)
+        return min(parseTimestamp(updated[_tPartnerNS.latestDateCovered]),
+                   parseTimestamp(deleted[_tPartnerNS.latestDateCovered]))
+
+    def retrieve(self, client, fields, sObjectType, ids):
+        records = client.retrieve(fields, sObjectType, ids, chunkLength=self.chunkLength)
+        return list(records)
+
+    def fullLoad(self, sObjectType, timestamp):
+        """Load all records of the object by a query and set the watermark to timestamp"""
+        fields = self.objects[sObjectType]
+        soql = "SELECT {} FROM {}".format(', '.join(fields) if islst(fields) else fields, sObjectType)
+        chunk = []
+        for record in self.client.query(soql):
+            chunk.append(record)
+            if len(chunk) >= self.chunkLength:
+                self.target.upsert(sObjectType, chunk)
+                chunk = []
+        if chunk:
+            self.target.upsert(sObjectType, chunk)
+        self.watermarks.set(sObjectType, formatTimestamp(timestamp))
@@ -0,0 +1,48 @@
+"""Helpers shared by the tests: fake http connections and clients with a session."""
+import beatbox
+from beatbox.six import BytesIO
+
+serverUrl = 'https://localhost/services/Soap/u/36.0'
+
+
+class FakeResponse(object):
+    status = 200
+    reason = 'OK'
+
+    def __init__(self, body):
+        self.body = BytesIO(body)
+
+    def read(self, amt=None):
+        return self.body.read(amt)
+
+    def getheader(self, name, default=None):
+        return default
+
+
+class FakeConnection(object):
+    """Connection that returns the same response for every request"""
+    def __init__(self, body):
+        self.body = body
+        self.requests = []
+
+    def request(self, method, url, body, headers):
+        self.requests.append(body)
+
+    def getresponse(self):
+        return FakeResponse(self.body)
+
+    def close(self):
+        pass
+
+
+def fakeClient(conn, cls=beatbox.Client):
+    """Client (or IterClient) with a session that sends the requests to the fake connection"""
+    client = cls()
+    client.useSession('sid', serverUrl)
+    client._Client__conn = conn
+    return client
+
+
+def iterClient(stub):
+    """IterClient class that calls the methods of the stub, a Client subclass with faked calls"""
+    return type('Iter' + stub.__name__, (beatbox.IterClient, stub), {})
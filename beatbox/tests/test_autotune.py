@@ -0,0 +1,69 @@
+import unittest
+
+import beatbox
+from beatbox.autotune import BatchTuner
+from beatbox.tests import iterClient
+from beatbox.xmltramp import parse
+
+
+class SaveStub(beatbox.Client):
+    def update(self, sObjects):
+        self.chunks.append(len(sObjects))
+        results = [parse('<result xmlns="urn:partner.soap.sforce.com"><success>true</success></result>')
+                   for o in sObjects]
+        return results if len(results) > 1 else results[0]
+
+
+FakeClient = iterClient(SaveStub)
+
+
+class TestBatchTuner(unittest.TestCase):
+
+    def test_climb(self):
+        # throughput is best by the size 400, the seconds per call are simulated
+        tuner = BatchTuner(queryBounds=(100, 1000), factor=2, samples=1)
+        key = ('query', 'Account')
+        sizes = []
+        for i in range(12):
+            size = tuner.size(key)
+            sizes.append(size)
+            tuner.observe(key, size, size, 1.0 + abs(size - 400) * size / 40000.0)
+        self.assertEqual(sizes[:6], [550, 1000, 500, 250, 500, 1000])
+        self.assertEqual(tuner.sizes(), {key: tuner.size(key)})
+        # an outdated size does not change the state
+        size = tuner.size(key)
+        tuner.observe(key, 1, 1, 100.0)
+        self.assertEqual(tuner.size(key), size)
+
+    def test_maxBytes(self):
+        tuner = BatchTuner(dmlBounds=(10, 200), samples=1, maxBytes=5000)
+        key = ('update', 'Contact')
+        tuner.observe(key, 105, 105, 1.0, 105 * 100)
+        self.assertEqual(tuner.size(key), 50)
+
+    def test_chunks(self):
+        client = FakeClient()
+        client.chunks = []
+        client.tuner = BatchTuner(dmlBounds=(2, 10), samples=1)
+        records = [{'type': 'Contact', 'Id': '003%012d' % i} for i in range(30)]
+        self.assertEqual(len(list(client.update(records))), 30)
+        self.assertEqual(client.chunks[:2], [6, 9])
+        self.assertEqual(sum(client.chunks), 30)
+        self.assertIn(('update', 'Contact'), client.tuner.sizes())
+        client.chunks = []
+        list(client.update(records, chunkLength=15))
+        self.assertEqual(client.chunks, [15, 15])
+
+    def test_maxChunkBytes(self):
+        client = FakeClient()
+        client.chunks = []
+        client.tuner = BatchTuner(dmlBounds=(2, 10), samples=1)
+        records = [{'type': 'Contact', 'Id': '003%012d' % i} for i in range(30)]
+        # the tuned length is capped by the serialized size
+        client.maxChunkBytes = 3 * beatbox._beatbox.serializedSize(records[0])
+        self.assertEqual(len(list(client.update(records))), 30)
+        self.assertEqual(max(client.chunks), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
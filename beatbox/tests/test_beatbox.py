@@ -1,10 +1,18 @@
 import unittest
+import base64
 import datetime
+import errno
 import gzip
+import mmap
+import socket
 
 import beatbox
 from beatbox import xmltramp
-from beatbox.six import BytesIO
+from beatbox._beatbox import readResponse, spoolDecompress
+from beatbox.partition import queryPages
+from beatbox.scheduler import RequestScheduler
+from beatbox.six import BytesIO, http_client
+from beatbox.tests import FakeConnection, FakeResponse, fakeClient, iterClient
 
 
 class TestXmlWriter(unittest.TestCase):
@@ -74,6 +82,8 @@ class TestXmlWriter(unittest.TestCase):
         xml = gz.read()
         self.assertEqual(b'<?xml version="1.0" encoding="utf-8"?>\n'
                          b'<q:root xmlns:q="urn:test"><q:child>text</q:child></q:root>', xml)
+        # the size is counted before compression
+        self.assertEqual(w.size, len(xml))
 
 
 soapEnvElement = (
@@ -129,5 +139,471 @@ class TestSoapEnvelope(unittest.TestCase):
             b'</s:Body></s:Envelope>', env)
 
 
+limitTemplate = (
+    b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"'
+    b' xmlns="urn:partner.soap.sforce.com"><soapenv:Header><LimitInfoHeader><limitInfo><current>%d</current>'
+    b'<limit>15000</limit><type>API REQUESTS</type></limitInfo></LimitInfoHeader></soapenv:Header>'
+    b'<soapenv:Body><getUserInfoResponse><result><userName>bob</userName></result></getUserInfoResponse>'
+    b'</soapenv:Body></soapenv:Envelope>')
+
+
+def limitResponse(current):
+    """getUserInfo response with the API usage current (formatting of bytes by % is not in py34)"""
+    return limitTemplate.replace(b'%d', str(current).encode('ascii'))
+
+
+queryResponse = (
+    b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"'
+    b' xmlns="urn:partner.soap.sforce.com" xmlns:sf="urn:sobject.partner.soap.sforce.com"'
+    b' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><soapenv:Body><queryResponse><result>'
+    b'<done>true</done><queryLocator xsi:nil="true"/>'
+    b'<records xsi:type="sf:sObject"><sf:type>Account</sf:type><sf:Id>001A</sf:Id></records>'
+    b'<records xsi:type="sf:sObject"><sf:type>Account</sf:type><sf:Id>001B</sf:Id></records>'
+    b'<size>2</size></result></queryResponse></soapenv:Body></soapenv:Envelope>')
+
+
+class TestResponseHeaders(unittest.TestCase):
+
+    def test_limitInfo(self):
+        client = fakeClient(FakeConnection(limitResponse(5)))
+        self.assertIsNone(client.apiUsage())
+        self.assertEqual(str(client.getUserInfo()[beatbox._tPartnerNS.userName]), 'bob')
+        self.assertEqual(client.apiUsage(), (5, 15000))
+        clone = client.clone()
+        clone._Client__conn = FakeConnection(limitResponse(7))
+        clone.getUserInfo()
+        self.assertEqual(client.limitInfo, {'API REQUESTS': (7, 15000)})
+
+    def test_compactXml(self):
+        client = fakeClient(FakeConnection(limitResponse(5)))
+        client.compactXml = True
+        result = client.getUserInfo()
+        self.assertTrue(isinstance(result, xmltramp.CompactElement))
+        self.assertEqual(str(result[beatbox._tPartnerNS.userName]), 'bob')
+        self.assertEqual(client.apiUsage(), (5, 15000))
+
+    def test_lazyRecords(self):
+        client = fakeClient(FakeConnection(queryResponse))
+        client.lazyRecords = True
+        records = client.query("SELECT Id FROM Account")[beatbox._tPartnerNS.records:]
+        self.assertTrue(all(isinstance(x, xmltramp.LazyElement) for x in records))
+        self.assertEqual([str(x[beatbox._tSObjectNS.Id]) for x in records], ['001A', '001B'])
+
+    def test_lazyIterRecords(self):
+        client = fakeClient(FakeConnection(queryResponse), beatbox.IterClient)
+        client.lazyRecords = True
+        records = list(client.query("SELECT Id FROM Account"))
+        # the search for child query results does not parse the records
+        self.assertFalse(any('_dir' in vars(x) for x in records))
+        self.assertEqual(str(records[0][beatbox._tSObjectNS.Id]), '001A')
+        self.assertTrue('_dir' in vars(records[0]))
+        client.lazyRecords = False
+        client.compactXml = True
+        records = list(client.query("SELECT Id FROM Account"))
+        self.assertFalse(any('_dir' in vars(x) for x in records))
+
+    def test_lastCallBytes(self):
+        conn = FakeConnection(limitResponse(5))
+        client = fakeClient(conn)
+        gzipRequest = beatbox.gzipRequest
+        beatbox.gzipRequest = True
+        try:
+            client.getUserInfo()
+        finally:
+            beatbox.gzipRequest = gzipRequest
+        # the request is gzipped, the size before compression is measured
+        request = gzip.GzipFile(fileobj=BytesIO(conn.requests[0])).read()
+        self.assertEqual(client.lastCallBytes, (len(request), len(limitResponse(5))))
+
+    def test_scheduler(self):
+        client = fakeClient(FakeConnection(limitResponse(9)))
+        client.scheduler = RequestScheduler()
+        client.getUserInfo()
+        self.assertEqual((client.scheduler._state['current'], client.scheduler._state['limit']), (9, 15000))
+        self.assertEqual(client.scheduler._inFlight, 0)
+
+
+class GzipResponse(FakeResponse):
+    def __init__(self, body):
+        super(GzipResponse, self).__init__(gzipBytes(body))
+
+    def getheader(self, name, default=None):
+        return 'gzip' if name == 'content-encoding' else default
+
+
+class GzipConnection(FakeConnection):
+    def getresponse(self):
+        return GzipResponse(self.body)
+
+
+def gzipBytes(data):
+    buf = BytesIO()
+    f = gzip.GzipFile(mode='wb', fileobj=buf)
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+class TestSpool(unittest.TestCase):
+
+    def test_spoolDecompress(self):
+        data = queryResponse * 3
+        self.assertEqual(spoolDecompress(gzipBytes(data), True, len(data)), data)
+        spooled = spoolDecompress(gzipBytes(data), True, 100)
+        self.assertTrue(isinstance(spooled, mmap.mmap))
+        self.assertEqual(spooled[:], data)
+        raw = readResponse(FakeResponse(data), 100)
+        self.assertFalse(isinstance(raw, bytes))
+        self.assertEqual(spoolDecompress(raw, False, 100)[:], data)
+        self.assertEqual(readResponse(FakeResponse(data), len(data)), data)
+
+    def test_client(self):
+        client = fakeClient(GzipConnection(queryResponse))
+        client.spoolThreshold = 100
+        client.lazyRecords = True
+        records = client.query("SELECT Id FROM Account")[beatbox._tPartnerNS.records:]
+        self.assertTrue(isinstance(records[0]._raw, mmap.mmap))
+        self.assertEqual([str(x[beatbox._tSObjectNS.Id]) for x in records], ['001A', '001B'])
+        client.lazyRecords = False
+        self.assertEqual(str(client.query("SELECT Id FROM Account")[beatbox._tPartnerNS.size]), '2')
+        self.assertEqual(client.lastCallBytes[1], len(queryResponse))
+
+    def test_close(self):
+        spools = []
+        maps = []
+        temporaryFile = beatbox._beatbox.tempfile.TemporaryFile
+        _mmap = beatbox._beatbox._mmap
+
+        def spool():
+            spools.append(temporaryFile())
+            return spools[-1]
+
+        def memoryMap(spool):
+            maps.append(_mmap(spool))
+            return maps[-1]
+        beatbox._beatbox.tempfile.TemporaryFile = spool
+        beatbox._beatbox._mmap = memoryMap
+        try:
+            client = fakeClient(UnavailableConnection(queryResponse))
+            client.spoolThreshold = 100
+            client.retry = None
+            self.assertRaises(http_client.HTTPException, client.query, "SELECT Id FROM Account")
+            fault = queryResponse.split(b'<queryResponse>')[0] + (
+                b'<soapenv:Fault><faultcode>sf:INVALID_FIELD</faultcode><faultstring>' + b'x' * 200 +
+                b'</faultstring></soapenv:Fault></soapenv:Body></soapenv:Envelope>')
+            client._Client__conn = FakeConnection(fault)
+            self.assertRaises(beatbox.SoapFaultError, client.query, "SELECT Id FROM Account")
+        finally:
+            beatbox._beatbox.tempfile.TemporaryFile = temporaryFile
+            beatbox._beatbox._mmap = _mmap
+        # the spool of the 503 response and the map of the fault are closed
+        self.assertEqual(len(spools), 2)
+        self.assertTrue(all(f.closed for f in spools))
+        self.assertEqual(len(maps), 1)
+        # mmap.closed is not in Python 2.7, a closed map raises ValueError
+        self.assertRaises(ValueError, maps[0].read, 1)
+
+
+class UnavailableResponse(FakeResponse):
+    status = 503
+    reason = 'Service Unavailable'
+
+
+class UnavailableConnection(FakeConnection):
+    def getresponse(self):
+        return UnavailableResponse(self.body)
+
+
+class NoHedging(object):
+    """HedgingPolicy that fails if a call is hedged"""
+    operations = frozenset(['retrieve'])
+
+    def post(self, request, conn, alwaysReturnList=False, retry=None):
+        raise AssertionError("hedged")
+
+
+class ClosedBytesIO(BytesIO):
+    """BytesIO that keeps its value after close"""
+    def close(self):
+        self.value = self.getvalue()
+        BytesIO.close(self)
+
+
+class TestBase64Streams(unittest.TestCase):
+
+    data = bytes(bytearray(range(256))) * 1000
+
+    def client(self, body):
+        client = fakeClient(FakeConnection(body))
+        client.compression = beatbox.CompressionPolicy(threshold=10 ** 9)
+        return client
+
+    def test_retrieve(self):
+        encoded = base64.encodestring if str is bytes else base64.encodebytes
+        record = (b'<result xsi:type="sf:sObject"><sf:type>Account</sf:type><sf:Id>%s</sf:Id><sf:Body>' +
+                  encoded(self.data) + b'</sf:Body></result>')
+        body = queryResponse.split(b'<queryResponse>')[0] + (
+            b'<retrieveResponse>' + record.replace(b'%s', b'001A') + record.replace(b'%s', b'001B') +
+            b'</retrieveResponse></soapenv:Body></soapenv:Envelope>')
+        client = self.client(body)
+        files = {}
+
+        def factory(record, field):
+            files[str(record[beatbox._tSObjectNS.Id])] = ClosedBytesIO()
+            return files[str(record[beatbox._tSObjectNS.Id])]
+        client.base64Streams = {'Account.Body': factory}
+        client.hedging = NoHedging()
+        results = client.retrieve('Id, Body', 'Account', ['001A', '001B'])
+        self.assertEqual(sorted(files), ['001A', '001B'])
+        self.assertEqual(files['001B'].value, self.data)
+        self.assertEqual(len(results[0][beatbox._tSObjectNS.Body]), 0)
+
+    def test_create(self):
+        client = self.client(limitResponse(1))
+        f = BytesIO(b'xx' + self.data)
+        f.read(2)
+        client.create({'type': 'Attachment', 'Name': 'a.bin', 'Body': f})
+        request = client._Client__conn.requests[0]
+        self.assertIn(b'<o:Body>' + base64.b64encode(self.data) + b'</o:Body>', request)
+        self.assertEqual(f.tell(), 2)
+        size = beatbox._beatbox.serializedSize({'type': 'Attachment', 'Body': f})
+        encoded = base64.b64encode(self.data).decode()
+        self.assertEqual(size, beatbox._beatbox.serializedSize({'type': 'Attachment', 'Body': encoded}))
+
+
+def dmlResponse(*results):
+    return (b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"'
+            b' xmlns="urn:partner.soap.sforce.com"><soapenv:Body><createResponse>' + b''.join(results) +
+            b'</createResponse></soapenv:Body></soapenv:Envelope>')
+
+
+okResult = b'<result><id>001A</id><success>true</success></result>'
+errorResult = (b'<result><errors><fields>Name</fields><message>Required fields are missing: [Name]</message>'
+               b'<statusCode>REQUIRED_FIELD_MISSING</statusCode></errors><id xsi:nil="true" '
+               b'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"/><success>false</success></result>')
+
+
+class TestDmlResults(unittest.TestCase):
+
+    def client(self, body, cls=beatbox.Client):
+        client = fakeClient(FakeConnection(body), cls)
+        client.compactResults = True
+        return client
+
+    def test_decode(self):
+        client = self.client(dmlResponse(okResult, errorResult, errorResult))
+        results = client.create([{'type': 'Account'}] * 3)
+        self.assertTrue(isinstance(results, beatbox.DmlResults))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], (u'001A', True, None, ()))
+        self.assertEqual(results[1].errors, ((u'REQUIRED_FIELD_MISSING', u'Required fields are missing: [Name]',
+                                              (u'Name',)),))
+        self.assertEqual(results.failed(), [1, 2])
+        self.assertEqual(results.succeeded(), [0])
+        self.assertEqual(results.errorCounts(), {u'REQUIRED_FIELD_MISSING': 2})
+        results.extend(client.create([{'type': 'Account'}] * 3))
+        self.assertEqual(results.errorsByCode(), {u'REQUIRED_FIELD_MISSING': [1, 2, 4, 5]})
+        self.assertEqual(results[-1].id, None)
+        # a single result is also returned as DmlResults
+        self.assertEqual(list(self.client(dmlResponse(okResult)).delete('001A')), [(u'001A', True, None, ())])
+
+    def test_iterClient(self):
+        client = self.client(dmlResponse(okResult), beatbox.IterClient)
+        results = list(client.create([{'type': 'Account'}] * 2, chunkLength=1))
+        self.assertEqual([r.success for r in results], [True, True])
+        self.assertTrue(all(isinstance(r, beatbox.DmlResult) and beatbox.succeeded(r) for r in results))
+
+
+class FlakyConnection(FakeConnection):
+    """Connection that fails the first requests by sending or by receiving"""
+    def __init__(self, body, sendErrors=0, receiveErrors=0):
+        super(FlakyConnection, self).__init__(body)
+        self.sendErrors = sendErrors
+        self.receiveErrors = receiveErrors
+
+    def request(self, method, url, body, headers):
+        if self.sendErrors:
+            self.sendErrors -= 1
+            raise socket.error(errno.EPIPE, 'Broken pipe')
+        super(FlakyConnection, self).request(method, url, body, headers)
+
+    def getresponse(self):
+        if self.receiveErrors:
+            self.receiveErrors -= 1
+            raise http_client.BadStatusLine('')
+        return super(FlakyConnection, self).getresponse()
+
+
+class TestRetry(unittest.TestCase):
+
+    def client(self, conn):
+        client = fakeClient(conn)
+        client.retry = beatbox.RetryPolicy(maxAttempts=3, initialDelay=0)
+        return client
+
+    def test_idempotent(self):
+        conn = FlakyConnection(limitResponse(1), sendErrors=1, receiveErrors=1)
+        self.assertEqual(str(self.client(conn).getUserInfo()[beatbox._tPartnerNS.userName]), 'bob')
+        self.assertEqual(len(conn.requests), 2)
+
+    def test_dml(self):
+        conn = FlakyConnection(limitResponse(1), sendErrors=1)
+        client = self.client(conn)
+        client.update({'type': 'Account', 'Id': '001000000000001'})
+        self.assertEqual(len(conn.requests), 1)
+        conn.receiveErrors = 1
+        # the request could be processed, it is not sent again
+        self.assertRaises(http_client.BadStatusLine, client.update, {'type': 'Account', 'Id': '001000000000001'})
+        self.assertEqual(len(conn.requests), 2)
+
+    def test_maxAttempts(self):
+        conn = FlakyConnection(limitResponse(1), receiveErrors=3)
+        self.assertRaises(http_client.BadStatusLine, self.client(conn).getUserInfo)
+        self.assertEqual(len(conn.requests), 3)
+
+
+class TestCompressionPolicy(unittest.TestCase):
+
+    data = b'<sObjects><type>Account</type><Name>Acme</Name></sObjects>' * 100
+
+    def test_threshold(self):
+        policy = beatbox.CompressionPolicy(threshold=1000, level=1)
+        self.assertEqual(policy.compress(self.data[:999]), (self.data[:999], False))
+        (body, compressed) = policy.compress(self.data)
+        self.assertTrue(compressed)
+        self.assertEqual(gzip.GzipFile(fileobj=BytesIO(body)).read(), self.data)
+
+    def test_auto(self):
+        policy = beatbox.CompressionPolicy(threshold=0, auto=True, bandwidth=1e15)
+        for i in range(3):
+            policy.compress(self.data)
+        self.assertEqual(sorted(policy.stats), [0, 1, 6, 9])
+        policy.stats = {0: [0.0, 1.0], 1: [1e-9, 0.2], 6: [2e-9, 0.15], 9: [5e-9, 0.14]}
+        # compression can not save time on a so fast network
+        self.assertEqual(policy.compress(self.data), (self.data, False))
+        policy.bandwidth = 1e3
+        self.assertEqual(policy.chooseLevel(), 9)
+
+    def test_client(self):
+        conn = FakeConnection(limitResponse(1))
+        client = fakeClient(conn)
+        client.compression = beatbox.CompressionPolicy(threshold=100000)
+        client.getUserInfo()
+        self.assertTrue(conn.requests[0].startswith(b'<?xml'))
+        self.assertEqual(client.lastCallBytes[0], len(conn.requests[0]))
+
+
+class TestChunkRequests(unittest.TestCase):
+
+    def test_serializedSize(self):
+        self.assertEqual(beatbox._beatbox.serializedSize({'type': 'Account', 'Name': 'x'}),
+                         len(b'<p:sObjects><o:type>Account</o:type><o:Name>x</o:Name></p:sObjects>'))
+
+    def test_chunkLength(self):
+        client = beatbox.IterClient()
+        self.assertEqual(list(client.chunkRequests([1, 2, 3], 2)), [[1, 2], [3]])
+        self.assertEqual(list(client.chunkRequests('a', 2)), [['a']])
+
+    def test_maxBytes(self):
+        client = beatbox.IterClient()
+        small = {'type': 'Account', 'Name': 'x'}
+        big = {'type': 'Account', 'Description': 'x' * 1000}
+        chunks = list(client.chunkRequests([small, small, big, small, small, small, small], 3, maxBytes=1200))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 3])
+        client.maxChunkBytes = 10
+        self.assertEqual([len(chunk) for chunk in client.chunkRequests([small, small])], [1, 1])
+
+
+class TestElementRecord(unittest.TestCase):
+
+    record = ('<records xmlns:sf="urn:sobject.partner.soap.sforce.com"'
+              ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+              '<sf:type>Task</sf:type><sf:Id>00T000000000001AAA</sf:Id><sf:Id>00T000000000001AAA</sf:Id>'
+              '<sf:Subject>Call</sf:Subject><sf:Status>Open</sf:Status><sf:Description xsi:nil="true"/>'
+              '<sf:Owner xsi:type="sf:sObject"><sf:type>User</sf:type><sf:Id xsi:nil="true"/></sf:Owner></records>')
+
+    def test_writeSObjects(self):
+        element = xmltramp.parse(self.record)
+        # the read-only fields of a queried element are not sent
+        self.assertEqual(beatbox._beatbox._sObjectsDocument(element).split(b'sforce.com">')[1],
+                         b'<p:sObjects><o:type>Task</o:type><o:Id>00T000000000001AAA</o:Id></p:sObjects></p:request>')
+        record = beatbox.ElementRecord(element, fields=True)
+        self.assertEqual(beatbox._beatbox._sObjectsDocument(record).split(b'sforce.com">')[1],
+                         b'<p:sObjects><o:type>Task</o:type><o:Id>00T000000000001AAA</o:Id><o:Subject>Call</o:Subject>'
+                         b'<o:Status>Open</o:Status></p:sObjects></p:request>')
+        record = beatbox.ElementRecord(element, {'status': 'Completed', 'Subject': None, 'Priority': 'High'})
+        self.assertEqual(beatbox._beatbox._sObjectsDocument(record).split(b'sforce.com">')[1],
+                         b'<p:sObjects><o:type>Task</o:type><o:Id>00T000000000001AAA</o:Id>'
+                         b'<o:status>Completed</o:status><o:Priority>High</o:Priority>'
+                         b'<o:fieldsToNull>Subject</o:fieldsToNull></p:sObjects></p:request>')
+        # only type and Id are taken from the element by default
+        record = beatbox.ElementRecord(element, {'Priority': 'High'})
+        self.assertEqual(beatbox._beatbox._sObjectsDocument(record).split(b'sforce.com">')[1],
+                         b'<p:sObjects><o:type>Task</o:type><o:Id>00T000000000001AAA</o:Id>'
+                         b'<o:Priority>High</o:Priority></p:sObjects></p:request>')
+        record = beatbox.ElementRecord(element, fields=['subject'])
+        self.assertEqual(beatbox._beatbox._sObjectsDocument(record).split(b'sforce.com">')[1],
+                         b'<p:sObjects><o:type>Task</o:type><o:Id>00T000000000001AAA</o:Id>'
+                         b'<o:Subject>Call</o:Subject></p:sObjects></p:request>')
+        self.assertEqual(beatbox._beatbox.serializedSize(element), len(
+            b'<p:sObjects><o:type>Task</o:type><o:Id>00T000000000001AAA</o:Id></p:sObjects>'))
+
+
+class QueryStub(beatbox.Client):
+    """Parent query with 2 accounts, each with 5 contacts in pages of 2"""
+    def __init__(self):
+        super(QueryStub, self).__init__()
+        self.locators = []
+
+    def query(self, soql):
+        return xmltramp.parse(
+            '<result xmlns="urn:partner.soap.sforce.com" xmlns:sf="urn:sobject.partner.soap.sforce.com"'
+            ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><done>true</done><queryLocator xsi:nil="true"/>' +
+            ''.join('<records><sf:type>Account</sf:type><sf:Id>a%d</sf:Id><sf:Contacts xsi:type="QueryResult">'
+                    '%s</sf:Contacts></records>' % (i, self.page('a%d' % i, 0)) for i in range(2)) +
+            '<size>2</size></result>')
+
+    def queryMore(self, queryLocator):
+        self.locators.append(queryLocator)
+        parentId, offset = queryLocator.split('-')
+        return xmltramp.parse('<result xmlns="urn:partner.soap.sforce.com">%s</result>'
+                              % self.page(parentId, int(offset)))
+
+    def page(self, parentId, offset):
+        records = ''.join('<records><Id>%s-c%d</Id></records>' % (parentId, i)
+                          for i in range(offset, min(offset + 2, 5)))
+        return '<done>%s</done><queryLocator>%s-%d</queryLocator>%s<size>5</size>' % (
+            'true' if offset + 2 >= 5 else 'false', parentId, offset + 2, records)
+
+
+NestedClient = iterClient(QueryStub)
+
+
+class TestGatherRecords(unittest.TestCase):
+
+    def check(self, records):
+        self.assertEqual([[str(c[0]) for c in r[beatbox._tSObjectNS.Contacts][beatbox._tPartnerNS.records:]]
+                          for r in records],
+                         [['a%d-c%d' % (a, c) for c in range(5)] for a in range(2)])
+        self.assertEqual(str(records[0][beatbox._tSObjectNS.Contacts][beatbox._tPartnerNS.done]), 'true')
+
+    def test_nested(self):
+        client = NestedClient()
+        self.check(list(client.query("SELECT Id, (SELECT Id FROM Contacts) FROM Account")))
+        self.assertEqual(client.locators, ['a0-2', 'a0-4', 'a1-2', 'a1-4'])
+
+    def test_nestedParallel(self):
+        client = NestedClient()
+        self.check(list(client.query("...", maxWorkers=2)))
+
+    def test_notNested(self):
+        client = NestedClient()
+        records = list(client.query("...", nested=False))
+        self.assertEqual(len(records[0][beatbox._tSObjectNS.Contacts][beatbox._tPartnerNS.records:]), 2)
+
+    def test_queryPages(self):
+        self.check([record for page in queryPages(NestedClient(), "...") for record in page])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+import threading
+import unittest
+
+import beatbox
+from beatbox.coalesce import RetrieveCoalescer
+from beatbox.tests import FakeConnection, fakeClient
+from beatbox.xmltramp import Element
+
+retrieveResponse = (
+    b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"'
+    b' xmlns="urn:partner.soap.sforce.com" xmlns:sf="urn:sobject.partner.soap.sforce.com"><soapenv:Body>'
+    b'<retrieveResponse><result><sf:type>Account</sf:type><sf:Id>001A</sf:Id></result></retrieveResponse>'
+    b'</soapenv:Body></soapenv:Envelope>')
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def clone(self):
+        return self
+
+    def retrieve(self, fields, sObjectType, ids):
+        with self.lock:
+            self.calls.append((fields, sObjectType, list(ids)))
+        records = [Element('result', children=[id]) for id in ids]
+        return records if len(records) > 1 else records[0]
+
+
+class TestRetrieveCoalescer(unittest.TestCase):
+
+    def test_batching(self):
+        client = FakeClient()
+        with RetrieveCoalescer(client, window=10) as coalescer:
+            futures = [coalescer.retrieve("Id, Name", "Account", id) for id in ('a1', 'a2', 'a1')]
+            other = coalescer.retrieve("Id", "Contact", 'c1')
+            coalescer.flush()
+            self.assertEqual([str(f.result()) for f in futures], ['a1', 'a2', 'a1'])
+            self.assertEqual(str(other.result()), 'c1')
+        self.assertEqual(sorted(client.calls), [("Id", "Contact", ['c1']),
+                                                ("Id, Name", "Account", ['a1', 'a2'])])
+
+    def test_maxBatch(self):
+        client = FakeClient()
+        coalescer = RetrieveCoalescer(client, window=10, maxBatch=2)
+        futures = [coalescer.retrieve("Id", "Account", id) for id in ('a1', 'a2', 'a3')]
+        self.assertEqual(str(futures[1].result(timeout=5)), 'a2')
+        coalescer.close()
+        self.assertEqual(str(futures[2].result()), 'a3')
+        self.assertEqual([ids for (_, _, ids) in client.calls], [['a1', 'a2'], ['a3']])
+
+    def test_error(self):
+        client = FakeClient()
+        client.retrieve = lambda fields, sObjectType, ids: 1 / 0
+        with RetrieveCoalescer(client, window=0) as coalescer:
+            future = coalescer.retrieve("Id", "Account", 'a1')
+            self.assertRaises(ZeroDivisionError, future.result, 5)
+
+    def test_iterClient(self):
+        conn = FakeConnection(retrieveResponse)
+        with RetrieveCoalescer(fakeClient(conn, beatbox.IterClient), window=0) as coalescer:
+            # the clone of the client has its own connection
+            coalescer.client._Client__conn = conn
+            record = coalescer.get("Id", "Account", '001A')
+        self.assertEqual(str(record[beatbox._tSObjectNS.Id]), '001A')
+
+
+if __name__ == '__main__':
+    unittest.main()
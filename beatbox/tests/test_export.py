@@ -0,0 +1,77 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from beatbox.export import Exporter, csvLine, soqlColumns
+from beatbox.xmltramp import parse
+
+record = ('<records xmlns:sf="urn:sobject.partner.soap.sforce.com"'
+          ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+          '<sf:type>Account</sf:type><sf:Id>a{0}</sf:Id><sf:Name>Acme, "{0}"</sf:Name>'
+          '<sf:Owner xsi:type="sf:sObject"><sf:type>User</sf:type><sf:Id xsi:nil="true"/><sf:Name>Bob</sf:Name>'
+          '</sf:Owner><sf:Phone xsi:nil="true"/></records>')
+
+
+class FakeClient(object):
+    """10 records in pages of 2, queryMore fails once if failAt is set"""
+    def __init__(self, failAt=None):
+        self.failAt = failAt
+
+    def query(self, soql):
+        return self.page(0)
+
+    def queryMore(self, queryLocator):
+        if int(queryLocator) == self.failAt:
+            self.failAt = None
+            raise IOError("connection lost")
+        return self.page(int(queryLocator))
+
+    def page(self, offset):
+        return parse('<result xmlns="urn:partner.soap.sforce.com"><done>%s</done><queryLocator>%d</queryLocator>'
+                     '%s</result>' % ('true' if offset >= 8 else 'false', offset + 2,
+                                      ''.join(record.format(i) for i in range(offset, offset + 2))))
+
+
+class TestExport(unittest.TestCase):
+
+    soql = "SELECT Id, Name, Owner.Name, Phone, (SELECT Id FROM Contacts) FROM Account"
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_helpers(self):
+        self.assertEqual(soqlColumns(self.soql), ['Id', 'Name', 'Owner.Name', 'Phone'])
+        self.assertEqual(csvLine([u'a', None, u'b,"c"', u'\u00c1']), u'a,,"b,""c""",\u00c1\r\n')
+
+    def test_csvResume(self):
+        path = os.path.join(self.dir, 'out.csv')
+        client = FakeClient(failAt=6)
+        exporter = Exporter(client, self.soql, path, checkpointPages=2)
+        self.assertRaises(IOError, exporter.run)
+        self.assertTrue(os.path.exists(path + '.checkpoint'))
+        self.assertEqual(Exporter(client, self.soql, path, checkpointPages=2).run(), 10)
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+        with open(path, 'rb') as f:
+            lines = f.read().decode('utf-8').split('\r\n')
+        self.assertEqual(lines[:2], ['Id,Name,Owner.Name,Phone', 'a0,"Acme, ""0""",Bob,'])
+        self.assertEqual(lines[10:], ['a9,"Acme, ""9""",Bob,', ''])
+
+    def test_jsonlGzipResume(self):
+        path = os.path.join(self.dir, 'out.jsonl.gz')
+        client = FakeClient(failAt=8)
+        self.assertRaises(IOError, Exporter(client, self.soql, path, 'jsonl', True, checkpointPages=1).run)
+        Exporter(client, self.soql, path, 'jsonl', True, checkpointPages=1).run()
+        with gzip.open(path, 'rb') as f:
+            rows = [json.loads(line) for line in f.read().decode('utf-8').splitlines()]
+        self.assertEqual([row['Id'] for row in rows], ['a%d' % i for i in range(10)])
+        self.assertEqual(rows[0], {'Id': 'a0', 'Name': 'Acme, "0"', 'Owner.Name': 'Bob', 'Phone': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import threading
+import time
+import unittest
+
+from beatbox.hedge import HedgingPolicy
+from beatbox.scheduler import INTERACTIVE, RequestScheduler
+
+
+class FakeConnection(object):
+    def __init__(self, name, seconds):
+        self.name = name
+        self.seconds = seconds
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRequest(object):
+    operationName = 'query'
+    serverUrl = 'https://localhost/services/Soap/u/36.0'
+
+    def post(self, conn, alwaysReturnList=False, retry=None):
+        time.sleep(conn.seconds)
+        self.answeredBy = conn.name
+        return conn.name
+
+
+class TestHedgingPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = HedgingPolicy(maxFraction=0.5, minSamples=5)
+        for i in range(5):
+            self.policy._record('query', 0.01)
+        self.fast = FakeConnection('fast', 0)
+        self.policy._idle[('https', 'localhost')] = [self.fast]
+
+    def tearDown(self):
+        self.policy.shutdown()
+
+    def test_hedge(self):
+        slow = FakeConnection('slow', 0.3)
+        request = FakeRequest()
+        (result, answered, conn) = self.policy.post(request, slow)
+        self.assertEqual(result, 'fast')
+        self.assertIsNot(answered, request)
+        self.assertIs(conn, self.fast)
+        self.assertEqual(self.policy.hedges, 1)
+        # the slow connection is idle after its request is finished
+        time.sleep(0.4)
+        self.assertEqual(self.policy._idle[('https', 'localhost')], [slow])
+
+    def test_notSlow(self):
+        conn = FakeConnection('primary', 0)
+        self.assertEqual(self.policy.post(FakeRequest(), conn)[::2], ('primary', conn))
+        self.assertEqual(self.policy.hedges, 0)
+
+    def test_budget(self):
+        self.policy.maxFraction = 0
+        slow = FakeConnection('slow', 0.05)
+        self.assertEqual(self.policy.post(FakeRequest(), slow)[0], 'slow')
+        self.assertEqual(self.policy.hedges, 0)
+
+    def test_concurrent(self):
+        # the calls are not queued for a limited number of workers
+        self.policy.minDelay = 1.0
+        threads = [threading.Thread(target=self.policy.post, args=(FakeRequest(), FakeConnection('slow', 0.2)))
+                   for i in range(16)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(time.time() - start, 0.35)
+        self.assertEqual(self.policy.hedges, 0)
+
+    def test_scheduler(self):
+        # the slot of the caller is the only one
+        scheduler = RequestScheduler(maxInFlight=1)
+        lock = scheduler.acquire(INTERACTIVE)
+        result = self.policy.post(FakeRequest(), FakeConnection('slow', 0.1), scheduler=scheduler)
+        self.assertEqual(result[0], 'slow')
+        self.assertEqual(self.policy.hedges, 0)
+        # the duplicate takes the second slot until it is finished
+        scheduler.maxInFlight = 2
+        result = self.policy.post(FakeRequest(), FakeConnection('slow', 0.3), scheduler=scheduler,
+                                  priority=INTERACTIVE)
+        self.assertEqual((result[0], self.policy.hedges), ('fast', 1))
+        time.sleep(0.05)
+        self.assertEqual(scheduler._inFlight, 1)
+        scheduler.release(lock)
+
+    def test_noSamples(self):
+        policy = HedgingPolicy()
+        self.assertIsNone(policy.delay('query'))
+        policy.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from beatbox.load import Loader, convertValue
+from beatbox.xmltramp import parse
+
+describe = (
+    '<result xmlns="urn:partner.soap.sforce.com">' +
+    ''.join('<fields><name>%s</name><type>%s</type><createable>%s</createable><updateable>%s</updateable></fields>'
+            % x for x in [('Id', 'id', 'false', 'false'), ('LastName', 'string', 'true', 'true'),
+                          ('Ext__c', 'string', 'true', 'true'), ('DoNotCall', 'boolean', 'true', 'true'),
+                          ('CreatedDate', 'datetime', 'false', 'false')]) +
+    '<name>Contact</name></result>')
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.chunks = []
+        self.lock = threading.Lock()
+
+    @property
+    def iterclient(self):
+        return self
+
+    def clone(self):
+        return self
+
+    def describeSObjects(self, sObjectType):
+        return parse(describe)
+
+    def upsert(self, externalIdName, sObjects, chunkLength=None):
+        with self.lock:
+            self.chunks.append(sObjects)
+        for o in sObjects:
+            if o.get('LastName'):
+                yield parse('<result xmlns="urn:partner.soap.sforce.com"><created>true</created><id>003%s</id>'
+                            '<success>true</success></result>' % o['Ext__c'])
+            else:
+                yield parse('<result xmlns="urn:partner.soap.sforce.com"><created>false</created><errors>'
+                            '<message>Required fields are missing: [LastName]</message>'
+                            '<statusCode>REQUIRED_FIELD_MISSING</statusCode></errors><id xsi:nil="true" '
+                            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"/>'
+                            '<success>false</success></result>')
+
+
+class TestLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.input = os.path.join(self.dir, 'in.csv')
+        self.results = os.path.join(self.dir, 'results.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text):
+        with io.open(self.input, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+
+    def test_convertValue(self):
+        self.assertEqual(convertValue(u' Yes', 'boolean'), 'true')
+        self.assertEqual(convertValue(False, 'boolean'), 'false')
+        self.assertEqual(convertValue(u'42', 'int'), 42)
+        self.assertEqual(convertValue(u'1.10', 'currency'), u'1.10')
+        self.assertIsNone(convertValue(u'', 'string'))
+        self.assertRaises(ValueError, convertValue, u'maybe', 'boolean')
+
+    def test_upsert(self):
+        self.write(u'name,ext,dnc\r\nSmith,1,1\r\n,2,0\r\n"O\'Neil, Jr.",3,x\r\nDoe,4,\r\n')
+        client = FakeClient()
+        mapping = {'name': 'LastName', 'ext': 'Ext__c', 'dnc': 'DoNotCall'}
+        loader = Loader(client, 'Contact', 'upsert', 'Ext__c', mapping, chunkLength=2, maxWorkers=2)
+        self.assertEqual(loader.run(self.input, self.results), (2, 2))
+        self.assertEqual(sorted(len(x) for x in client.chunks), [1, 2])
+        chunk = [x for x in client.chunks if len(x) == 2][0]
+        self.assertEqual(chunk[1], {'type': 'Contact', 'Ext__c': u'2', 'DoNotCall': 'false',
+                                    'fieldsToNull': ['LastName']})
+        with io.open(self.results, encoding='utf-8', newline='') as f:
+            lines = sorted(f.read().split('\r\n'))
+        self.assertEqual(lines, ['', '1,0031,true,true,', '2,,false,false,REQUIRED_FIELD_MISSING: Required fields '
+                                 'are missing: [LastName]', "3,,false,,Invalid boolean value 'x'", '4,0034,true,true,',
+                                 'line,id,success,created,errors'])
+
+    def test_validation(self):
+        self.write(u'LastName,CreatedDate\r\nSmith,2016-01-01\r\n')
+        loader = Loader(FakeClient(), 'Contact', 'upsert', 'Ext__c')
+        self.assertRaises(ValueError, loader.run, self.input, self.results)
+        self.write(u'LastName,Unknown\r\nSmith,2016-01-01\r\n')
+        self.assertRaises(ValueError, loader.run, self.input, self.results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import re
+import unittest
+from xml.sax.saxutils import escape
+
+import beatbox
+from beatbox.partition import addCondition, idToNumber, numberToId, splitSoql
+from beatbox.tests import iterClient
+from beatbox.xmltramp import parse
+
+ids = ['001000000000%03dAAA' % i for i in range(100)]
+
+
+class QueryStub(beatbox.Client):
+    queryAllCalls = 0
+
+    def queryAll(self, soql):
+        QueryStub.queryAllCalls += 1
+        return QueryStub.query(self, soql)
+
+    def query(self, soql):
+        found = [id for id in ids if self.matches(soql, id)]
+        if 'DESC' in soql:
+            found.reverse()
+        if 'LIMIT 1' in soql:
+            found = found[:1]
+        return self.page(soql, found, 0)
+
+    def queryMore(self, queryLocator):
+        soql, offset = queryLocator.rsplit('|', 1)
+        return self.page(soql, [id for id in ids if self.matches(soql, id)], int(offset))
+
+    def matches(self, soql, id):
+        for op, bound in re.findall(r"Id (<|>=) '(\w+)'", soql):
+            if (id[:15] < bound) != (op == '<'):
+                return False
+        return True
+
+    def page(self, soql, found, offset):
+        records = ''.join('<records><type>Account</type><Id>%s</Id></records>' % id for id in found[offset:offset + 7])
+        done = 'true' if offset + 7 >= len(found) else 'false'
+        return parse('<result xmlns="urn:partner.soap.sforce.com"><done>%s</done><queryLocator>%s|%d</queryLocator>'
+                     '%s</result>' % (done, escape(soql), offset + 7, records))
+
+
+FakeClient = iterClient(QueryStub)
+
+
+class TestPartition(unittest.TestCase):
+
+    def test_splitSoql(self):
+        self.assertEqual(splitSoql("SELECT Id, (SELECT Id FROM Contacts WHERE Name = 'a') FROM Account "
+                                   "WHERE Name = 'x ORDER BY' ORDER BY Name LIMIT 10"),
+                         ("SELECT Id, (SELECT Id FROM Contacts WHERE Name = 'a') ", "FROM Account",
+                          "Name = 'x ORDER BY'", "ORDER BY Name LIMIT 10"))
+        self.assertEqual(addCondition("SELECT Id FROM Account WHERE a = 1 OR b = 2 LIMIT 5", "Id < '1'"),
+                         "SELECT Id FROM Account WHERE Id < '1' AND (a = 1 OR b = 2) LIMIT 5")
+        self.assertEqual(addCondition("select Id from Account", "Id < '1'"),
+                         "select Id from Account WHERE Id < '1'")
+
+    def test_idNumber(self):
+        self.assertEqual(numberToId('001', idToNumber('001A0000001b2cZ')), '001A0000001b2cZ')
+        self.assertEqual(idToNumber('001000000000010') - idToNumber('00100000000000z'), 1)
+
+    def test_queryPartitioned(self):
+        client = FakeClient()
+        records = list(client.queryPartitioned("SELECT Id FROM Account", partitions=4, maxWorkers=2))
+        self.assertEqual(sorted(str(x[1]) for x in records), ids)
+        self.assertEqual(QueryStub.queryAllCalls, 0)
+        records = list(client.queryPartitioned("SELECT Id FROM Account", partitions=4, queryAll=True))
+        self.assertEqual(sorted(str(x[1]) for x in records), ids)
+        # 2 queries of the range and 4 partitions
+        self.assertEqual(QueryStub.queryAllCalls, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
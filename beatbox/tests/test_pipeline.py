@@ -0,0 +1,87 @@
+import threading
+import unittest
+
+import beatbox
+from beatbox.pipeline import Pipeline
+from beatbox.tests import iterClient
+from beatbox.xmltramp import parse
+
+ids = ['00T000000000%03dAAA' % i for i in range(25)]
+
+
+class Stub(beatbox.Client):
+    lock = threading.Lock()
+
+    def query(self, soql):
+        return self.queryMore('0')
+
+    def queryMore(self, queryLocator):
+        offset = int(queryLocator)
+        records = ''.join('<records><sf:type>Task</sf:type><sf:Id>%s</sf:Id></records>' % id
+                          for id in ids[offset:offset + 10])
+        return parse('<result xmlns="urn:partner.soap.sforce.com" xmlns:sf="urn:sobject.partner.soap.sforce.com">'
+                     '<done>%s</done><queryLocator>%d</queryLocator>%s</result>'
+                     % ('true' if offset + 10 >= len(ids) else 'false', offset + 10, records))
+
+    def update(self, sObjects):
+        with self.lock:
+            self.chunks.append(list(sObjects))
+        results = [parse('<result xmlns="urn:partner.soap.sforce.com"><id>%s</id><success>%s</success></result>'
+                         % (o['Id'], 'false' if int(o['Id'][12:15]) < 10 else 'true')) for o in sObjects]
+        return results if len(results) > 1 else results[0]
+
+    def delete(self, ids):
+        with self.lock:
+            self.chunks.append(list(ids))
+        results = [parse('<result xmlns="urn:partner.soap.sforce.com"><id>%s</id><success>true</success></result>'
+                         % id) for id in ids]
+        return results if len(results) > 1 else results[0]
+
+
+FakeClient = iterClient(Stub)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_queryUpdate(self):
+        client = FakeClient()
+        client.chunks = []
+        pipeline = (Pipeline(client, chunkLength=4, maxWorkers=2, queueSize=1)
+                    .query("SELECT Id FROM Task")
+                    .filter(lambda rec: str(rec[1]) != ids[5])
+                    .map(lambda rec: {'type': 'Task', 'Id': str(rec[1]), 'Status': 'Completed'})
+                    .update())
+        results = list(pipeline.results())
+        self.assertEqual([record['Id'] for record, result in results], ids[:5] + ids[6:])
+        self.assertEqual([str(result[beatbox._tPartnerNS.id]) for record, result in results], ids[:5] + ids[6:])
+        self.assertEqual(sorted(len(x) for x in client.chunks), [4, 4, 4, 4, 4, 4])
+        client.chunks = []
+        self.assertEqual(pipeline.run(), (15, 9))
+
+    def test_coalesce(self):
+        client = FakeClient()
+        client.chunks = []
+        records = [{'type': 'Task', 'Id': ids[10], 'Status': 'Completed'}, {'type': 'Task', 'Id': ids[11]},
+                   {'type': 'Task', 'Id': ids[10], 'Subject': 'Call'}]
+        results = list(Pipeline(client).records(records).update().results())
+        self.assertEqual(client.chunks, [[{'type': 'Task', 'Id': ids[10], 'Status': 'Completed', 'Subject': 'Call'},
+                                          {'type': 'Task', 'Id': ids[11]}]])
+        self.assertEqual([str(result[beatbox._tPartnerNS.id]) for record, result in results],
+                         [ids[10], ids[11], ids[10]])
+
+    def test_delete(self):
+        client = FakeClient()
+        client.chunks = []
+        pipeline = (Pipeline(client, chunkLength=10).query("SELECT Id FROM Task")
+                    .map(lambda rec: rec if str(rec[1]) < ids[10] else beatbox.ElementRecord(rec)).delete())
+        self.assertEqual(pipeline.run(), (25, 0))
+        self.assertEqual(sorted(client.chunks), [ids[:10], ids[10:20], ids[20:]])
+
+    def test_records(self):
+        pipeline = Pipeline(FakeClient()).records(range(5)).map(lambda x: x * 2 if x % 2 else None)
+        self.assertEqual(list(pipeline), [2, 6])
+        self.assertRaises(ValueError, pipeline.run)
+
+
+if __name__ == '__main__':
+    unittest.main()
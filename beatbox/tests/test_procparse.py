@@ -0,0 +1,87 @@
+import gzip
+import unittest
+
+from beatbox._beatbox import SoapFaultError
+from beatbox.procparse import ProcessParser, parseQueryResponse
+from beatbox.scheduler import RequestScheduler
+from beatbox.six import BytesIO
+from beatbox.tests import FakeConnection, fakeClient
+
+envelope = ('<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"'
+            ' xmlns="urn:partner.soap.sforce.com" xmlns:sf="urn:sobject.partner.soap.sforce.com"'
+            ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><soapenv:Header><LimitInfoHeader><limitInfo>'
+            '<current>%d</current><limit>15000</limit><type>API REQUESTS</type></limitInfo></LimitInfoHeader>'
+            '</soapenv:Header><soapenv:Body>%s</soapenv:Body></soapenv:Envelope>')
+record = ('<records xsi:type="sf:sObject"><sf:type>Account</sf:type><sf:Id>001%012d</sf:Id>'
+          '<sf:Name>A &amp; %d</sf:Name><sf:Owner xsi:type="sf:sObject"><sf:type>User</sf:type>'
+          '<sf:Id xsi:nil="true"/><sf:Name>Bob</sf:Name>'
+          '</sf:Owner><sf:Phone xsi:nil="true"/></records>')
+
+
+def page(offset, done):
+    body = ('<queryResponse><result><done>%s</done><queryLocator>%s</queryLocator>%s<size>5</size></result>'
+            '</queryResponse>' % ('true' if done else 'false', '' if done else 'loc-%d' % (offset + 3),
+                                  ''.join(record % (i, i) for i in range(offset, min(offset + 3, 5)))))
+    data = (envelope % (offset, body)).encode('utf-8')
+    buf = BytesIO()
+    f = gzip.GzipFile(mode='wb', fileobj=buf)
+    f.write(data)
+    f.close()
+    return buf.getvalue(), True
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.limitInfo = {}
+        self.lastCallBytes = (0, 0)
+
+    def queryRaw(self, soql, queryAll=False):
+        return page(0, False)
+
+    def queryMoreRaw(self, queryLocator):
+        return page(int(queryLocator.split('-')[1]), True)
+
+    def updateLimitInfo(self, limits):
+        self.limitInfo.update(limits)
+
+    def faultReceived(self, exc):
+        pass
+
+
+class TestProcessParser(unittest.TestCase):
+
+    columns = ['Id', 'Name', 'Owner.Name', 'Phone']
+
+    def test_parseQueryResponse(self):
+        result = parseQueryResponse(page(0, False)[0], True, self.columns)
+        self.assertEqual(result['rows'][1], ('001000000000001', 'A & 1', 'Bob', None))
+        self.assertEqual((result['done'], result['queryLocator']), (False, 'loc-3'))
+        self.assertEqual(result['limitInfo'], {'API REQUESTS': (0, 15000)})
+        fault = ('<soapenv:Fault><faultcode>sf:INVALID_QUERY_LOCATOR</faultcode>'
+                 '<faultstring>invalid query locator</faultstring></soapenv:Fault>')
+        result = parseQueryResponse((envelope % (1, fault)).encode('utf-8'), False, self.columns)
+        self.assertEqual(result['fault'], ('INVALID_QUERY_LOCATOR', 'invalid query locator'))
+
+    def test_queryRows(self):
+        client = FakeClient()
+        with ProcessParser(2) as parser:
+            rows = list(parser.queryRows(client, "SELECT Id, Name, Owner.Name, Phone FROM Account"))
+        self.assertEqual([row[0] for row in rows], ['001%012d' % i for i in range(5)])
+        self.assertEqual(client.limitInfo, {'API REQUESTS': (3, 15000)})
+
+    def test_client(self):
+        fault = ('<soapenv:Fault><faultcode>sf:REQUEST_LIMIT_EXCEEDED</faultcode>'
+                 '<faultstring>TotalRequests Limit exceeded.</faultstring></soapenv:Fault>')
+        data = (envelope % (14000, fault)).encode('utf-8')
+        client = fakeClient(FakeConnection(data))
+        client.scheduler = RequestScheduler()
+        with ProcessParser(1) as parser:
+            self.assertRaises(SoapFaultError, list, parser.queryRows(client, "SELECT Id FROM Account"))
+        # the fault of the raw response reaches the scheduler like a fault of Client._post
+        self.assertEqual(client.scheduler._state['current'], client.scheduler._state['limit'])
+        self.assertEqual(client.lastCallBytes[1], len(data))
+        self.assertEqual(client.scheduler._inFlight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from beatbox.replica import Replica
+from beatbox.xmltramp import parse
+
+describe = (
+    '<result xmlns="urn:partner.soap.sforce.com">'
+    '<fields><name>Id</name><type>id</type></fields>'
+    '<fields><name>Name</name><type>string</type></fields>'
+    '<fields><name>NumberOfEmployees</name><type>int</type></fields>'
+    '<fields><name>IsDeleted</name><type>boolean</type></fields>'
+    '<name>Account</name></result>')
+
+record = (
+    '<records xmlns="urn:partner.soap.sforce.com" xmlns:sf="urn:sobject.partner.soap.sforce.com"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    '<sf:type>Account</sf:type><sf:Id>{}</sf:Id><sf:Id>{}</sf:Id><sf:Name>{}</sf:Name>'
+    '<sf:NumberOfEmployees xsi:nil="true"/><sf:IsDeleted>false</sf:IsDeleted></records>')
+
+ns = 'xmlns="urn:partner.soap.sforce.com"'
+
+
+def makeRecord(id, name):
+    return parse(record.format(id, id, name))
+
+
+class FakeClient(object):
+    @property
+    def iterclient(self):
+        return self
+
+    def clone(self):
+        return self
+
+    def describeSObjects(self, sObjectTypes):
+        return parse(describe)
+
+    def getServerTimestamp(self):
+        return '2016-07-01T12:00:00.000Z'
+
+    def query(self, soql):
+        self.soql = soql
+        return [makeRecord('001000000000001AAA', 'Acme'), makeRecord('001000000000002AAA', 'Other')]
+
+    def getUpdated(self, sObjectType, start, end):
+        return parse('<result %s><ids>001000000000001AAA</ids><latestDateCovered>%s</latestDateCovered></result>'
+                     % (ns, end))
+
+    def getDeleted(self, sObjectType, start, end):
+        return parse('<result %s><deletedRecords><id>001000000000002AAA</id></deletedRecords>'
+                     '<latestDateCovered>%s</latestDateCovered></result>' % (ns, end))
+
+    def retrieve(self, fields, sObjectType, ids, chunkLength=None):
+        return [makeRecord(id, 'Acme Inc.') for id in ids]
+
+
+class TestReplica(unittest.TestCase):
+
+    def test_refresh(self):
+        client = FakeClient()
+        replica = Replica(client, ':memory:', {'Account': ['Name', 'IsDeleted', 'NumberOfEmployees']})
+        replica.refresh()
+        self.assertEqual(client.soql, 'SELECT Id, Name, NumberOfEmployees, IsDeleted FROM Account')
+        row = replica.get('Account', '001000000000001')
+        self.assertEqual((row['Name'], row['NumberOfEmployees'], row['IsDeleted']), ('Acme', None, 0))
+        self.assertEqual(len(replica.select('Account')), 2)
+
+        client.getServerTimestamp = lambda: '2016-07-01T13:00:00.000Z'
+        replica.refresh()
+        self.assertEqual(replica.get('Account', '001000000000001AAA')['Name'], 'Acme Inc.')
+        self.assertEqual([row['Id'] for row in replica.select('Account', 'Name LIKE ?', ('Acme%',))],
+                         ['001000000000001AAA'])
+        self.assertIsNone(replica.get('Account', '001000000000002AAA'))
+        self.assertEqual(replica.watermarks.get('Account'), '2016-07-01T13:00:00Z')
+        replica.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
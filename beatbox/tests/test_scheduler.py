@@ -0,0 +1,81 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from beatbox.scheduler import BATCH, INTERACTIVE, RequestScheduler, fcntl
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def test_tokenBucket(self):
+        scheduler = RequestScheduler(window=100, reserve=0.1, burst=2)
+        self.assertIsNone(scheduler.rate())
+        scheduler.observe(400, 1000)
+        self.assertEqual(scheduler.rate(), 5.0)
+        state = {'tokens': 2, 'time': 0, 'current': 400, 'limit': 1000}
+        self.assertEqual([scheduler._take(state, 0) for i in range(3)], [0, 0, 0.2])
+        self.assertEqual(scheduler._take(state, 0.2), 0)
+        scheduler.limitExceeded()
+        self.assertEqual(scheduler.rate(), scheduler.minRate)
+
+    def test_tryAcquire(self):
+        scheduler = RequestScheduler(maxInFlight=2, burst=1)
+        scheduler.observe(0, 1000)
+        (acquired, lock) = scheduler.tryAcquire()
+        self.assertTrue(acquired)
+        # no token for a batch request, but a slot for an interactive one
+        self.assertEqual(scheduler.tryAcquire(BATCH), (False, None))
+        self.assertTrue(scheduler.tryAcquire(INTERACTIVE)[0])
+        self.assertEqual(scheduler.tryAcquire(INTERACTIVE), (False, None))
+        scheduler.release(lock)
+        self.assertEqual(scheduler._inFlight, 1)
+
+    def test_priority(self):
+        scheduler = RequestScheduler(maxInFlight=1)
+        order = []
+        lock = scheduler.acquire()
+
+        def request(priority, name):
+            with scheduler.slot(priority):
+                order.append(name)
+
+        threads = [threading.Thread(target=request, args=(BATCH, 'batch'))]
+        threads[0].start()
+        while not scheduler._waiting:
+            time.sleep(0.01)
+        threads.append(threading.Thread(target=request, args=(INTERACTIVE, 'interactive')))
+        threads[1].start()
+        while len(scheduler._waiting) < 2:
+            time.sleep(0.01)
+        scheduler.release(lock)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ['interactive', 'batch'])
+        self.assertEqual(scheduler._inFlight, 0)
+
+    @unittest.skipIf(fcntl is None, "requires fcntl")
+    def test_sharedPath(self):
+        path = tempfile.mkdtemp()
+        try:
+            # two schedulers with the same path behave like two processes
+            first = RequestScheduler(maxInFlight=1, path=path)
+            second = RequestScheduler(maxInFlight=1, path=path)
+            lock = first.acquire()
+            acquired = []
+            thread = threading.Thread(target=lambda: acquired.append(second.acquire()))
+            thread.start()
+            time.sleep(0.2)
+            self.assertEqual(acquired, [])
+            first.release(lock)
+            thread.join()
+            second.release(acquired[0])
+            first.observe(10, 100)
+            self.assertEqual(second._update(lambda state, now: (state['current'], state['limit'])), (10, 100))
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
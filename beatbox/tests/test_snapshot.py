@@ -0,0 +1,88 @@
+import datetime
+import unittest
+
+import beatbox
+from beatbox.snapshot import Snapshots, _normalDatetime
+from beatbox.tests import iterClient
+from beatbox.xmltramp import parse
+
+queriedRecord = (
+    '<records xmlns="urn:partner.soap.sforce.com" xmlns:sf="urn:sobject.partner.soap.sforce.com"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    '<sf:type>Account</sf:type><sf:Id>001000000000001AAA</sf:Id><sf:Id>001000000000001AAA</sf:Id>'
+    '<sf:Name>Acme</sf:Name><sf:NumberOfEmployees>10</sf:NumberOfEmployees>'
+    '<sf:Phone xsi:nil="true"/><sf:IsActive__c>true</sf:IsActive__c><sf:Rating__c>12.0</sf:Rating__c>'
+    '<sf:LastCall__c>2016-06-30T10:20:30.000Z</sf:LastCall__c>'
+    '<sf:Owner xsi:type="sf:sObject"><sf:type>User</sf:type><sf:Id xsi:nil="true"/><sf:Name>Bob</sf:Name></sf:Owner>'
+    '</records>')
+
+
+class SaveStub(beatbox.Client):
+    def update(self, sObjects):
+        self.sent = list(sObjects)
+        results = [parse('<result xmlns="urn:partner.soap.sforce.com"><id>%s</id><success>true</success></result>'
+                         % o['Id']) for o in sObjects]
+        return results if len(results) > 1 else results[0]
+
+
+FakeClient = iterClient(SaveStub)
+
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshots = Snapshots()
+        self.snapshots.remember(parse(queriedRecord))
+
+    def test_changes(self):
+        s = self.snapshots
+        self.assertIn('001000000000001', s)
+        self.assertIsNone(s.changes({'type': 'Account', 'Id': '001000000000001', 'Name': 'Acme',
+                                     'NumberOfEmployees': 10, 'Phone': None, 'fieldsToNull': 'phone'}))
+        self.assertEqual(dict(s.changes({'type': 'Account', 'Id': '001000000000001AAA', 'name': 'Acme Inc.',
+                                         'NumberOfEmployees': 10, 'fieldsToNull': ['Name']})),
+                         {'type': 'Account', 'Id': '001000000000001AAA', 'name': 'Acme Inc.',
+                          'fieldsToNull': ['Name']})
+        # a field not in the snapshot can have a value
+        self.assertEqual(s.changes({'Id': '001000000000001', 'fieldsToNull': ['Fax', 'Phone']})['fieldsToNull'],
+                         ['Fax'])
+        new = {'type': 'Account', 'Id': '001000000000002', 'Name': 'Other'}
+        self.assertIs(s.changes(new), new)
+        self.assertRaises(TypeError, s.changes, beatbox.ElementRecord(parse(queriedRecord), {'Name': 'A'}))
+
+    def test_types(self):
+        s = self.snapshots
+        record = {'type': 'Account', 'Id': '001000000000001'}
+
+        def changed(**fields):
+            fields.update(record)
+            return s.changes(fields) is not None
+        self.assertFalse(changed(IsActive__c=True))
+        self.assertTrue(changed(IsActive__c=False))
+        self.assertFalse(changed(Rating__c=12))
+        self.assertFalse(changed(Rating__c=12.0))
+        self.assertTrue(changed(Rating__c=12.5))
+        self.assertFalse(changed(LastCall__c=datetime.datetime(2016, 6, 30, 10, 20, 30)))
+        self.assertFalse(changed(LastCall__c=datetime.datetime(2016, 6, 30, 10, 20, 30, 400)))
+        self.assertTrue(changed(LastCall__c=datetime.datetime(2016, 6, 30, 10, 20, 31)))
+        # sent values are remembered in the same form as queried
+        s.remember({'Id': '001000000000001', 'IsActive__c': False, 'LastCall__c': datetime.datetime(2017, 1, 1)})
+        self.assertFalse(changed(IsActive__c=False))
+        self.assertFalse(changed(LastCall__c='2017-01-01T00:00:00.000Z'))
+        self.assertEqual(_normalDatetime('2016-06-30T12:20:30+02:00'), '2016-06-30T10:20:30.000Z')
+
+    def test_update(self):
+        client = FakeClient()
+        records = [{'type': 'Account', 'Id': '001000000000001AAA', 'Name': 'Acme'},
+                   {'type': 'Account', 'Id': '001000000000001AAA', 'Phone': '555',
+                    'LastActivityDate': datetime.date(2016, 6, 30)}]
+        results = list(client.update(records, snapshots=self.snapshots))
+        self.assertIsNone(results[0])
+        self.assertEqual(str(results[1]), '001000000000001AAAtrue')
+        self.assertEqual(client.sent, [records[1]])
+        # the sent values are remembered
+        self.assertEqual(list(client.update(records[1], snapshots=self.snapshots)), [None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from beatbox._beatbox import SoapFaultError
+from beatbox.sync import IncrementalSync, WatermarkFile, parseTimestamp
+from beatbox.xmltramp import Element, parse
+
+ns = 'xmlns="urn:partner.soap.sforce.com"'
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.windows = []
+
+    @property
+    def iterclient(self):
+        return self
+
+    def clone(self):
+        return self
+
+    def getServerTimestamp(self):
+        return '2016-07-01T12:00:00.000Z'
+
+    def query(self, soql):
+        self.soql = soql
+        return [Element('records', children=['a%d' % i]) for i in range(3)]
+
+    def getUpdated(self, sObjectType, start, end):
+        if parseTimestamp(end) - parseTimestamp(start) > datetime.timedelta(hours=6):
+            raise SoapFaultError('EXCEEDED_ID_LIMIT', 'too many ids')
+        self.windows.append((start, end))
+        return parse('<result %s><ids>a1</ids><ids>a2</ids><latestDateCovered>%s</latestDateCovered></result>'
+                     % (ns, end))
+
+    def getDeleted(self, sObjectType, start, end):
+        return parse('<result %s><deletedRecords><deletedDate>%s</deletedDate><id>a3</id></deletedRecords>'
+                     '<latestDateCovered>%s</latestDateCovered></result>' % (ns, start, end))
+
+    def retrieve(self, fields, sObjectType, ids, chunkLength=None):
+        # a2 is deleted in the meantime
+        return [Element('result', children=[id] if id != 'a2' else []) for id in ids]
+
+
+class FakeTarget(object):
+    def __init__(self):
+        self.upserted = []
+        self.deleted = []
+
+    def upsert(self, sObjectType, records):
+        self.upserted.extend(str(x) for x in records)
+
+    def delete(self, sObjectType, ids):
+        self.deleted.extend(ids)
+
+
+class TestIncrementalSync(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'watermarks.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_fullLoad(self):
+        client, target = FakeClient(), FakeTarget()
+        IncrementalSync(client, {'Account': ['Id', 'Name']}, target, WatermarkFile(self.path), chunkLength=2).sync()
+        self.assertEqual(client.soql, 'SELECT Id, Name FROM Account')
+        self.assertEqual(target.upserted, ['a0', 'a1', 'a2'])
+        self.assertEqual(WatermarkFile(self.path).get('Account'), '2016-07-01T12:00:00Z')
+
+    def test_windows(self):
+        WatermarkFile(self.path).set('Account', '2016-06-30T12:00:00Z')
+        client, target = FakeClient(), FakeTarget()
+        IncrementalSync(client, {'Account': 'Id'}, target, WatermarkFile(self.path)).sync()
+        self.assertEqual(client.windows, [('2016-06-30T12:00:00Z', '2016-06-30T18:00:00Z'),
+                                          ('2016-06-30T18:00:00Z', '2016-07-01T00:00:00Z'),
+                                          ('2016-07-01T00:00:00Z', '2016-07-01T06:00:00Z'),
+                                          ('2016-07-01T06:00:00Z', '2016-07-01T12:00:00Z')])
+        self.assertEqual(target.upserted, ['a1'] * 4)
+        self.assertEqual(target.deleted, ['a3'] * 4)
+        self.assertEqual(WatermarkFile(self.path).get('Account'), '2016-07-01T12:00:00Z')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import threading
+import unittest
+
+from beatbox import ElementRecord
+from beatbox.writer import BufferedWriter, coalescedResults, coalesceRecords, mergeRecords
+from beatbox.xmltramp import parse
+
+
+class FakeIterClient(object):
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    @property
+    def iterclient(self):
+        return self
+
+    def clone(self):
+        return self
+
+    def _save(self, operation, records):
+        with self.lock:
+            self.calls.append((operation, list(records)))
+        for record in records:
+            yield (operation, record)
+
+    def create(self, sObjects, chunkLength=None):
+        return self._save('create', sObjects)
+
+    def update(self, sObjects, chunkLength=None):
+        return self._save('update', sObjects)
+
+    def upsert(self, externalIdName, sObjects, chunkLength=None):
+        return self._save('upsert ' + externalIdName, sObjects)
+
+    def delete(self, ids, chunkLength=None):
+        return self._save('delete', ids)
+
+
+class TestBufferedWriter(unittest.TestCase):
+
+    def test_grouping(self):
+        client = FakeIterClient()
+        results = []
+        with BufferedWriter(client, flushInterval=60) as writer:
+            a = writer.create({'type': 'Account', 'Name': 'a'})
+            writer.create({'type': 'Contact', 'LastName': 'c'})
+            writer.create({'type': 'Account', 'Name': 'b'}, callback=lambda f: results.append(f.result()))
+            writer.upsert('Ext__c', {'type': 'Account', 'Ext__c': 'x'})
+            writer.delete('001000000000001')
+            writer.flush()
+            self.assertEqual(a.result(), ('create', {'type': 'Account', 'Name': 'a'}))
+            self.assertEqual(results, [('create', {'type': 'Account', 'Name': 'b'})])
+        self.assertEqual(sorted((op, len(records)) for op, records in client.calls),
+                         [('create', 1), ('create', 2), ('delete', 1), ('upsert Ext__c', 1)])
+
+    def test_batchSize(self):
+        client = FakeIterClient()
+        writer = BufferedWriter(client, batchSize=2, flushInterval=60)
+        futures = [writer.update({'type': 'Account', 'Id': str(i)}) for i in range(3)]
+        futures[1].result(timeout=5)
+        self.assertEqual(len(client.calls), 1)
+        writer.close()
+        self.assertTrue(futures[2].done())
+        self.assertEqual([len(records) for op, records in client.calls], [2, 1])
+
+    def test_flushInterval(self):
+        client = FakeIterClient()
+        with BufferedWriter(client, flushInterval=0.01) as writer:
+            future = writer.delete('001000000000001')
+            self.assertEqual(future.result(timeout=5), ('delete', '001000000000001'))
+
+    def test_coalesce(self):
+        client = FakeIterClient()
+        with BufferedWriter(client, flushInterval=60) as writer:
+            a = writer.update({'type': 'Account', 'Id': '001000000000001AAA', 'Name': 'a', 'Phone': '1'})
+            b = writer.update({'type': 'Account', 'Id': '001000000000001', 'Name': 'b'})
+            c = writer.upsert('Ext__c', {'type': 'Account', 'Ext__c': 'x', 'Name': 'c'})
+            d = writer.upsert('Ext__c', {'type': 'Account', 'Ext__c': 'x', 'fieldsToNull': 'Name'})
+            writer.flush()
+        self.assertIs(a.result(), b.result())
+        self.assertEqual(dict(a.result()[1]), {'type': 'Account', 'Id': '001000000000001', 'Name': 'b', 'Phone': '1'})
+        self.assertIs(c.result(), d.result())
+        self.assertEqual(dict(c.result()[1]), {'type': 'Account', 'Ext__c': 'x', 'fieldsToNull': ['Name']})
+        self.assertEqual(sorted(len(records) for op, records in client.calls), [1, 1])
+
+    def test_elementRecord(self):
+        client = FakeIterClient()
+        element = parse('<records xmlns:sf="urn:sobject.partner.soap.sforce.com"><sf:type>Task</sf:type>'
+                        '<sf:Id>00T000000000001AAA</sf:Id></records>')
+        with BufferedWriter(client, flushInterval=60) as writer:
+            writer.update(ElementRecord(element, {'Status': 'Completed'}))
+            writer.update(ElementRecord(element, {'Priority': 'High'}))
+            writer.create(element)
+            writer.flush()
+        self.assertEqual(sorted((op, len(records)) for op, records in client.calls), [('create', 1), ('update', 2)])
+
+
+class TestMerge(unittest.TestCase):
+
+    def test_mergeRecords(self):
+        merged = mergeRecords({'Id': '1', 'name': 'a', 'fieldsToNull': ['Phone']},
+                              {'Id': '1', 'Name': 'b', 'Phone': '2', 'fieldsToNull': 'Fax'})
+        self.assertEqual(dict(merged), {'Id': '1', 'Name': 'b', 'Phone': '2', 'fieldsToNull': ['Fax']})
+
+    def test_coalesceRecords(self):
+        merged, indexes = coalesceRecords([{'Id': '1', 'a': 1}, {'b': 2}, {'Id': '1', 'a': 3}, {'b': 4}])
+        self.assertEqual([dict(x) for x in merged], [{'Id': '1', 'a': 3}, {'b': 2}, {'b': 4}])
+        self.assertEqual(indexes, [0, 1, 0, 2])
+        self.assertEqual(list(coalescedResults(iter('xyz'), indexes)), ['x', 'y', 'x', 'z'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from beatbox.xmltramp import Element, Namespace, parse, quote
+from beatbox.xmltramp import CompactElement, Element, LazyElement, Namespace, parse, quote
 
 
 class XmlTrampTests(unittest.TestCase):
@@ -146,5 +146,78 @@ class XmlTrampTests(unittest.TestCase):
                          '<a xmlns="http://a"><b xmlns="http://b"></b></a>')
 
 
+class CompactTests(unittest.TestCase):
+    xml = ('<doc xmlns="http://example.org/bar" xmlns:dc="http://purl.org/dc/elements/1.1/" version="2.7">'
+           '<author>John <b>Polk</b>  and\n John Palfrey</author>'
+           '<dc:creator>John Polk</dc:creator><dc:creator>John Palfrey</dc:creator><empty/>tail</doc>')
+
+    def test_sameAsElement(self):
+        dc = Namespace("http://purl.org/dc/elements/1.1/")
+        d = parse(self.xml, compact=True)
+        e = parse(self.xml)
+        self.assertTrue(isinstance(d, CompactElement) and isinstance(d, Element))
+        self.assertEqual(d._doc.names, [('http://example.org/bar', 'doc'), ('http://example.org/bar', 'author'),
+                                        ('http://example.org/bar', 'b'), (dc.creator[0], 'creator'),
+                                        ('http://example.org/bar', 'empty')])
+        self.assertEqual(d.__repr__(1, 1), e.__repr__(1, 1))
+        self.assertEqual(str(d), str(e))
+        self.assertEqual(str(d.author), "John Polk and John Palfrey")
+        self.assertEqual(str(d['author']), str(e['author']))
+        self.assertEqual([str(x) for x in d[dc.creator:]], ["John Polk", "John Palfrey"])
+        self.assertEqual(d[dc.creator]._name, dc.creator)
+        self.assertEqual(d[dc.creator:][1]._name, dc.creator)
+        self.assertEqual(d('version'), '2.7')
+        self.assertEqual(len(d), len(e))
+        self.assertEqual(d[-1], 'tail')
+        self.assertEqual(d[4], 'tail')
+        self.assertEqual([x._name if isinstance(x, Element) else x for x in d],
+                         [x._name if isinstance(x, Element) else x for x in e])
+        self.assertEqual(d['author':], d[('http://example.org/bar', 'author'):])
+        self.assertEqual(d['missing':], [])
+        self.assertRaises(KeyError, lambda: d['missing'])
+        self.assertRaises(IndexError, lambda: d[5])
+        self.assertRaises(AttributeError, lambda: d.missing)
+        # lookups by name do not create the children list
+        d = parse(self.xml, compact=True)
+        self.assertEqual(str(d[dc.creator:][1]), "John Palfrey")
+        self.assertEqual(len(d), 5)
+        self.assertNotIn('_dir', vars(d))
+
+    def test_modify(self):
+        d = parse(self.xml.replace('tail', ''), compact=True)
+        d['author'] = 'Me'
+        d['new':] = 'x'
+        self.assertEqual(str(d.author), 'Me')
+        self.assertEqual(len(d), 5)
+        self.assertEqual(d['new']._name, ('http://example.org/bar', 'new'))
+
+
+class LazyTests(unittest.TestCase):
+    xml = ('<r xmlns="urn:p" xmlns:sf="urn:s" xmlns:xsi="http://x"><result>'
+           '<records xsi:type="sf:sObject"><sf:Id>1</sf:Id><sf:C xsi:type="Q"><records a=">"><sf:Id>2</sf:Id>'
+           '</records><records/></sf:C></records><records xsi:type="sf:sObject"><sf:Id>3</sf:Id></records>'
+           '<size>2</size></result></r>')
+
+    def test_lazy(self):
+        d = parse(self.xml, lazy='records')
+        records = d.result['records':]
+        self.assertEqual([type(x) for x in records], [LazyElement, LazyElement])
+        self.assertEqual(records[0](('http://x', 'type')), 'sf:sObject')
+        self.assertNotIn('_dir', vars(records[0]))
+        self.assertEqual(str(records[1][('urn:s', 'Id')]), '3')
+        self.assertNotIn('_dir', vars(records[0]))
+        self.assertEqual(d.__repr__(1), parse(self.xml).__repr__(1))
+        self.assertEqual(str(records[0][('urn:s', 'C')]['records':][0]), '2')
+
+    def test_compact(self):
+        d = parse(self.xml, compact=True, lazy='records')
+        self.assertTrue(isinstance(d.result['records'][('urn:s', 'Id')], CompactElement))
+        self.assertEqual(d.__repr__(1), parse(self.xml).__repr__(1))
+
+    def test_fallback(self):
+        xml = self.xml.replace('<size>', '<![CDATA[<records>]]><size>')
+        self.assertEqual(type(parse(xml, lazy='records').result['records']), Element)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,224 @@
+"""Write-behind buffer that sends single record DML calls in batches."""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+
+from beatbox._beatbox import _sObjectType
+from beatbox.pool import ClientPool
+from beatbox.snapshot import recordKey
+from beatbox.xmltramp import islst
+
+
+def toList(x):
+    return list(x) if islst(x) else [x]
+
+
+def fieldValue(sObject, name):
+    """Value of a field in the sObject dict, the name is case insensitive"""
+    name = name.lower()
+    for fn, value in sObject.items():
+        if fn.lower() == name:
+            return value
+    return None
+
+
+def mergeRecords(old, new):
+    """Merge two versions of a record dict, the last writer wins for every field."""
+    merged = OrderedDict(old)
+    nulls = OrderedDict((x.lower(), x) for x in toList(merged.pop('fieldsToNull', [])))
+    for fn, value in new.items():
+        if fn == 'fieldsToNull':
+            for x in toList(value):
+                nulls[x.lower()] = x
+                for oldFn in [oldFn for oldFn in merged if oldFn.lower() == x.lower()]:
+                    del merged[oldFn]
+        else:
+            for oldFn in [oldFn for oldFn in merged if oldFn.lower() == fn.lower() and oldFn != fn]:
+                del merged[oldFn]
+            merged[fn] = value
+            nulls.pop(fn.lower(), None)
+    if nulls:
+        merged['fieldsToNull'] = list(nulls.values())
+    return merged
+
+
+def coalesceRecords(sObjects, keyField='Id'):
+    """Merge records with the same key field by `mergeRecords`.
+
+    Returns a list of merged records and a list with the index of the merged record
+    for every original record. Records without the key and records that are not dicts
+    (Element, ElementRecord) are not merged.
+    """
+    merged = []
+    indexes = []
+    positions = {}
+    for o in sObjects:
+        key = fieldValue(o, keyField) if isinstance(o, dict) else None
+        if key is not None and keyField.lower() == 'id':
+            key = recordKey(key)
+        if key is None or key not in positions:
+            if key is not None:
+                positions[key] = len(merged)
+            indexes.append(len(merged))
+            merged.append(o)
+        else:
+            i = positions[key]
+            merged[i] = mergeRecords(merged[i], o)
+            indexes.append(i)
+    return merged, indexes
+
+
+def coalescedResults(results, indexes):
+    """Yield the result of the merged record for every original record, by indexes of `coalesceRecords`"""
+    received = []
+    for i in indexes:
+        while len(received) <= i:
+            received.append(next(results))
+        yield received[i]
+
+
+class BufferedWriter(object):
+    """Buffer of create/update/upsert/delete calls flushed in batches by background workers.
+
+    Records are grouped by the operation, sObject type and the external id field
+    and a group is sent when it has `batchSize` records, when its oldest record is
+    older than `flushInterval` seconds or by an explicit `flush()`. Every method
+    returns a Future of the SaveResult (UpsertResult, DeleteResult) of the record.
+
+    With `coalesce` the pending versions of a record with the same Id (the same external
+    id by upsert) are merged by `mergeRecords` before they are sent and all their futures
+    get the result of the merged record.
+
+    >>> with BufferedWriter(svc) as writer:
+    ...     for event in events:
+    ...         writer.update({'type': 'Contact', 'Id': event.id, 'Phone': event.phone},
+    ...                       callback=checkResult)
+    """
+    def __init__(self, client, batchSize=200, flushInterval=1.0, maxWorkers=4, coalesce=True):
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.coalesce = coalesce
+        self.pool = ClientPool(client.iterclient, maxWorkers)
+        # (operation, sObjectType, externalIdName) ->
+        #     [time of the first record, [records], [[futures of the record]], {record key: index}]
+        self._groups = OrderedDict()
+        self._inFlight = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='BufferedWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def create(self, sObject, callback=None):
+        return self._add(('create', _sObjectType(sObject), None), sObject, callback)
+
+    def update(self, sObject, callback=None):
+        return self._add(('update', _sObjectType(sObject), None), sObject, callback)
+
+    def upsert(self, externalIdName, sObject, callback=None):
+        return self._add(('upsert', _sObjectType(sObject), externalIdName), sObject, callback)
+
+    def delete(self, id, callback=None):
+        return self._add(('delete', None, None), id, callback)
+
+    def undelete(self, id, callback=None):
+        return self._add(('undelete', None, None), id, callback)
+
+    def flush(self):
+        """Send all buffered records and wait until all sent batches are finished."""
+        with self._cond:
+            for key in list(self._groups):
+                self._dispatch(key)
+            inFlight = list(self._inFlight)
+        wait(inFlight)
+
+    def close(self):
+        """Flush the buffer and stop the background threads."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _add(self, key, record, callback):
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The writer is closed.")
+            if key not in self._groups:
+                self._groups[key] = [time.time(), [], [], {}]
+                self._cond.notify_all()
+            (started, records, futures, positions) = self._groups[key]
+            recKey = self._recordKey(key, record)
+            if recKey in positions:
+                i = positions[recKey]
+                records[i] = mergeRecords(records[i], record)
+                futures[i].append(future)
+            else:
+                if recKey is not None:
+                    positions[recKey] = len(records)
+                records.append(record)
+                futures.append([future])
+            if len(records) >= self.batchSize:
+                self._dispatch(key)
+        return future
+
+    def _recordKey(self, key, record):
+        (operation, sObjectType, externalIdName) = key
+        # Element and ElementRecord sObjects are not merged
+        if not self.coalesce or operation not in ('update', 'upsert') or not isinstance(record, dict):
+            return None
+        value = fieldValue(record, externalIdName or 'Id')
+        if value is not None and operation == 'update':
+            value = recordKey(value)
+        return value
+
+    def _dispatch(self, key):
+        """Submit a group of records to the pool, the lock must be held."""
+        (started, records, futures, positions) = self._groups.pop(key)
+        batch = self.pool.submit(self._write, key, records, futures)
+        self._inFlight.add(batch)
+        batch.add_done_callback(self._discard)
+
+    def _write(self, client, key, records, futures):
+        (operation, sObjectType, externalIdName) = key
+        try:
+            if operation == 'upsert':
+                results = list(client.upsert(externalIdName, records, chunkLength=self.batchSize))
+            else:
+                results = list(getattr(client, operation)(records, chunkLength=self.batchSize))
+        except Exception as exc:
+            for recordFutures in futures:
+                for future in recordFutures:
+                    future.set_exception(exc)
+        else:
+            for recordFutures, result in zip(futures, results):
+                for future in recordFutures:
+                    future.set_result(result)
+
+    def _discard(self, batch):
+        with self._cond:
+            self._inFlight.discard(batch)
+
+    def _run(self):
+        with self._cond:
+            while not self._closed:
+                now = time.time()
+                timeout = None
+                for key, (started, records, futures, positions) in list(self._groups.items()):
+                    if now - started >= self.flushInterval:
+                        self._dispatch(key)
+                    else:
+                        remains = started + self.flushInterval - now
+                        timeout = remains if timeout is None else min(timeout, remains)
+                self._cond.wait(timeout)
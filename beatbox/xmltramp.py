@@ -1,5 +1,8 @@
 """xmltramp: Make XML documents easily accessible."""
 
+import base64
+import re
+from array import array
 from io import BytesIO
 from xml.sax.handler import EntityResolver, DTDHandler, ContentHandler, ErrorHandler
 from xml.sax import make_parser
@@ -261,11 +264,34 @@ class Namespace(object):
         return (self.__uri, n)
 
 
+class Base64Decoder(object):
+    """Decode base64 text written incrementally to the writer (a file or an object with write(bytes))"""
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = ''
+
+    def write(self, text):
+        text = self.pending + ''.join(text.split())
+        end = len(text) - len(text) % 4
+        self.pending = text[end:]
+        if end:
+            self.writer.write(base64.b64decode(text[:end].encode('ascii')))
+
+    def close(self):
+        if self.pending:
+            raise ValueError("Incomplete base64 data")
+        if hasattr(self.writer, 'close'):
+            self.writer.close()
+
+
 class Seeder(EntityResolver, DTDHandler, ContentHandler, ErrorHandler):
-    def __init__(self):
+    def __init__(self, streams=None):
         self.stack = []
         self.ch = ''
         self.prefixes = {}
+        # streams(parent element, name) can return a writer for base64 content of the element
+        self.streams = streams
+        self.stream = None
         ContentHandler.__init__(self)
 
     def startPrefixMapping(self, prefix, uri):
@@ -290,14 +316,25 @@ class Seeder(EntityResolver, DTDHandler, ContentHandler, ErrorHandler):
         for k in self.prefixes.keys():
             newprefixes[k] = self.prefixes[k][-1]
 
-        self.stack.append(Element(name, attrs, prefixes=newprefixes.copy()))
+        element = Element(name, attrs, prefixes=newprefixes.copy())
+        if self.streams is not None and self.stack:
+            writer = self.streams(self.stack[-1], element._name)
+            if writer is not None:
+                self.stream = Base64Decoder(writer)
+        self.stack.append(element)
 
     def characters(self, ch):
         # This is called only by sax (never directly) and the string ch is
         # everytimes converted to text_type (unicode) by sax.
-        self.ch += ch
+        if self.stream is not None:
+            self.stream.write(ch)
+        else:
+            self.ch += ch
 
     def endElementNS(self, name, qname):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
         ch = self.ch
         self.ch = ''
         if ch and not ch.isspace():
@@ -310,8 +347,322 @@ class Seeder(EntityResolver, DTDHandler, ContentHandler, ErrorHandler):
             self.result = element
 
 
-def seed(fileobj):
-    seeder = Seeder()
+ELEMENT = 1
+TEXT = 2
+
+
+class CompactDocument(object):
+    """Parsed XML stored in flat parallel arrays indexed by node, instead of an object per node.
+
+    Node 0 is the root element. A text node is text[textStart:textEnd] of one shared
+    buffer. Names, attribute dicts and namespace prefix dicts are interned, the nodes
+    refer to them by an index. The nodes are accessed by CompactElement views.
+    """
+    def __init__(self):
+        self.kind = array('b')         # ELEMENT or TEXT
+        self.name = array('i')         # index to names, -1 for text
+        self.parent = array('i')       # -1 for the root
+        self.firstChild = array('i')   # -1 if none
+        self.nextSibling = array('i')  # -1 if none
+        self.textStart = array('l')
+        self.textEnd = array('l')
+        self.attrs = array('i')        # index to attrSets
+        self.prefixes = array('i')     # index to prefixSets
+        self.names = []
+        self.nameIds = {}
+        self.attrSets = [{}]
+        self.prefixSets = [{}]
+        self.text = u''
+
+    def node(self, index):
+        """The node: CompactElement view or text"""
+        if self.kind[index] == TEXT:
+            return self.text[self.textStart[index]:self.textEnd[index]]
+        return CompactElement(self, index)
+
+    def children(self, index):
+        """Indexes of child nodes of the node"""
+        child = self.firstChild[index]
+        while child >= 0:
+            yield child
+            child = self.nextSibling[child]
+
+    def __len__(self):
+        return len(self.kind)
+
+
+@python_2_unicode_compatible
+class CompactElement(Element):
+    """View of an element of CompactDocument that behaves like Element.
+
+    Children are found by the arrays without creating objects for other nodes.
+    The attributes _name, _attrs, _dir, _prefixes and _dNS are created from the
+    arrays by the first use, a modification of the element materializes _dir
+    and then the methods of Element are used.
+    """
+    _lazy = frozenset(('_name', '_attrs', '_dir', '_prefixes', '_dNS'))
+
+    def __init__(self, doc, index):
+        self._doc = doc
+        self._index = index
+
+    def __getattr__(self, n):
+        if n not in CompactElement._lazy:
+            return Element.__getattr__(self, n)
+        doc = self._doc
+        if n == '_name':
+            value = doc.names[doc.name[self._index]]
+        elif n == '_attrs':
+            value = dict(doc.attrSets[doc.attrs[self._index]])
+        elif n == '_dir':
+            value = [doc.node(i) for i in doc.children(self._index)]
+        else:
+            prefixes = doc.prefixSets[doc.prefixes[self._index]]
+            if n == '_prefixes':
+                value = dict(zip(prefixes.values(), prefixes.keys()))
+            else:
+                value = prefixes.get(None, None)
+        self.__dict__[n] = value
+        return value
+
+    def _materialized(self):
+        return '_dir' in self.__dict__
+
+    def _named(self, n):
+        """Indexes of child elements named n"""
+        if self._dNS and not islst(n):
+            n = (self._dNS, n)
+        doc = self._doc
+        nameId = doc.nameIds.get(n)
+        if nameId is not None:
+            names = doc.name
+            for child in doc.children(self._index):
+                if names[child] == nameId:
+                    yield child
+
+    def _text(self, index):
+        doc = self._doc
+        out = []
+        for child in doc.children(index):
+            if doc.kind[child] == TEXT:
+                out.append(doc.text[doc.textStart[child]:doc.textEnd[child]])
+            else:
+                out.append(' '.join(self._text(child).split()))
+        return u''.join(out)
+
+    def __str__(self):
+        if self._materialized():
+            return ' '.join(u''.join(text_type(x) for x in self._dir).split())
+        return ' '.join(self._text(self._index).split())
+
+    def __iter__(self):
+        if self._materialized():
+            return iter(self._dir)
+        return (self._doc.node(i) for i in self._doc.children(self._index))
+
+    def __len__(self):
+        if self._materialized():
+            return len(self._dir)
+        return sum(1 for i in self._doc.children(self._index))
+
+    def __getitem__(self, n):
+        if self._materialized() or (isinstance(n, int) and n < 0):
+            return Element.__getitem__(self, n)
+        if isinstance(n, int):
+            for i, child in enumerate(self._doc.children(self._index)):
+                if i == n:
+                    return self._doc.node(child)
+            raise IndexError(n)
+        if isinstance(n, slice):
+            if isinstance(n.start, int) or n == slice(None):
+                return Element.__getitem__(self, n)
+            return [CompactElement(self._doc, i) for i in self._named(n.start)]
+        for i in self._named(n):
+            return CompactElement(self._doc, i)
+        raise KeyError((self._dNS, n) if self._dNS and not islst(n) else n)
+
+    def __setitem__(self, n, v):
+        self._dir
+        Element.__setitem__(self, n, v)
+
+    def __delitem__(self, n):
+        self._dir
+        Element.__delitem__(self, n)
+
+
+class CompactSeeder(Seeder):
+    """Sax handler that builds a CompactDocument"""
+    def __init__(self):
+        Seeder.__init__(self)
+        self.doc = CompactDocument()
+        self.chunks = []
+        self.offset = 0
+        self.last = []  # the last child of the open elements
+        self.attrIds = {frozenset(): 0}
+        self.prefixIds = {frozenset(): 0}
+
+    def _append(self, kind, name, attrs, prefixes, start, end):
+        doc = self.doc
+        index = len(doc.kind)
+        doc.kind.append(kind)
+        doc.name.append(name)
+        doc.parent.append(self.stack[-1] if self.stack else -1)
+        doc.firstChild.append(-1)
+        doc.nextSibling.append(-1)
+        doc.textStart.append(start)
+        doc.textEnd.append(end)
+        doc.attrs.append(attrs)
+        doc.prefixes.append(prefixes)
+        if self.stack:
+            if self.last[-1] < 0:
+                doc.firstChild[self.stack[-1]] = index
+            else:
+                doc.nextSibling[self.last[-1]] = index
+            self.last[-1] = index
+        return index
+
+    def _intern(self, ids, sets, items):
+        key = frozenset(items)
+        if key not in ids:
+            ids[key] = len(sets)
+            sets.append(dict(items))
+        return ids[key]
+
+    def _flushText(self):
+        ch = self.ch
+        self.ch = ''
+        if ch and not ch.isspace():
+            self.chunks.append(ch)
+            self._append(TEXT, -1, 0, 0, self.offset, self.offset + len(ch))
+            self.offset += len(ch)
+
+    def startElementNS(self, name, qname, attrs):
+        self._flushText()
+        doc = self.doc
+        if islst(name) and name[0] is None:
+            name = name[1]
+        if name not in doc.nameIds:
+            doc.nameIds[name] = len(doc.names)
+            doc.names.append(name)
+        attrItems = [(k[1] if islst(k) and k[0] is None else k, v) for k, v in attrs.items()]
+        prefixItems = [(k, v[-1]) for k, v in self.prefixes.items()]
+        index = self._append(ELEMENT, doc.nameIds[name], self._intern(self.attrIds, doc.attrSets, attrItems),
+                             self._intern(self.prefixIds, doc.prefixSets, prefixItems), 0, 0)
+        self.stack.append(index)
+        self.last.append(-1)
+
+    def endElementNS(self, name, qname):
+        self._flushText()
+        self.stack.pop()
+        self.last.pop()
+
+    def endDocument(self):
+        self.doc.text = u''.join(self.chunks)
+        self.chunks = []
+        self.result = CompactElement(self.doc, 0)
+
+
+class LazyElement(Element):
+    """Element whose children are parsed from its bytes in the document by the first use.
+
+    It is created from the empty placeholder element of the skeleton document, that
+    has already the name, attributes and namespaces.
+    """
+    def __init__(self, placeholder, raw, start, end, compact=False, streams=None):
+        self.__dict__.update(placeholder.__dict__)
+        del self.__dict__['_dir']
+        self._raw = raw
+        self._start = start
+        self._end = end
+        self._compact = compact
+        self._streams = streams
+
+    def __getattr__(self, n):
+        if n != '_dir':
+            return Element.__getattr__(self, n)
+        declarations = u''.join(u' xmlns="{}"'.format(quote(uri, False)) if prefix is None else
+                                u' xmlns:{}="{}"'.format(prefix, quote(uri, False))
+                                for uri, prefix in self._prefixes.items())
+        wrapped = u'<w{}>'.format(declarations).encode('utf-8') + self._raw[self._start:self._end] + b'</w>'
+        self._dir = parse(wrapped, self._compact, streams=self._streams)[0]._dir
+        self._raw = None
+        return self._dir
+
+    def _mayContain(self, data):
+        """False if the bytes of the element do not contain data, checked without parsing"""
+        if self._raw is None:
+            return True
+        return self._raw.find(data, self._start, self._end) >= 0
+
+
+def _lazySpans(raw, name):
+    """Spans (start, end of the start tag, end) of the outermost elements `name` in raw bytes, None if unsure"""
+    if raw.find(b'<![CDATA[') >= 0 or raw.find(b'<!--') >= 0:
+        return None
+    opening = re.compile(b'<' + re.escape(name) + br"""(?=[\s/>])(?:[^>"']|"[^"]*"|'[^']*')*>""")
+    close = b'</' + name + b'>'
+    spans = []
+    m = opening.search(raw)
+    while m:
+        scan = m.end()
+        depth = 0 if m.group().endswith(b'/>') else 1
+        while depth:
+            end = raw.find(close, scan)
+            if end < 0:
+                return None
+            inner = opening.search(raw, scan, end)
+            if inner:
+                scan = inner.end()
+                depth += not inner.group().endswith(b'/>')
+            else:
+                scan = end + len(close)
+                depth -= 1
+        spans.append((m.start(), m.end(), scan))
+        m = opening.search(raw, scan)
+    return spans
+
+
+def _placeholders(element, name):
+    """(parent, index) of the elements with the local name in document order"""
+    for i, x in enumerate(element._dir):
+        if isinstance(x, Element):
+            if (x._name[1] if islst(x._name) else x._name) == name:
+                yield element, i
+            else:
+                for found in _placeholders(x, name):
+                    yield found
+
+
+def parseLazy(text, name, compact=False, streams=None):
+    """Parse XML to tree of Element, the elements `name` are parsed only when their content is used.
+
+    The document is scanned for the outermost elements with the qualified name, they
+    are replaced by empty placeholders in the parsed skeleton and then by LazyElement.
+    name: e.g. 'records'
+    """
+    raw = text.encode('utf-8') if isinstance(text, text_type) else text
+    qname = name.encode('utf-8') if isinstance(name, text_type) else name
+    spans = _lazySpans(raw, qname)
+    if not spans:
+        return parse(raw, compact, streams=streams)
+    parts = []
+    last = 0
+    for (start, tagEnd, end) in spans:
+        tag = raw[start:tagEnd]
+        parts.append(raw[last:start])
+        parts.append(tag if tag.endswith(b'/>') else tag[:-1] + b'/>')
+        last = end
+    parts.append(raw[last:])
+    root = parse(b''.join(parts), streams=streams)
+    localName = qname.decode('utf-8').split(':')[-1]
+    for (parent, i), (start, tagEnd, end) in zip(list(_placeholders(root, localName)), spans):
+        parent._dir[i] = LazyElement(parent._dir[i], raw, start, end, compact, streams)
+    return root
+
+
+def seed(fileobj, compact=False, streams=None, seeder=None):
+    if seeder is None:
+        seeder = CompactSeeder() if compact and streams is None else Seeder(streams)
     parser = make_parser()
     parser.setFeature(feature_namespaces, 1)
     parser.setContentHandler(seeder)
@@ -319,12 +670,31 @@ def seed(fileobj):
     return seeder.result
 
 
-def parse(text):
+def parse(text, compact=False, lazy=None, streams=None):
     """Parse XML to tree of Element.
 
-    text: XML in unicode or byte string
+    text: XML in unicode or byte string or a readable buffer like mmap
+    compact: store the tree in a CompactDocument and return the view of its root,
+        the memory of a large response is a few arrays, not an object per node
+    lazy: name of elements that are parsed by the first use (see parseLazy)
+    streams: function(parent element, name) called at the start of every element, if
+        it returns a writer, the content of the element is decoded from base64 and
+        written to it incrementally instead of to the tree, the writer is closed at the
+        end of the element. Compact documents are not used with streams.
     """
-    return seed(StringIO(text) if isinstance(text, text_type) else BytesIO(text))
+    if lazy is not None:
+        return parseLazy(text, lazy, compact, streams)
+    return seed(source(text), compact, streams)
+
+
+def source(text):
+    """File object to read XML in unicode or byte string or in a buffer like mmap"""
+    if isinstance(text, text_type):
+        return StringIO(text)
+    if isinstance(text, bytes):
+        return BytesIO(text)
+    text.seek(0)
+    return text
 
 
 def load(url):
@@ -1,66 +1,26 @@
-# runs a sforce SOQL query and saves the results as a csv file.
+# runs a sforce SOQL query and saves the results as a csv or json lines file.
+# An interrupted export is resumed by running the same command again.
 from __future__ import print_function
 import os
 import sys
 import beatbox
+from beatbox.export import Exporter
 
-sf = beatbox._tPartnerNS
 svc = beatbox.Client()
 if 'SF_SANDBOX' in os.environ:
     svc.serverUrl = svc.serverUrl.replace('login.', 'test.')
 
 
-def buildSoql(sobjectName):
-    dr = svc.describeSObjects(sobjectName)
-    soql = ""
-    for f in dr[sf.fields:]:
-        if len(soql) > 0:
-            soql += ','
-        soql += str(f[sf.name])
-    return "select " + soql + " from " + sobjectName
-
-
-def printColumnHeaders(queryResult):
-    needsComma = 0
-    # note that we offset 2 into the records child collection to skip the type and base sObject id elements
-    for col in queryResult[sf.records][2:]:
-        if needsComma:
-            print(',', end=' ')
-        else:
-            needsComma = 1
-        print(col._name[1], end=' ')
-    print()
-
-
-def export(username, password, objectOrSoql):
+def export(username, password, objectOrSoql, path):
     svc.login(username, password)
-    if objectOrSoql.find(' ') < 0:
-        soql = buildSoql(objectOrSoql)
-    else:
-        soql = objectOrSoql
-
-    qr = svc.query(soql)
-    printHeaders = 1
-    while True:
-        if printHeaders:
-            printColumnHeaders(qr)
-            printHeaders = 0
-        for row in qr[sf.records:]:
-            needsComma = False
-            for col in row[2:]:
-                if needsComma:
-                    print(',', end=' ')
-                else:
-                    needsComma = True
-                print(str(col), end=' ')
-            print()
-        if str(qr[sf.done]) == 'true':
-            break
-        qr = svc.queryMore(str(qr[sf.queryLocator]))
+    name = path[:-3] if path.endswith('.gz') else path
+    format = 'jsonl' if name.endswith('.jsonl') else 'csv'
+    rows = Exporter(svc, objectOrSoql, path, format=format, compress=path.endswith('.gz')).run()
+    print("exported {} rows to {}".format(rows, path))
 
 if __name__ == "__main__":
 
-    if len(sys.argv) != 4:
-        print("usage is export.py <username> <password> [<sobjectName> || <soqlQuery>]")
+    if len(sys.argv) != 5:
+        print("usage is export.py <username> <password> [<sobjectName> || <soqlQuery>] <file.csv|file.jsonl>[.gz]")
     else:
-        export(sys.argv[1], sys.argv[2], sys.argv[3])
+        export(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
@@ -19,4 +19,8 @@ setup(
     ],
     url="http://www.pocketsoap.com/beatbox/",
     packages=find_packages(),
+    extras_require={
+        # concurrent.futures is used by the batching and parallel helpers
+        ':python_version == "2.7"': ['futures'],
+    },
 )